@@ -1,12 +1,15 @@
 """
 Adaptive Backoff - מנגנון התאמה אדפטיבית לכשלונות
 מגדיל את זמן ההמתנה כאשר מתרחשות שגיאות ומאפס כאשר הכל עובד
+הרמה נקבעת גם לפי חלון זמן נע (שיעור שגיאות, זמני תגובה ואינדיקטורי חסימה)
 """
 
+import math
 import time
 import random
 import logging
-from typing import Optional, Dict, Any
+from collections import deque
+from typing import Optional, Dict, Any, Callable, List
 from enum import Enum
 
 logger = logging.getLogger(__name__)
@@ -19,6 +22,125 @@ class BackoffLevel(Enum):
     SEVERE = 3      # חמור - כשלונות רבים
     CRITICAL = 4    # קריטי - חסימה אפשרית
 
+# ספי שיעור שגיאות בחלון -> רמה (הרמה הגבוהה ביותר שהסף שלה עבר)
+# נספרים רק כשלונות מול השרת (HTTP 4xx/5xx, חסימה, חריגות) - החטאה של שכבה זולה
+# לפני הסלמה ב-ZenRowsFetcher אינה נרשמת כלל, כך ששיעור "רקע" רגיל הוא אחוזים בודדים
+ERROR_RATE_LEVELS = [
+    (0.50, BackoffLevel.CRITICAL),
+    (0.30, BackoffLevel.SEVERE),
+    (0.15, BackoffLevel.MODERATE),
+    (0.05, BackoffLevel.WARNING),
+]
+# מתחת למספר בקשות זה בחלון אין מספיק נתונים לקבוע רמה
+# (ב-5 בקשות כשלון בודד הוא כבר 20%; רצף כשלונות קצר מטופל ע"י consecutive_failures)
+MIN_WINDOW_REQUESTS = 20
+# p95 איטי מזה (שניות) מעיד על עומס גם בלי שגיאות
+SLOW_P95_SECONDS = 30.0
+
+class SlidingWindow:
+    """
+    חלון זמן נע של בקשות, מחולק לדליים (buckets) של כמה שניות
+    שומר לכל דלי: בקשות, כשלונות, זמני תגובה ואינדיקטורי חסימה לפי חומרה
+    """
+    
+    def __init__(self, window_seconds: float = 300.0, bucket_seconds: float = 10.0,
+                 clock: Callable[[], float] = time.time):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.clock = clock
+        self.buckets = deque()
+    
+    def _bucket(self) -> Dict[str, Any]:
+        now = self.clock()
+        start = math.floor(now / self.bucket_seconds) * self.bucket_seconds
+        self._expire(now)
+        if not self.buckets or self.buckets[-1]['start'] != start:
+            self.buckets.append({'start': start, 'requests': 0, 'failures': 0,
+                                 'latencies': [], 'indicators': {}})
+        return self.buckets[-1]
+    
+    def _expire(self, now: float) -> None:
+        while self.buckets and self.buckets[0]['start'] + self.bucket_seconds <= now - self.window_seconds:
+            self.buckets.popleft()
+    
+    def add(self, success: bool, latency: Optional[float] = None,
+            indicators: Optional[List[Any]] = None) -> None:
+        """
+        מוסיף תוצאת בקשה לדלי הנוכחי
+        
+        Args:
+            success: האם הבקשה הצליחה (False רק לכשלון מול השרת, לא לתשובה שפשוט לא עברה ולידציה)
+            latency: זמן תגובה בשניות
+            indicators: אינדיקטורי חסימה (BlockingIndicator) מ-BlockingDetector
+        """
+        bucket = self._bucket()
+        bucket['requests'] += 1
+        if not success:
+            bucket['failures'] += 1
+        if latency is not None:
+            bucket['latencies'].append(latency)
+        for indicator in indicators or []:
+            severity = getattr(indicator, 'severity', indicator)
+            bucket['indicators'][severity] = bucket['indicators'].get(severity, 0) + 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        מחזיר סטטיסטיקות החלון: שיעור שגיאות, אחוזוני זמן תגובה ואינדיקטורים
+        
+        Returns:
+            מילון מסכם וסדרת דליים לדשבורד
+        """
+        self._expire(self.clock())
+        requests = sum(b['requests'] for b in self.buckets)
+        failures = sum(b['failures'] for b in self.buckets)
+        latencies = sorted(l for b in self.buckets for l in b['latencies'])
+        indicators = {}
+        for bucket in self.buckets:
+            for severity, count in bucket['indicators'].items():
+                indicators[severity] = indicators.get(severity, 0) + count
+        return {
+            'window_seconds': self.window_seconds,
+            'requests': requests,
+            'failures': failures,
+            'error_rate': failures / requests if requests else 0.0,
+            'latency_p50': _percentile(latencies, 50),
+            'latency_p95': _percentile(latencies, 95),
+            'blocking_indicators': indicators,
+            'buckets': [
+                {'start': b['start'], 'requests': b['requests'], 'failures': b['failures'],
+                 'latency_p95': _percentile(sorted(b['latencies']), 95), 'indicators': dict(b['indicators'])}
+                for b in self.buckets
+            ]
+        }
+    
+    def target_level(self) -> Optional[BackoffLevel]:
+        """
+        הרמה שהחלון מצדיק, או None אם אין מספיק נתונים
+        """
+        stats = self.get_stats()
+        if stats['requests'] < MIN_WINDOW_REQUESTS:
+            return None
+        level = BackoffLevel.NORMAL
+        for threshold, threshold_level in ERROR_RATE_LEVELS:
+            if stats['error_rate'] >= threshold:
+                level = threshold_level
+                break
+        indicators = stats['blocking_indicators']
+        if indicators.get('critical'):
+            level = max(level, BackoffLevel.CRITICAL, key=lambda l: l.value)
+        elif indicators.get('high'):
+            level = max(level, BackoffLevel.SEVERE, key=lambda l: l.value)
+        if stats['latency_p95'] is not None and stats['latency_p95'] > SLOW_P95_SECONDS:
+            level = max(level, BackoffLevel.WARNING, key=lambda l: l.value)
+        return level
+
+def _percentile(ordered: List[float], pct: float) -> Optional[float]:
+    """אחוזון (nearest-rank) מרשימה ממוינת"""
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return round(ordered[rank - 1], 3)
+
 class AdaptiveBackoff:
     """
     מחלקה לניהול Backoff אדפטיבי
@@ -29,7 +151,10 @@ class AdaptiveBackoff:
                  base_delay: float = 2.0,
                  max_delay: float = 300.0,
                  backoff_multiplier: float = 2.0,
-                 success_threshold: int = 3):
+                 success_threshold: int = 3,
+                 window_seconds: float = 300.0,
+                 bucket_seconds: float = 10.0,
+                 clock: Callable[[], float] = time.time):
         """
         אתחול Adaptive Backoff
         
@@ -38,6 +163,9 @@ class AdaptiveBackoff:
             max_delay: עיכוב מקסימלי בשניות
             backoff_multiplier: מכפיל הגדלת העיכוב
             success_threshold: מספר הצלחות לאיפוס הרמה
+            window_seconds: אורך חלון הזמן הנע בשניות
+            bucket_seconds: גודל דלי בחלון בשניות
+            clock: פונקציית זמן (להזרקה בבדיקות)
         """
         self.base_delay = base_delay
         self.max_delay = max_delay
@@ -52,6 +180,9 @@ class AdaptiveBackoff:
         self.total_failures = 0
         self.total_successes = 0
         
+        # חלון זמן נע לשיעור שגיאות, זמני תגובה ואינדיקטורי חסימה
+        self.window = SlidingWindow(window_seconds, bucket_seconds, clock)
+        
         # הגדרות רמות
         self.level_delays = {
             BackoffLevel.NORMAL: base_delay,
@@ -63,42 +194,57 @@ class AdaptiveBackoff:
         
         logger.info(f"Adaptive Backoff initialized: base={base_delay}s, max={max_delay}s")
     
-    def register_success(self) -> None:
+    def register_success(self, latency: Optional[float] = None) -> None:
         """
         רושם הצלחה בשליחת הודעה
+        
+        Args:
+            latency: זמן תגובה בשניות
         """
         self.consecutive_successes += 1
         self.consecutive_failures = 0
         self.total_successes += 1
+        self.window.add(True, latency)
         
-        # אם יש מספיק הצלחות רצופות, מורידים רמה
+        # אם יש מספיק הצלחות רצופות, מורידים רמה - אבל לא מתחת למה שהחלון מצדיק
+        target = self.window.target_level()
         if (self.consecutive_successes >= self.success_threshold and 
-            self.current_level != BackoffLevel.NORMAL):
+            self.current_level != BackoffLevel.NORMAL and
+            (target is None or target.value < self.current_level.value)):
             self._decrease_level()
             self.consecutive_successes = 0
         
         logger.debug(f"Success registered: level={self.current_level.name}, "
                     f"consecutive_successes={self.consecutive_successes}")
     
-    def register_failure(self, error_info: Optional[Dict[str, Any]] = None) -> None:
+    def register_failure(self, error_info: Optional[Dict[str, Any]] = None,
+                         latency: Optional[float] = None) -> None:
         """
         רושם כשלון בשליחת הודעה
         
         Args:
-            error_info: מידע על השגיאה (קוד, הודעה וכו')
+            error_info: מידע על השגיאה (קוד, הודעה, indicators מ-BlockingDetector וכו')
+            latency: זמן תגובה בשניות
         """
         self.consecutive_failures += 1
         self.consecutive_successes = 0
         self.total_failures += 1
         self.last_failure_time = time.time()
+        self.window.add(False, latency, (error_info or {}).get('indicators'))
         
-        # הגדלת רמת Backoff לפי מספר הכשלונות
+        # הגדלת רמת Backoff לפי מספר הכשלונות, או לפי החלון אם הוא מצדיק יותר
         if self.consecutive_failures == 1:
-            self._set_level(BackoffLevel.WARNING)
+            level = BackoffLevel.WARNING
         elif self.consecutive_failures == 2:
-            self._set_level(BackoffLevel.MODERATE)
-        elif self.consecutive_failures >= 3:
-            self._set_level(BackoffLevel.SEVERE)
+            level = BackoffLevel.MODERATE
+        else:
+            level = BackoffLevel.SEVERE
+        target = self.window.target_level()
+        if target is not None and target.value > level.value:
+            level = target
+        # כשלון לעולם לא מוריד רמה (הצלחה בודדת כבר לא מאפסת הכל)
+        if level.value > self.current_level.value:
+            self._set_level(level)
         
         # אם יש אינדיקטור לחסימה, עוברים לרמה קריטית
         if error_info and self._is_blocking_error(error_info):
@@ -217,7 +363,8 @@ class AdaptiveBackoff:
             'total_successes': self.total_successes,
             'success_rate': (self.total_successes / max(1, self.total_successes + self.total_failures)) * 100,
             'should_abort': self.should_abort(),
-            'last_failure_time': self.last_failure_time
+            'last_failure_time': self.last_failure_time,
+            'window': self.window.get_stats()
         }
     
     def reset(self) -> None:
@@ -230,5 +377,47 @@ class AdaptiveBackoff:
         self.last_failure_time = None
         self.total_failures = 0
         self.total_successes = 0
+        self.window.buckets.clear()
         logger.info("Adaptive Backoff reset")
 
+
+
+def _run_simulation() -> None:
+    """בדיקות דטרמיניסטיות של רמות החלון מול תמהיל שכבות מציאותי"""
+    now = [0.0]
+    rng = random.Random(7)
+
+    def run(upstream_error_rate: float, pages: int = 600) -> AdaptiveBackoff:
+        now[0] = 0.0
+        backoff = AdaptiveBackoff(clock=lambda: now[0])
+        for _ in range(pages):
+            now[0] += 1.0
+            # ~60% of pages miss on the static tier and escalate: ZenRowsFetcher records
+            # nothing for the miss, only the outcome of the tier that answered
+            if rng.random() < upstream_error_rate:
+                backoff.register_failure({'status_code': 502, 'message': 'HTTP 502'}, 5.0)
+            else:
+                backoff.register_success(2.0)
+        return backoff
+
+    # Background upstream errors of a healthy day stay at NORMAL/WARNING
+    assert run(0.02).current_level.value <= BackoffLevel.WARNING.value
+    # A quarter of requests failing is real trouble
+    assert run(0.25).current_level.value >= BackoffLevel.MODERATE.value
+    # Most requests failing is critical
+    assert run(0.6).current_level == BackoffLevel.CRITICAL
+
+    # One failure among the first few requests does not jump the window to MODERATE
+    now[0] = 0.0
+    backoff = AdaptiveBackoff(clock=lambda: now[0])
+    for ok in (True, True, False, True, True, True, True, True):
+        backoff.register_success(1.0) if ok else backoff.register_failure({'message': 'timeout'}, 1.0)
+    assert backoff.window.target_level() is None
+    assert backoff.current_level.value <= BackoffLevel.WARNING.value, backoff.current_level
+
+    print("adaptive_backoff simulation: all checks passed")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    _run_simulation()
@@ -1,15 +1,102 @@
 """
 Blocking Detector - זיהוי אינדיקטורים לחסימה
 מנתח תגובות שרת ומזהה סימנים לחסימה או הגבלות
+כל הדפוסים מקומפלים לביטוי אחד עם קבוצות בשם, והסריקה מוגבלת לאזורים רלוונטיים
+(כותרת הדף, תחילת ה-body ובלוקי שגיאה ב-JSON)
 """
 
 import re
+import sys
+import time
 import logging
 from typing import Dict, Any, Optional, List, Tuple
 from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
 
+# דפוסי טקסט בתגובות (case-insensitive): (שם קבוצה, דפוס, חומרה, סיבה)
+# דפוסים עם "בין לבין" מוגבלים ל-80 תווים כדי שסריקה אחת לא תבלע התאמות אחרות
+BLOCKING_PATTERNS = [
+    # Rate limiting
+    ('rate_limit', r'rate\s*limit', 'high', 'Rate limiting detected'),
+    ('too_many_requests', r'too\s*many\s*requests', 'high', 'Too many requests'),
+    ('quota_exceeded', r'quota\s*exceeded', 'high', 'Quota exceeded'),
+    ('request_limit', r'request\s*limit', 'high', 'Request limit reached'),
+    
+    # Blocking/Banning
+    ('blocked', r'blocked|banned|suspended', 'critical', 'Account blocked/banned'),
+    ('access_denied', r'access\s*denied', 'high', 'Access denied'),
+    ('permission_denied', r'permission\s*denied', 'high', 'Permission denied'),
+    ('unauthorized', r'unauthorized', 'medium', 'Unauthorized request'),
+    
+    # Service issues
+    ('service_unavailable', r'service\s*unavailable', 'medium', 'Service unavailable'),
+    ('temporarily_unavailable', r'temporarily\s*unavailable', 'medium', 'Temporary unavailability'),
+    ('server_error', r'server\s*error', 'low', 'Server error'),
+    ('maintenance', r'maintenance', 'low', 'Server maintenance'),
+    
+    # WhatsApp specific
+    ('whatsapp_error', r'whatsapp.{0,80}?error', 'medium', 'WhatsApp specific error'),
+    ('message_failed', r'message.{0,80}?failed', 'low', 'Message delivery failed'),
+    ('invalid_phone', r'invalid.{0,80}?phone', 'low', 'Invalid phone number'),
+    
+    # Network issues
+    ('timeout', r'timeout|timed\s*out', 'low', 'Network timeout'),
+    ('connection_refused', r'connection.{0,80}?refused', 'medium', 'Connection refused'),
+    ('network_error', r'network.{0,80}?error', 'low', 'Network error')
+]
+
+# תגובה קצרה מזה נסרקת במלואה (דפי שגיאה, JSON קצר)
+FULL_SCAN_CHARS = 8192
+# כמה תווים מתחילת ה-body / התגובה נסרקים בדף ארוך
+HEAD_SCAN_CHARS = 4096
+# הכותרת נמצאת ב-head; לא מחפשים אותה מעבר לזה
+TITLE_SEARCH_CHARS = 65536
+
+TITLE_RE = re.compile(r'<title[^>]*>(.{0,500}?)</title>', re.IGNORECASE | re.DOTALL)
+BODY_RE = re.compile(r'<body[^>]*>', re.IGNORECASE)
+# ערכי מפתחות שגיאה בתגובות JSON: מחרוזת או אובייקט קטן
+JSON_ERROR_RE = re.compile(
+    r'"(?:error|errors|message|detail|reason|status)"\s*:\s*("(?:[^"\\]|\\.){0,500}"|\{[^{}]{0,1000}\}|\[[^\[\]]{0,1000}\])',
+    re.IGNORECASE
+)
+
+def compile_blocking_patterns(patterns=BLOCKING_PATTERNS) -> re.Pattern:
+    """מקמפל את כל הדפוסים לביטוי אחד עם קבוצה בשם לכל דפוס"""
+    return re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern, _, _ in patterns), re.IGNORECASE)
+
+def scan_regions(text: str) -> List[str]:
+    """
+    מחזיר את האזורים בתגובה שבהם שווה לחפש סימני חסימה
+    
+    Args:
+        text: גוף התגובה
+        
+    Returns:
+        רשימת קטעי טקסט לסריקה
+    """
+    if len(text) <= FULL_SCAN_CHARS:
+        return [text]
+    
+    regions = []
+    title = TITLE_RE.search(text, 0, TITLE_SEARCH_CHARS)
+    if title:
+        regions.append(title.group(1))
+    
+    stripped = text.lstrip()
+    if stripped[:1] in ('{', '['):
+        # תגובת JSON ארוכה - רק ערכי מפתחות השגיאה
+        regions.append(stripped[:HEAD_SCAN_CHARS])
+        regions.extend(match.group(1) for match in JSON_ERROR_RE.finditer(stripped))
+        return regions
+    
+    # דף HTML ארוך - תחילת המסמך ותחילת ה-body; הסקריפטים של דף תקין מלאים במילים כמו "blocked"
+    regions.append(text[:HEAD_SCAN_CHARS])
+    body = BODY_RE.search(text)
+    if body and body.end() > HEAD_SCAN_CHARS:
+        regions.append(text[body.end():body.end() + HEAD_SCAN_CHARS])
+    return regions
+
 @dataclass
 class BlockingIndicator:
     """מחלקה לתיאור אינדיקטור חסימה"""
@@ -44,36 +131,11 @@ class BlockingDetector:
             509: ('critical', 'Bandwidth limit exceeded')
         }
         
-        # דפוסי טקסט בתגובות (case-insensitive)
-        self.blocking_patterns = [
-            # Rate limiting
-            (r'rate\s*limit', 'high', 'Rate limiting detected'),
-            (r'too\s*many\s*requests', 'high', 'Too many requests'),
-            (r'quota\s*exceeded', 'high', 'Quota exceeded'),
-            (r'request\s*limit', 'high', 'Request limit reached'),
-            
-            # Blocking/Banning
-            (r'blocked|banned|suspended', 'critical', 'Account blocked/banned'),
-            (r'access\s*denied', 'high', 'Access denied'),
-            (r'permission\s*denied', 'high', 'Permission denied'),
-            (r'unauthorized', 'medium', 'Unauthorized request'),
-            
-            # Service issues
-            (r'service\s*unavailable', 'medium', 'Service unavailable'),
-            (r'temporarily\s*unavailable', 'medium', 'Temporary unavailability'),
-            (r'server\s*error', 'low', 'Server error'),
-            (r'maintenance', 'low', 'Server maintenance'),
-            
-            # WhatsApp specific
-            (r'whatsapp.*error', 'medium', 'WhatsApp specific error'),
-            (r'message.*failed', 'low', 'Message delivery failed'),
-            (r'invalid.*phone', 'low', 'Invalid phone number'),
-            
-            # Network issues
-            (r'timeout|timed\s*out', 'low', 'Network timeout'),
-            (r'connection.*refused', 'medium', 'Connection refused'),
-            (r'network.*error', 'low', 'Network error')
-        ]
+        # דפוסי טקסט בתגובות - ביטוי אחד מקומפל, קבוצה בשם לכל דפוס
+        self.blocking_patterns = [(pattern, severity, reason) for _, pattern, severity, reason in BLOCKING_PATTERNS]
+        self.pattern_info = {name: (severity, reason) for name, _, severity, reason in BLOCKING_PATTERNS}
+        self.pattern_order = [name for name, _, _, _ in BLOCKING_PATTERNS]
+        self.blocking_regex = compile_blocking_patterns()
         
         # כותרות HTTP חשודות
         self.suspicious_headers = {
@@ -151,11 +213,16 @@ class BlockingDetector:
         if not response_text:
             return indicators
         
-        response_text = str(response_text).lower()
+        if isinstance(response_text, bytes):
+            response_text = response_text.decode('utf-8', errors='ignore')
+        
+        # מספר ההתאמות לכל דפוס, במעבר אחד על כל אזור
+        counts = self._count_matches(scan_regions(str(response_text)))
         
-        for pattern, severity, reason in self.blocking_patterns:
-            if re.search(pattern, response_text, re.IGNORECASE):
-                confidence = self._calculate_pattern_confidence(pattern, response_text)
+        for name in self.pattern_order:
+            if name in counts:
+                severity, reason = self.pattern_info[name]
+                confidence = self._calculate_pattern_confidence(counts[name])
                 suggested_action = self._get_suggested_action(severity, reason)
                 
                 indicators.append(BlockingIndicator(
@@ -167,6 +234,18 @@ class BlockingDetector:
         
         return indicators
     
+    def _count_matches(self, regions: List[str]) -> Dict[str, int]:
+        """סופר התאמות לכל דפוס; ממשיך מהתו שאחרי תחילת כל התאמה כדי לא לפספס דפוסים חופפים"""
+        counts = {}
+        search = self.blocking_regex.search
+        for region in regions:
+            match = search(region)
+            while match:
+                name = match.lastgroup
+                counts[name] = counts.get(name, 0) + 1
+                match = search(region, match.start() + 1)
+        return counts
+    
     def _check_headers(self, response_data: Dict[str, Any]) -> List[BlockingIndicator]:
         """בדיקת כותרות HTTP"""
         indicators = []
@@ -226,10 +305,8 @@ class BlockingDetector:
         
         return indicators
     
-    def _calculate_pattern_confidence(self, pattern: str, text: str) -> float:
-        """מחשב רמת ביטחון לדפוס שנמצא"""
-        matches = len(re.findall(pattern, text, re.IGNORECASE))
-        
+    def _calculate_pattern_confidence(self, matches: int) -> float:
+        """מחשב רמת ביטחון לדפוס שנמצא לפי מספר ההתאמות"""
         # יותר התאמות = ביטחון גבוה יותר
         if matches >= 3:
             return 0.9
@@ -310,6 +387,79 @@ def detect_blocking_indicators(response_data: Dict[str, Any]) -> List[BlockingIn
     Returns:
         רשימת אינדיקטורים שנמצאו
     """
-    detector = BlockingDetector()
-    return detector.detect_blocking_indicators(response_data)
+    return get_blocking_detector().detect_blocking_indicators(response_data)
+
+_blocking_detector: Optional[BlockingDetector] = None
+
+def get_blocking_detector() -> BlockingDetector:
+    """מופע משותף - הדפוסים מקומפלים פעם אחת לכל תהליך"""
+    global _blocking_detector
+    if _blocking_detector is None:
+        _blocking_detector = BlockingDetector()
+    return _blocking_detector
+
+def _legacy_content_matches(text: str) -> Dict[str, int]:
+    """הסריקה הישנה: כל דפוס בנפרד על כל הגוף (להשוואה בבנצ'מרק בלבד)"""
+    text = text.lower()
+    counts = {}
+    for name, pattern, _, _ in BLOCKING_PATTERNS:
+        legacy_pattern = pattern.replace('.{0,80}?', '.*')
+        if re.search(legacy_pattern, text, re.IGNORECASE):
+            counts[name] = len(re.findall(legacy_pattern, text, re.IGNORECASE))
+    return counts
+
+def benchmark(pages: List[Tuple[str, str]], rounds: int = 3) -> List[Dict[str, Any]]:
+    """
+    משווה את הסריקה הישנה לסריקה המקומפלת על דפים מוקלטים
+    
+    Args:
+        pages: רשימת (שם, טקסט) של דפים חסומים ותקינים
+        rounds: מספר חזרות למדידה
+        
+    Returns:
+        שורת תוצאה לכל דף: זמנים, דפוסים שנמצאו ומהירות
+    """
+    detector = get_blocking_detector()
+    results = []
+    for name, text in pages:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            legacy = _legacy_content_matches(text)
+        legacy_seconds = (time.perf_counter() - start) / rounds
+        
+        start = time.perf_counter()
+        for _ in range(rounds):
+            compiled = detector._count_matches(scan_regions(text))
+        compiled_seconds = (time.perf_counter() - start) / rounds
+        
+        results.append({
+            'page': name,
+            'kb': round(len(text) / 1024, 1),
+            'legacy_ms': round(legacy_seconds * 1000, 3),
+            'compiled_ms': round(compiled_seconds * 1000, 3),
+            'mb_per_second': round(len(text) / 1024 / 1024 / compiled_seconds, 1) if compiled_seconds else None,
+            'legacy_patterns': sorted(legacy),
+            'compiled_patterns': sorted(compiled),
+        })
+    return results
+
+if __name__ == '__main__':
+    # Usage: python3 blocking_detector.py <page.html> [<page.html> ...]
+    # Recorded blocked pages and clean Yad2 pages; without files a synthetic pair is used
+    logging.basicConfig(level=logging.ERROR)
+    if len(sys.argv) > 1:
+        recorded = []
+        for path in sys.argv[1:]:
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                recorded.append((path, f.read()))
+    else:
+        listings = '<div class="feed-item">דירה 3 חדרים</div>' * 300
+        script = '<script id="__NEXT_DATA__">' + '{"blocked":false,"message":"ok"},' * 3000 + '</script>'
+        recorded = [
+            ('synthetic_clean', f'<html><head><title>יד2 - דירות להשכרה</title></head><body>{listings}{script}</body></html>'),
+            ('synthetic_blocked', '<html><head><title>Access Denied</title></head><body>Too many requests. '
+                                  'You have been blocked. Rate limit exceeded.</body></html>'),
+        ]
+    for row in benchmark(recorded):
+        print(row)
 
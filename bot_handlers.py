@@ -6,15 +6,51 @@ import logging
 import os
 import asyncio
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo, ReplyKeyboardMarkup, KeyboardButton
-from telegram.error import BadRequest, Forbidden, TelegramError
-from telegram.ext import ContextTypes
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from telegram.ext import BaseRateLimiter, ContextTypes
 from database import db
+from listing import Listing
+from rate_limiter import get_telegram_limiter
 from bot_menus import MenuManager
 from scraper_manager_final import final_scraper_manager
+from listing_watch import get_watch_store
+from saved_searches import SavedSearch
+from scan_filters import ScanFilters
 # Removed: whatsapp_manager and bonus_manager
 
 logger = logging.getLogger(__name__)
 
+
+class TelegramRequestLimiter(BaseRateLimiter):
+    """Passes every Bot API request to a chat through get_telegram_limiter().acquire(chat_id).
+    
+    Set on the Application (Application.builder().rate_limiter(...)), so handlers, the
+    scheduler, the watch service and progress edits all share the per-chat and
+    bot-wide buckets. A 429 that still gets through is retried once after retry_after.
+    """
+    
+    async def initialize(self) -> None:
+        pass
+    
+    async def shutdown(self) -> None:
+        pass
+    
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            # getUpdates, answerCallbackQuery, ...: not a message to a chat
+            return await callback(*args, **kwargs)
+        await get_telegram_limiter().acquire(chat_id)
+        try:
+            return await callback(*args, **kwargs)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            delay = retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+            logger.warning(f"[Telegram] Flood limit on {endpoint} to {chat_id}, retrying in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            await get_telegram_limiter().acquire(chat_id)
+            return await callback(*args, **kwargs)
+
 # --- Whitelist: Only authorized users can use the bot ---
 ALLOWED_USER_IDS = [7238791533]  # Add your Telegram ID here
 
@@ -27,6 +63,33 @@ def is_user_authorized(user_id: int) -> bool:
 CHANNEL_ID = "@yad2credits"  # Username של הקבוצה
 CHANNEL_INVITE_URL = "https://t.me/yad2credits"
 
+# --- Saved search presets: (label, min, max), None = no limit ---
+WATCH_PRICE_PRESETS = {
+    'rent': [
+        ("כל מחיר", None, None),
+        ("עד 4,000 ₪", None, 4000),
+        ("4,000-6,000 ₪", 4000, 6000),
+        ("6,000-8,000 ₪", 6000, 8000),
+        ("8,000 ₪ ומעלה", 8000, None),
+    ],
+    'sale': [
+        ("כל מחיר", None, None),
+        ("עד 1.5 מיליון ₪", None, 1_500_000),
+        ("1.5-2.5 מיליון ₪", 1_500_000, 2_500_000),
+        ("2.5-4 מיליון ₪", 2_500_000, 4_000_000),
+        ("4 מיליון ₪ ומעלה", 4_000_000, None),
+    ],
+}
+WATCH_ROOMS_PRESETS = [
+    ("כל מספר חדרים", None, None),
+    ("1-2 חדרים", 1, 2),
+    ("2.5-3.5 חדרים", 2.5, 3.5),
+    ("4-4.5 חדרים", 4, 4.5),
+    ("5 חדרים ומעלה", 5, None),
+]
+# Saved searches offered a scan-now button in the alerts menu
+WATCH_SCAN_BUTTONS = 5
+
 async def check_channel_membership(context, user_id: int) -> bool:
     """Check if user is a member of the required channel"""
     try:
@@ -206,6 +269,24 @@ class BotHandlers:
             elif callback_data.startswith('schedule_'):
                 await self._handle_schedule_action(update, context, callback_data)
             
+            elif callback_data == 'watch_menu':
+                await self._handle_watch_menu(update, context)
+            
+            elif callback_data == 'watch_cancel':
+                await self._handle_watch_cancel(update, context)
+            
+            elif callback_data in ['watch_rent', 'watch_sale']:
+                await self._handle_watch_mode(update, context, callback_data)
+            
+            elif callback_data.startswith('watch_price_'):
+                await self._handle_watch_price_selected(update, context, callback_data)
+            
+            elif callback_data.startswith('watch_rooms_'):
+                await self._handle_watch_rooms_selected(update, context, callback_data)
+            
+            elif callback_data.startswith('watch_scan_'):
+                await self._handle_watch_scan(update, context, callback_data)
+            
             elif callback_data in ['show_current_schedule', 'cancel_schedule']:
                 await self._handle_schedule_management(update, context, callback_data, language)
             
@@ -803,6 +884,11 @@ class BotHandlers:
                 await self._handle_rent_to_sale_city_selected(update, context, city_name, city_code)
                 return
             
+            # Check if we're choosing a city to watch
+            if context.user_data.get('in_watch_mode'):
+                await self._handle_watch_city_selected(update, context, city_name, city_code)
+                return
+            
             # Get stored mode and filter from context, or use defaults
             mode = context.user_data.get('scraper_mode', 'rent')
             filter_type = context.user_data.get('scraper_filter', 'today')
@@ -859,7 +945,7 @@ class BotHandlers:
             # Use the existing callback message instead of creating a new one
             status_message = update.callback_query.message
             
-            await self.scraper_manager.run_scraper_with_message(
+            await self.scraper_manager.submit_scan(
                 status_message,
                 context,
                 mode,
@@ -1416,17 +1502,9 @@ https://telegra.ph/%D7%AA%D7%A0%D7%90%D7%99-%D7%A9%D7%99%D7%9E%D7%95%D7%A9---yad
                     with open(csv_file, 'r', encoding='utf-8') as f:
                         reader = csv.DictReader(f)
                         for row in reader:
-                            phone = row.get('phone_number', '').strip()
-                            if phone and phone != '0' and len(phone) >= 9:
-                                # Clean phone number (remove spaces, dashes, etc.)
-                                clean_phone = ''.join(filter(str.isdigit, phone))
-                                if clean_phone.startswith('0'):
-                                    clean_phone = '972' + clean_phone[1:]  # Convert to international format
-                                elif not clean_phone.startswith('972'):
-                                    clean_phone = '972' + clean_phone
-                                
-                                whatsapp_link = f"https://wa.me/{clean_phone}"
-                                phone_links.append(f"📱 {phone}: {whatsapp_link}")
+                            listing = Listing.from_csv_row(row)
+                            if listing.has_real_phone:
+                                phone_links.append(listing.to_telegram_text())
                     
                     logger.info(f"[DEBUG] Generated {len(phone_links)} WhatsApp links")
                     
@@ -2136,6 +2214,7 @@ https://t.me/yad2bot_bot?start=ref_{user_id}
                         InlineKeyboardButton("❌ בטל תזמון נוכחי", callback_data='schedule_cancel'),
                         InlineKeyboardButton("✨ הגדר תזמון חדש", callback_data='schedule_new')
                     ],
+                    [InlineKeyboardButton("🔔 התראות בזמן אמת", callback_data='watch_menu')],
                     [InlineKeyboardButton("🔙 תפריט ראשי", callback_data='back_to_main')]
                 ]
             else:
@@ -2148,6 +2227,7 @@ https://t.me/yad2bot_bot?start=ref_{user_id}
                 
                 keyboard = [
                     [InlineKeyboardButton("✨ הגדר תזמון חדש", callback_data='schedule_new')],
+                    [InlineKeyboardButton("🔔 התראות בזמן אמת", callback_data='watch_menu')],
                     [InlineKeyboardButton("🔙 תפריט ראשי", callback_data='back_to_main')]
                 ]
             
@@ -2283,6 +2363,163 @@ https://t.me/yad2bot_bot?start=ref_{user_id}
             except:
                 pass
 
+    
+    async def _handle_watch_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle live alerts menu - show saved searches and add/cancel options"""
+        query = update.callback_query
+        user_id = update.effective_user.id
+        context.user_data['in_watch_mode'] = False
+        
+        try:
+            searches = get_watch_store().searches.get_user_searches(user_id)
+            message = (
+                "**🔔 התראות בזמן אמת**\n\n"
+                "כל מודעה חדשה של בעלים פרטיים שמתאימה לחיפוש שמור שלך תישלח אליך תוך דקה-שתיים מרגע פרסומה.\n\n"
+            )
+            if searches:
+                message += "**חיפושים שמורים:**\n"
+                for search in searches:
+                    message += f"{search.describe()}\n"
+            else:
+                message += "**סטטוס נוכחי:** 🔴 אין חיפושים שמורים."
+            
+            keyboard = [
+                [
+                    InlineKeyboardButton("🏠 השכרה", callback_data='watch_rent'),
+                    InlineKeyboardButton("🏢 מכירה", callback_data='watch_sale')
+                ]
+            ]
+            for search in searches[:WATCH_SCAN_BUTTONS]:
+                keyboard.append([InlineKeyboardButton(f"🔍 סרוק עכשיו: {search.city_name or search.city_code}",
+                                                      callback_data=f'watch_scan_{search.id}')])
+            if searches:
+                keyboard.append([InlineKeyboardButton("❌ מחק את כל החיפושים", callback_data='watch_cancel')])
+            keyboard.append([InlineKeyboardButton("🔙 חזרה", callback_data='schedule_menu')])
+            
+            await query.edit_message_text(
+                text=message,
+                reply_markup=InlineKeyboardMarkup(keyboard),
+                parse_mode='Markdown'
+            )
+            
+        except Exception as e:
+            logger.error(f"Error in watch menu: {e}")
+            await query.edit_message_text("שגיאה בטעינת תפריט ההתראות. נסה שוב.")
+    
+    async def _handle_watch_mode(self, update: Update, context: ContextTypes.DEFAULT_TYPE, callback_data: str):
+        """Handle watch mode selection - show city selection"""
+        query = update.callback_query
+        mode = 'rent' if callback_data == 'watch_rent' else 'sale'
+        context.user_data['in_watch_mode'] = True
+        context.user_data['watch_mode'] = mode
+        
+        mode_text = "להשכרה" if mode == 'rent' else "למכירה"
+        await query.edit_message_text(
+            text=f"🔔 התראות על מודעות {mode_text}\n\n🏙️ בחר עיר מהרשימה",
+            reply_markup=self.menu_manager.create_city_selection_keyboard()
+        )
+    
+    async def _handle_watch_city_selected(self, update: Update, context: ContextTypes.DEFAULT_TYPE, city_name: str, city_code: str):
+        """Handle city selection in watch mode - ask for a price range"""
+        query = update.callback_query
+        mode = context.user_data.get('watch_mode', 'rent')
+        context.user_data['in_watch_mode'] = False
+        context.user_data['watch_city'] = (city_name, city_code)
+        
+        keyboard = [[InlineKeyboardButton(label, callback_data=f'watch_price_{i}')]
+                    for i, (label, _, _) in enumerate(WATCH_PRICE_PRESETS[mode])]
+        await query.edit_message_text(
+            text=f"🔔 {city_name}\n\n💰 בחר טווח מחירים",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+    
+    async def _handle_watch_price_selected(self, update: Update, context: ContextTypes.DEFAULT_TYPE, callback_data: str):
+        """Handle price range selection in watch mode - ask for a rooms range"""
+        query = update.callback_query
+        mode = context.user_data.get('watch_mode', 'rent')
+        try:
+            context.user_data['watch_price'] = WATCH_PRICE_PRESETS[mode][int(callback_data.replace('watch_price_', ''))]
+        except (ValueError, IndexError):
+            await query.answer("❌ בחירה לא תקינה", show_alert=True)
+            return
+        
+        keyboard = [[InlineKeyboardButton(label, callback_data=f'watch_rooms_{i}')]
+                    for i, (label, _, _) in enumerate(WATCH_ROOMS_PRESETS)]
+        await query.edit_message_text(
+            text="🛏️ בחר מספר חדרים",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+    
+    async def _handle_watch_rooms_selected(self, update: Update, context: ContextTypes.DEFAULT_TYPE, callback_data: str):
+        """Handle rooms range selection in watch mode - save the search"""
+        query = update.callback_query
+        user_id = update.effective_user.id
+        mode = context.user_data.get('watch_mode', 'rent')
+        city = context.user_data.pop('watch_city', None)
+        _, min_price, max_price = context.user_data.pop('watch_price', (None, None, None))
+        try:
+            _, min_rooms, max_rooms = WATCH_ROOMS_PRESETS[int(callback_data.replace('watch_rooms_', ''))]
+        except (ValueError, IndexError):
+            await query.answer("❌ בחירה לא תקינה", show_alert=True)
+            return
+        if not city:
+            # The bot restarted in the middle of the flow
+            await self._handle_watch_menu(update, context)
+            return
+        
+        city_name, city_code = city
+        search = SavedSearch(user_id=user_id, city_code=city_code, mode=mode, city_name=city_name,
+                             min_price=min_price, max_price=max_price, min_rooms=min_rooms, max_rooms=max_rooms)
+        if get_watch_store().searches.add(search) is None:
+            await query.answer("❌ שגיאה בשמירת החיפוש", show_alert=True)
+            return
+        
+        await query.answer("✅ החיפוש נשמר!", show_alert=True)
+        message = (
+            "✅ **החיפוש נשמר!**\n\n"
+            f"{search.describe()}\n\n"
+            "מודעות חדשות שמתאימות לחיפוש יישלחו אליך כאן ברגע שיתפרסמו."
+        )
+        keyboard = [
+            [InlineKeyboardButton("🔔 ניהול התראות", callback_data='watch_menu')],
+            [InlineKeyboardButton("🔙 חזרה לתפריט הראשי", callback_data='back_to_main')]
+        ]
+        await query.edit_message_text(
+            text=message,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+    
+    async def _handle_watch_scan(self, update: Update, context: ContextTypes.DEFAULT_TYPE, callback_data: str):
+        """Handle scan-now for a saved search - its criteria are pushed into the feed URL"""
+        query = update.callback_query
+        user_id = update.effective_user.id
+        search_id = callback_data.replace('watch_scan_', '')
+        search = next((s for s in get_watch_store().searches.get_user_searches(user_id) if str(s.id) == search_id), None)
+        if not search:
+            await query.answer("❌ החיפוש לא נמצא", show_alert=True)
+            return
+        
+        await query.answer()
+        await self.scraper_manager.submit_scan(
+            query.message,
+            context,
+            search.mode,
+            'all',
+            search.city_code,
+            filters=ScanFilters.from_saved_search(search).to_json()
+        )
+    
+    async def _handle_watch_cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle deletion of all the user's saved searches"""
+        query = update.callback_query
+        user_id = update.effective_user.id
+        
+        if get_watch_store().searches.remove_user_searches(user_id):
+            await query.answer("✅ החיפושים נמחקו", show_alert=True)
+        else:
+            await query.answer("❌ שגיאה במחיקת החיפושים", show_alert=True)
+        await self._handle_watch_menu(update, context)
 
 # Global handlers instance
 handlers = BotHandlers()
@@ -0,0 +1,190 @@
+"""
+Concurrency Controller - בקרת מקביליות אדפטיבית (AIMD)
+Additive-increase / multiplicative-decrease control of how many ZenRows fetches
+run at once. Clean responses slowly raise the limit; BlockingDetector risk
+(medium and above) or an AdaptiveBackoff level escalation cuts it sharply, and
+the backoff level also paces requests while the target is unhappy.
+By default the backoff is the cross-process SharedAdaptiveBackoff, so its
+level and circuit breaker carry over between scans and subprocesses.
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from adaptive_backoff import AdaptiveBackoff
+from blocking_detector import BlockingDetector, BlockingIndicator, get_blocking_detector
+from rate_limiter import TokenBucket, get_rate_limiter
+from shared_backoff import DEFAULT_UPSTREAM_HOST, get_shared_backoff
+
+logger = logging.getLogger(__name__)
+
+MIN_CONCURRENCY = int(os.environ.get('YAD2_MIN_CONCURRENCY', '1'))
+MAX_CONCURRENCY = int(os.environ.get('YAD2_MAX_CONCURRENCY', '8'))
+INITIAL_CONCURRENCY = int(os.environ.get('YAD2_INITIAL_CONCURRENCY', '2'))
+
+# Additive increase: about +1 slot after a full window of clean responses
+ADDITIVE_INCREASE = 1.0
+# Multiplicative decrease per risk level (anything not listed is treated as clean)
+DECREASE_FACTORS = {
+    'medium': 0.75,
+    'high': 0.5,
+    'critical': 0.25,
+}
+# Factor applied when AdaptiveBackoff escalates on a plain failure
+ESCALATION_DECREASE = 0.5
+
+
+class ConcurrencyController:
+    """AIMD limit on in-flight fetches, fed by BlockingDetector and AdaptiveBackoff."""
+
+    def __init__(self, min_limit: int = MIN_CONCURRENCY, max_limit: int = MAX_CONCURRENCY,
+                 initial_limit: int = INITIAL_CONCURRENCY, backoff: Optional[AdaptiveBackoff] = None,
+                 detector: Optional[BlockingDetector] = None, limiter: Optional[TokenBucket] = None):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.backoff = backoff or get_shared_backoff()
+        self.detector = detector or get_blocking_detector()
+        # Requests-per-second budget for the upstream, slowed down by the backoff level
+        self.limiter = limiter or get_rate_limiter(getattr(self.backoff, 'host', DEFAULT_UPSTREAM_HOST), self.backoff)
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self.last_risk = 'none'
+        self._condition = threading.Condition()
+
+    @property
+    def current_limit(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold one of the current_limit fetch slots, pacing first while backed off."""
+        self.wait_for_circuit()
+        with self._condition:
+            while self.in_flight >= self.current_limit:
+                self._condition.wait()
+            self.in_flight += 1
+        try:
+            self.pace()
+            yield
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def wait_for_circuit(self) -> None:
+        """Block while the shared circuit breaker for the upstream host is open."""
+        wait_time = getattr(self.backoff, 'wait_time', None)
+        if wait_time is None:
+            return
+        wait = wait_time()
+        if wait > 0:
+            logger.warning(f"Circuit open, waiting {wait:.0f}s before fetching")
+        while wait > 0:
+            time.sleep(min(wait, 5.0))
+            wait = wait_time()
+
+    def pace(self) -> None:
+        """Wait for a rate-limiter token; the refill rate drops as the backoff level rises."""
+        self.limiter.acquire_sync()
+
+    def retry_delay(self) -> float:
+        """Delay before retrying a failed fetch, from the current backoff level."""
+        return self.backoff.get_delay()
+
+    def assess(self, status_code: Optional[int], headers: Optional[Dict[str, str]] = None,
+               text: str = '', elapsed: float = 0.0) -> Tuple[str, List[BlockingIndicator]]:
+        """BlockingDetector risk level ('none', 'low', 'medium', 'high', 'critical') and indicators of a response."""
+        indicators = self.detector.detect_blocking_indicators({
+            'status_code': status_code,
+            'headers': dict(headers or {}),
+            'text': text or '',
+            'response_time': elapsed
+        })
+        risk_level, _ = self.detector.get_overall_risk_level(indicators)
+        return risk_level, indicators
+
+    def record(self, risk_level: str = 'none', ok: bool = True,
+               error_info: Optional[Dict[str, Any]] = None, latency: Optional[float] = None) -> None:
+        """Feed one outcome into the controller.
+
+        ok=False with a low risk (timeout, validation failure) only cuts the limit
+        if AdaptiveBackoff escalates its level because of it. error_info may carry
+        the BlockingDetector 'indicators' for the backoff's health window.
+        """
+        with self._condition:
+            self.last_risk = risk_level
+            old_limit = self.current_limit
+            if risk_level in DECREASE_FACTORS:
+                self.backoff.register_failure(error_info, latency)
+                self._decrease(DECREASE_FACTORS[risk_level])
+            elif not ok:
+                old_level = self.backoff.current_level
+                self.backoff.register_failure(error_info, latency)
+                if self.backoff.current_level.value > old_level.value:
+                    self._decrease(ESCALATION_DECREASE)
+            else:
+                self.backoff.register_success(latency)
+                if self.limit < self.max_limit:
+                    self.limit = min(float(self.max_limit), self.limit + ADDITIVE_INCREASE / self.limit)
+                    if self.current_limit > old_limit:
+                        self.increases += 1
+                        logger.info(f"Concurrency limit raised to {self.current_limit}")
+            self._condition.notify_all()
+
+    def record_response(self, response, elapsed: float = 0.0, ok: Optional[bool] = None) -> str:
+        """Assess a requests-style response, record it and return its risk level.
+
+        ok defaults to a 200 status; callers pass ok=False when the body did not validate.
+        """
+        if ok is None:
+            ok = response.status_code == 200
+        risk_level, indicators = 'none', []
+        if not ok:
+            # A validated 200 is clean by definition; only judge responses we could not use
+            risk_level, indicators = self.assess(response.status_code, response.headers, response.text, elapsed)
+        self.record(risk_level, ok, {'status_code': response.status_code, 'message': response.text[:200],
+                                     'indicators': indicators}, latency=elapsed)
+        return risk_level
+
+    def record_error(self, error: Exception) -> None:
+        """Record a request that raised (timeout, connection reset)."""
+        self.record('none', False, {'message': str(error)})
+
+    def _decrease(self, factor: float) -> None:
+        old_limit = self.current_limit
+        self.limit = max(float(self.min_limit), self.limit * factor)
+        self.decreases += 1
+        logger.warning(f"Concurrency limit cut {old_limit} -> {self.current_limit} "
+                       f"(risk: {self.last_risk}, backoff: {self.backoff.current_level.name})")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Current limit and backoff level, for logs and progress files."""
+        with self._condition:
+            return {
+                'limit': self.current_limit,
+                'in_flight': self.in_flight,
+                'max_limit': self.max_limit,
+                'backoff_level': self.backoff.current_level.name,
+                'circuit_state': getattr(self.backoff, 'circuit_state', 'closed'),
+                'rate_per_second': round(self.limiter.effective_rate, 3),
+                'last_risk': self.last_risk,
+                'increases': self.increases,
+                'decreases': self.decreases,
+            }
+
+
+_controller: Optional[ConcurrencyController] = None
+
+
+def get_concurrency_controller() -> ConcurrencyController:
+    """Process-wide controller shared by every fetch path."""
+    global _controller
+    if _controller is None:
+        _controller = ConcurrencyController()
+    return _controller
@@ -7,7 +7,10 @@ import os
 import json
 import pymysql
 from datetime import datetime
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Union
+
+from listing import Listing
+from fetch_ledger import FetchLedger
 
 logger = logging.getLogger(__name__)
 
@@ -193,6 +196,29 @@ class BotDatabase:
                 except sqlite3.OperationalError:
                     pass
                 
+                # Fetch cost/latency of the scan behind each result (see fetch_ledger.py).
+                # fetch_count is a share of a shared run's fetches, so it can be fractional
+                for column, column_type in (('run_id', 'TEXT'), ('fetch_count', 'REAL DEFAULT 0'),
+                                            ('fetch_credits', 'REAL DEFAULT 0'), ('fetch_bytes', 'INTEGER DEFAULT 0'),
+                                            ('latency_p50_ms', 'INTEGER'), ('latency_p95_ms', 'INTEGER'),
+                                            ('shared_by', 'INTEGER DEFAULT 1')):
+                    try:
+                        cursor.execute(f"ALTER TABLE results ADD COLUMN {column} {column_type}")
+                        conn.commit()
+                        logger.info(f"Added {column} column to results table")
+                    except sqlite3.OperationalError:
+                        pass
+                
+                # Listings each user has already received, for per-user dedupe of shared scans
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS user_listings (
+                        user_id INTEGER,
+                        listing_url TEXT,
+                        first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (user_id, listing_url)
+                    )
+                ''')
+                
                 # Credits ledger table for transaction history
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS credits_ledger (
@@ -611,18 +637,35 @@ class BotDatabase:
     # Results management methods
     def save_scraping_result(self, user_id: int, mode: str, filter_type: str, 
                            csv_file_path: str, total_listings: int = 0, 
-                           phone_numbers_count: int = 0, city_code: str = None) -> bool:
-        """Save scraping result metadata and sync leads to MySQL"""
+                           phone_numbers_count: int = 0, city_code: str = None,
+                           run_id: str = None, shared_by: int = 1) -> bool:
+        """Save scraping result metadata (with the scan's fetch cost) and sync leads to MySQL
+        
+        shared_by is the number of users a shared scheduled scan was run for;
+        each of their result rows carries an equal share of its fetches, credits and bytes,
+        so summing a run's rows gives its total cost.
+        """
         try:
+            cost = self.get_run_fetch_cost(run_id) if run_id else {}
+            shared_by = max(1, shared_by)
+            
             # Save metadata to SQLite
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO results (user_id, mode, filter_type, csv_file_path, 
-                                       total_listings, phone_numbers_count, city_code)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (user_id, mode, filter_type, csv_file_path, total_listings, phone_numbers_count, city_code))
+                                       total_listings, phone_numbers_count, city_code,
+                                       run_id, fetch_count, fetch_credits, fetch_bytes,
+                                       latency_p50_ms, latency_p95_ms, shared_by)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (user_id, mode, filter_type, csv_file_path, total_listings, phone_numbers_count, city_code,
+                      run_id, cost.get('fetches', 0) / shared_by, cost.get('credits', 0.0) / shared_by,
+                      cost.get('bytes', 0) // shared_by, cost.get('latency_p50_ms'), cost.get('latency_p95_ms'),
+                      shared_by))
                 conn.commit()
+            if cost:
+                logger.info(f"Scan {run_id} cost {cost['credits']:.0f} credits over {cost['fetches']} fetches "
+                            f"(p50 {cost['latency_p50_ms']}ms, p95 {cost['latency_p95_ms']}ms)")
             
             # Sync leads to MySQL/TiDB for CRM
             try:
@@ -631,20 +674,19 @@ class BotDatabase:
                     with open(csv_file_path, 'r', encoding='utf-8') as f:
                         reader = csv.DictReader(f)
                         success_count = 0
+                        seen_urls = []
                         for row in reader:
+                            listing = Listing.from_csv_row(row)
+                            if listing.listing_url:
+                                seen_urls.append(listing.listing_url)
                             # Only sync if there's a phone number
-                            if row.get('phone_number', '').strip():
-                                # Create WhatsApp link
-                                phone = row.get('phone_number', '').strip()
-                                if phone.startswith('0'):
-                                    phone = '972' + phone[1:]  # Convert to international format
-                                row['whatsapp_link'] = f'https://wa.me/{phone}'
-                                
-                                if save_lead_to_mysql(user_id, row, mode, filter_type):
+                            if listing.phone_number:
+                                if save_lead_to_mysql(user_id, listing, mode, filter_type):
                                     success_count += 1
                                 else:
-                                    logger.warning(f"Failed to save lead: {row.get('phone_number')}")
+                                    logger.warning(f"Failed to save lead: {listing.phone_number}")
                     logger.info(f"Synced {success_count} leads to MySQL for user {user_id}")
+                    self.mark_listings_seen(user_id, seen_urls)
             except Exception as sync_error:
                 logger.error(f"Error syncing leads to MySQL: {sync_error}")
                 # Don't fail the whole operation if MySQL sync fails
@@ -655,6 +697,46 @@ class BotDatabase:
             logger.error(f"Error saving scraping result: {e}")
             return False
     
+    def get_unseen_listing_urls(self, user_id: int, listing_urls: List[str]) -> set:
+        """The listing URLs (of the given ones) that the user has not received yet"""
+        try:
+            seen = set()
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                # Only the given URLs are looked up (primary key), in chunks under SQLite's variable limit
+                for start in range(0, len(listing_urls), 500):
+                    chunk = listing_urls[start:start + 500]
+                    cursor.execute(f'''
+                        SELECT listing_url FROM user_listings
+                        WHERE user_id = ? AND listing_url IN ({', '.join('?' * len(chunk))})
+                    ''', (user_id, *chunk))
+                    seen.update(row[0] for row in cursor.fetchall())
+            return {url for url in listing_urls if url not in seen}
+        except Exception as e:
+            logger.error(f"Error reading seen listings: {e}")
+            return set(listing_urls)
+    
+    def mark_listings_seen(self, user_id: int, listing_urls: List[str]) -> bool:
+        """Remember listings the user has received"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.executemany('INSERT OR IGNORE INTO user_listings (user_id, listing_url) VALUES (?, ?)',
+                                   [(user_id, url) for url in listing_urls])
+                conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error marking listings seen: {e}")
+            return False
+    
+    def get_run_fetch_cost(self, run_id: str) -> Dict[str, Any]:
+        """Fetch count, credits, bytes and p50/p95 latency recorded for one scan"""
+        return FetchLedger(self.db_path, run_id=run_id).run_summary(run_id)
+    
+    def get_user_fetch_cost(self, user_id: int, since: str = None) -> Dict[str, Any]:
+        """Fetch count, credits, bytes and p50/p95 latency of all of a user's scans"""
+        return FetchLedger(self.db_path, user_id=user_id).user_summary(user_id, since)
+    
     def get_user_results(self, user_id: int, limit: int = 5) -> List[Dict]:
         """Get user's scraping results"""
         try:
@@ -1288,13 +1370,13 @@ def check_lead_exists_in_mysql(listing_url: str) -> bool:
         return False
 
 
-def save_lead_to_mysql(telegram_user_id: int, lead_data: Dict, scan_type: str, filter_type: str = 'all') -> bool:
+def save_lead_to_mysql(telegram_user_id: int, lead_data: Union[Listing, Dict], scan_type: str, filter_type: str = 'all') -> bool:
     """
     Save lead to MySQL/TiDB database for CRM
     
     Args:
         telegram_user_id: Telegram user ID
-        lead_data: Dictionary with lead info from CSV
+        lead_data: Listing (or a CSV row dict, converted to a Listing)
         scan_type: 'rent' or 'sale'
         filter_type: 'today', 'all', or 'test'
     
@@ -1305,11 +1387,14 @@ def save_lead_to_mysql(telegram_user_id: int, lead_data: Dict, scan_type: str, f
         connection = pymysql.connect(**MYSQL_CONFIG)
         cursor = connection.cursor()
         
+        if not isinstance(lead_data, Listing):
+            lead_data = Listing.from_csv_row(lead_data)
+        
         # Map filter_type: bonus -> all for CRM enum
         crm_filter_type = 'today' if filter_type == 'today' else 'all'
         
         # Debug logging
-        logger.debug(f"Saving lead to MySQL: phone={lead_data.get('phone_number')}, scan_type={scan_type}, filter_type={filter_type}")
+        logger.debug(f"Saving lead to MySQL: phone={lead_data.phone_number}, scan_type={scan_type}, filter_type={filter_type}")
         
         # Use INSERT IGNORE to skip duplicates based on listingUrl
         # This prevents duplicate leads from being saved if the same listing is scraped again
@@ -1320,21 +1405,7 @@ def save_lead_to_mysql(telegram_user_id: int, lead_data: Dict, scan_type: str, f
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), %s, %s, %s)
         """
         
-        values = (
-            1,  # Always use CRM userId = 1 (not Telegram ID)
-            lead_data.get('phone_number', lead_data.get('phone', '')),
-            lead_data.get('owner_name', lead_data.get('name', lead_data.get('contact_name', ''))),
-            lead_data.get('address', lead_data.get('location', '')),
-            lead_data.get('rooms', ''),
-            lead_data.get('size', ''),
-            lead_data.get('floor', ''),
-            lead_data.get('price', ''),
-            scan_type,  # 'rent' or 'sale'
-            crm_filter_type,  # 'today' or 'all'
-            lead_data.get('listing_url', lead_data.get('url', '')),
-            lead_data.get('title', ''),
-            lead_data.get('whatsapp_link', '')
-        )
+        values = lead_data.to_crm_values(scan_type, crm_filter_type)
         
         try:
             cursor.execute(query, values)
@@ -1342,9 +1413,9 @@ def save_lead_to_mysql(telegram_user_id: int, lead_data: Dict, scan_type: str, f
             connection.commit()
             
             if affected_rows > 0:
-                logger.info(f"✅ Lead saved to MySQL: {lead_data.get('phone_number')} - {scan_type}/{filter_type}")
+                logger.info(f"✅ Lead saved to MySQL: {lead_data.phone_number} - {scan_type}/{filter_type}")
             else:
-                logger.info(f"⏭️  Lead already exists (skipped): {lead_data.get('listing_url', 'no-url')}")
+                logger.info(f"⏭️  Lead already exists (skipped): {lead_data.listing_url or 'no-url'}")
             
             return True
         except Exception as exec_error:
@@ -0,0 +1,208 @@
+"""
+Fetch Ledger - רישום עלות וזמני תגובה של כל בקשה חיצונית
+Records every outbound ZenRows fetch (run, user, URL class, tier, status, bytes,
+latency, credits) in a local SQLite table and aggregates cost and p50/p95
+latency per run and per user.
+The bot sets YAD2BOT_RUN_ID / YAD2BOT_USER_ID when it starts a scraper, so the
+scraper and phone extractor processes tag their rows with the scan they belong to.
+"""
+
+import logging
+import math
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+# The bot's own database, next to this module (the scraper runs from another cwd)
+LEDGER_DB_PATH = os.environ.get(
+    'YAD2BOT_LEDGER_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'yad2bot.db')
+)
+
+# URL classes used in the ledger
+URL_CLASSES = ('feed', 'item', 'phone')
+
+# ZenRows credits per request by tier, used when the response has no X-Request-Cost header
+TIER_CREDITS = {
+    'static': 1,
+    'render': 5,
+    'premium': 10,
+    'premium_render': 25,
+}
+
+
+def request_tier(params: Mapping[str, Any]) -> str:
+    """Billing tier of a ZenRows request from its js_render / premium_proxy parameters."""
+    render = str(params.get('js_render', '')).lower() == 'true'
+    premium = str(params.get('premium_proxy', '')).lower() == 'true'
+    if render and premium:
+        return 'premium_render'
+    if premium:
+        return 'premium'
+    if render:
+        return 'render'
+    return 'static'
+
+
+def request_credits(tier: str, headers: Optional[Mapping[str, str]] = None) -> float:
+    """Credits charged for one request: the X-Request-Cost header if present, else the tier price."""
+    for name, value in (headers or {}).items():
+        if name.lower() == 'x-request-cost':
+            try:
+                return float(value)
+            except ValueError:
+                break
+    return float(TIER_CREDITS.get(tier, TIER_CREDITS['premium_render']))
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of values (None when empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class FetchLedger:
+    """Append-only SQLite ledger of outbound fetches."""
+
+    def __init__(self, db_path: str = LEDGER_DB_PATH, run_id: Optional[str] = None,
+                 user_id: Optional[int] = None):
+        self.db_path = db_path
+        self.run_id = run_id if run_id is not None else os.environ.get('YAD2BOT_RUN_ID', '')
+        env_user = os.environ.get('YAD2BOT_USER_ID', '')
+        self.user_id = user_id if user_id is not None else (int(env_user) if env_user.isdigit() else None)
+        self.init_table()
+
+    def init_table(self) -> None:
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS fetch_ledger (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        run_id TEXT,
+                        user_id INTEGER,
+                        url_class TEXT, -- 'feed', 'item', 'phone'
+                        tier TEXT, -- 'static', 'render', 'premium', 'premium_render'
+                        status_code INTEGER, -- NULL when the request itself failed
+                        bytes INTEGER DEFAULT 0,
+                        latency_ms INTEGER,
+                        credits REAL DEFAULT 0,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_fetch_ledger_run_id ON fetch_ledger(run_id)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_fetch_ledger_user_id ON fetch_ledger(user_id)')
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error initializing fetch ledger: {e}")
+
+    def record(self, url_class: str, params: Mapping[str, Any], response=None,
+               latency: float = 0.0) -> None:
+        """Record one fetch; response is None when the request raised before a reply."""
+        tier = request_tier(params)
+        status_code = getattr(response, 'status_code', None)
+        headers = dict(getattr(response, 'headers', None) or {})
+        content = getattr(response, 'content', b'') if response is not None else b''
+        # A failed request is not billed by ZenRows
+        credits = request_credits(tier, headers) if response is not None and status_code and status_code < 400 else 0.0
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                conn.execute('''
+                    INSERT INTO fetch_ledger (run_id, user_id, url_class, tier, status_code,
+                                              bytes, latency_ms, credits)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (self.run_id, self.user_id, url_class, tier, status_code,
+                      len(content or b''), int(latency * 1000), credits))
+                conn.commit()
+        except Exception as e:
+            logger.warning(f"Could not record fetch in ledger: {e}")
+
+    def export_run(self, run_id: str) -> List[Dict[str, Any]]:
+        """All rows of one run, for a worker node to send back with its result."""
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                conn.row_factory = sqlite3.Row
+                rows = conn.execute('''
+                    SELECT run_id, user_id, url_class, tier, status_code, bytes, latency_ms, credits, created_at
+                    FROM fetch_ledger WHERE run_id = ? ORDER BY id
+                ''', (run_id,)).fetchall()
+            return [dict(row) for row in rows]
+        except Exception as e:
+            logger.warning(f"Could not export ledger rows of run {run_id}: {e}")
+            return []
+
+    def import_rows(self, rows: List[Dict[str, Any]]) -> int:
+        """Add rows exported on another node, so cost and latency reports include remote runs."""
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                conn.executemany('''
+                    INSERT INTO fetch_ledger (run_id, user_id, url_class, tier, status_code,
+                                              bytes, latency_ms, credits, created_at)
+                    VALUES (:run_id, :user_id, :url_class, :tier, :status_code,
+                            :bytes, :latency_ms, :credits, :created_at)
+                ''', rows)
+                conn.commit()
+            return len(rows)
+        except Exception as e:
+            logger.warning(f"Could not import ledger rows: {e}")
+            return 0
+
+    def _summary(self, where: str, args: tuple) -> Dict[str, Any]:
+        summary = {'fetches': 0, 'failed': 0, 'credits': 0.0, 'bytes': 0,
+                   'latency_p50_ms': None, 'latency_p95_ms': None, 'by_class': {}}
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                rows = conn.execute(
+                    f'SELECT url_class, status_code, bytes, latency_ms, credits FROM fetch_ledger WHERE {where}',
+                    args
+                ).fetchall()
+        except Exception as e:
+            logger.error(f"Error reading fetch ledger: {e}")
+            return summary
+
+        latencies = []
+        for url_class, status_code, size, latency_ms, credits in rows:
+            summary['fetches'] += 1
+            summary['credits'] += credits or 0
+            summary['bytes'] += size or 0
+            if status_code is None or status_code >= 400:
+                summary['failed'] += 1
+            if latency_ms is not None:
+                latencies.append(latency_ms)
+            by_class = summary['by_class'].setdefault(url_class, {'fetches': 0, 'credits': 0.0})
+            by_class['fetches'] += 1
+            by_class['credits'] += credits or 0
+        summary['latency_p50_ms'] = percentile(latencies, 50)
+        summary['latency_p95_ms'] = percentile(latencies, 95)
+        return summary
+
+    def run_summary(self, run_id: str) -> Dict[str, Any]:
+        """Cost, volume and p50/p95 latency of one scan."""
+        return self._summary('run_id = ?', (run_id,))
+
+    def user_summary(self, user_id: int, since: Optional[str] = None) -> Dict[str, Any]:
+        """Cost, volume and p50/p95 latency of all of a user's scans (optionally since a timestamp)."""
+        if since:
+            return self._summary('user_id = ? AND created_at >= ?', (user_id, since))
+        return self._summary('user_id = ?', (user_id,))
+
+
+def new_run_id(user_id: int) -> str:
+    """Run ID the bot hands to a scraper process."""
+    return f"{user_id}-{int(time.time() * 1000)}"
+
+
+_fetch_ledger: Optional[FetchLedger] = None
+
+
+def get_fetch_ledger() -> FetchLedger:
+    """Process-wide ledger tagged with this process's run and user."""
+    global _fetch_ledger
+    if _fetch_ledger is None:
+        _fetch_ledger = FetchLedger()
+    return _fetch_ledger
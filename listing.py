@@ -0,0 +1,272 @@
+"""
+Listing record - one typed, compact representation of a scraped listing
+Used by the scraper, the phone extractor, the results/CRM sync and the bot,
+so CSV rows, CRM rows and Telegram text are all produced in one place.
+"""
+
+import re
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Tuple
+
+# Stage 1 placeholder written by the scraper until the phone extractor runs
+PLACEHOLDER_PHONE = '0501234567'
+
+# CSV column order for scraper / phone extractor output
+CSV_FIELDS = [
+    'id', 'title', 'price', 'rooms', 'size', 'floor', 'address',
+    'phone_number', 'owner_name', 'publish_date', 'listing_url'
+]
+
+# Alternative keys seen in older CSVs and CRM payloads
+FIELD_ALIASES = {
+    'phone_number': ('phone_number', 'phone'),
+    'owner_name': ('owner_name', 'name', 'contact_name'),
+    'listing_url': ('listing_url', 'url'),
+    'address': ('address', 'location'),
+}
+
+PUBLISH_DATE_FORMAT = '%d/%m/%y'
+
+# Other date formats seen in Yad2 pages, older CSVs and CRM rows
+PUBLISH_DATE_INPUT_FORMATS = (
+    PUBLISH_DATE_FORMAT, '%d/%m/%Y', '%d/%m/%Y %H:%M', '%d.%m.%y', '%d.%m.%Y',
+    '%Y-%m-%d', '%Y-%m-%d %H:%M:%S'
+)
+
+
+def _first(row: Dict[str, Any], field: str) -> Any:
+    """Return the first non-empty value among a field and its aliases."""
+    for key in FIELD_ALIASES.get(field, (field,)):
+        value = row.get(key)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+def _to_int(value: Any) -> Optional[int]:
+    """Parse prices/sizes like 4500, '4,500', '4500 ₪' into an int."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    digits = re.sub(r'[^\d]', '', str(value))
+    return int(digits) if digits else None
+
+
+def _to_float(value: Any) -> Optional[float]:
+    """Parse room counts like 3, '3.5', '3.5 חדרים' into a float."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r'\d+(?:\.\d+)?', str(value))
+    return float(match.group()) if match else None
+
+
+def parse_publish_date(value: Any) -> Optional[date]:
+    """Parse DD/MM/YY, DD/MM/YYYY, DD.MM.YYYY or ISO timestamps (Yad2 createdAt/publishDate)."""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+
+    text = str(value).strip()
+    if 'T' in text:
+        try:
+            return datetime.fromisoformat(text.replace('Z', '+00:00')).date()
+        except ValueError:
+            pass
+    for fmt in PUBLISH_DATE_INPUT_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _unparsed_publish_date(value: Any) -> str:
+    """The original text of a publish date parse_publish_date() could not read ('' otherwise)."""
+    if not value or parse_publish_date(value) is not None:
+        return ''
+    return str(value).strip()
+
+
+def _format_number(value: Optional[float]) -> Any:
+    """Render 3.0 as 3 and keep 3.5, so CSV numbers look like they always did."""
+    if value is None:
+        return ''
+    if float(value).is_integer():
+        return int(value)
+    return value
+
+
+@dataclass(slots=True)
+class Listing:
+    """A single listing as it flows from the feed to the CSV, the CRM and Telegram."""
+
+    id: str = ''
+    title: str = ''
+    price: Optional[int] = None
+    rooms: Optional[float] = None
+    size: Optional[int] = None
+    floor: str = ''
+    address: str = ''
+    phone_number: str = ''
+    owner_name: str = ''
+    publish_date: Optional[date] = None
+    listing_url: str = ''
+    publish_date_raw: str = ''  # original text when publish_date could not be parsed
+
+    @classmethod
+    def from_feed_item(cls, item: Dict[str, Any]) -> 'Listing':
+        """Build a listing from a Yad2 feed item (feedData)."""
+        token = item.get('token', '')
+        listing = cls(
+            id=token,
+            price=_to_int(item.get('price')),
+            listing_url=f"https://www.yad2.co.il/item/{token}"
+        )
+
+        # Extract address from the nested structure
+        address_parts = []
+        address_info = item.get('address', {})
+
+        if address_info.get('city', {}).get('text'):
+            address_parts.append(address_info['city']['text'])
+        if address_info.get('neighborhood', {}).get('text'):
+            address_parts.append(address_info['neighborhood']['text'])
+        if address_info.get('street', {}).get('text'):
+            address_parts.append(address_info['street']['text'])
+        if address_info.get('house', {}).get('number'):
+            address_parts.append(str(address_info['house']['number']))
+
+        listing.address = ', '.join(address_parts)
+
+        # rooms is in additionalDetails.roomsCount, size in additionalDetails.squareMeter
+        additional_details = item.get('additionalDetails', {})
+        listing.rooms = _to_float(additional_details.get('roomsCount'))
+        listing.size = _to_int(additional_details.get('squareMeter'))
+
+        # Extract title from metadata or create one
+        meta_data = item.get('metaData', {})
+        if meta_data.get('title'):
+            listing.title = meta_data['title']
+        else:
+            title_parts = []
+            if listing.rooms:
+                title_parts.append(f"{_format_number(listing.rooms)} חדרים")
+            if address_info.get('neighborhood', {}).get('text'):
+                title_parts.append(address_info['neighborhood']['text'])
+            listing.title = ', '.join(title_parts) if title_parts else 'דירה להשכרה'
+
+        # Real phone number is filled in later by the phone extractor
+        listing.phone_number = PLACEHOLDER_PHONE
+        return listing
+
+    @classmethod
+    def from_csv_row(cls, row: Dict[str, Any]) -> 'Listing':
+        """Build a listing from a CSV/CRM row, accepting the legacy key names."""
+        publish_date = _first(row, 'publish_date')
+        return cls(
+            id=str(_first(row, 'id') or ''),
+            title=str(_first(row, 'title') or ''),
+            price=_to_int(_first(row, 'price')),
+            rooms=_to_float(_first(row, 'rooms')),
+            size=_to_int(_first(row, 'size')),
+            floor=str(_first(row, 'floor') if _first(row, 'floor') is not None else ''),
+            address=str(_first(row, 'address') or ''),
+            phone_number=str(_first(row, 'phone_number') or '').strip(),
+            owner_name=str(_first(row, 'owner_name') or ''),
+            publish_date=parse_publish_date(publish_date),
+            listing_url=str(_first(row, 'listing_url') or ''),
+            publish_date_raw=_unparsed_publish_date(publish_date)
+        )
+
+    def apply_page_details(self, details: Dict[str, Any]) -> None:
+        """Fill empty fields from listing-page details (rooms, floor, owner_name, publish_date)."""
+        if details.get('rooms') and self.rooms is None:
+            self.rooms = _to_float(details['rooms'])
+        if details.get('floor') not in (None, '') and not self.floor:
+            self.floor = str(details['floor'])
+        if details.get('owner_name') and not self.owner_name:
+            self.owner_name = details['owner_name']
+        if details.get('publish_date') and self.publish_date is None:
+            self.publish_date = parse_publish_date(details['publish_date'])
+            if self.publish_date is None and not self.publish_date_raw:
+                self.publish_date_raw = _unparsed_publish_date(details['publish_date'])
+
+    @property
+    def needs_page_details(self) -> bool:
+        """True while a field apply_page_details() fills is still empty."""
+        return self.rooms is None or not self.floor or not self.owner_name \
+            or (self.publish_date is None and not self.publish_date_raw)
+
+    @property
+    def has_real_phone(self) -> bool:
+        """True once a real phone (not the stage 1 placeholder) is known."""
+        phone = self.phone_number.strip()
+        return bool(phone) and phone != PLACEHOLDER_PHONE and len(phone) >= 9
+
+    @property
+    def international_phone(self) -> str:
+        """Phone in 972XXXXXXXXX form for wa.me links."""
+        clean_phone = ''.join(filter(str.isdigit, self.phone_number))
+        if clean_phone.startswith('0'):
+            return '972' + clean_phone[1:]
+        if not clean_phone.startswith('972'):
+            return '972' + clean_phone
+        return clean_phone
+
+    @property
+    def whatsapp_link(self) -> str:
+        return f"https://wa.me/{self.international_phone}" if self.phone_number else ''
+
+    @property
+    def publish_date_text(self) -> str:
+        """DD/MM/YY, or the original text when the date could not be parsed."""
+        return self.publish_date.strftime(PUBLISH_DATE_FORMAT) if self.publish_date else self.publish_date_raw
+
+    def to_csv_row(self) -> Dict[str, Any]:
+        """Row for csv.DictWriter(fieldnames=CSV_FIELDS); numbers stay numeric for QUOTE_NONNUMERIC."""
+        return {
+            'id': self.id,
+            'title': self.title,
+            'price': _format_number(self.price),
+            'rooms': _format_number(self.rooms),
+            'size': _format_number(self.size),
+            'floor': self.floor,
+            'address': self.address,
+            'phone_number': self.phone_number,
+            'owner_name': self.owner_name,
+            'publish_date': self.publish_date_text,
+            'listing_url': self.listing_url
+        }
+
+    def to_crm_values(self, scan_type: str, crm_filter_type: str) -> Tuple:
+        """Values for the CRM leads INSERT (see save_lead_to_mysql for the column order)."""
+        return (
+            1,  # Always use CRM userId = 1 (not Telegram ID)
+            self.phone_number,
+            self.owner_name,
+            self.address,
+            str(_format_number(self.rooms)),
+            str(_format_number(self.size)),
+            self.floor,
+            str(_format_number(self.price)),
+            scan_type,  # 'rent' or 'sale'
+            crm_filter_type,  # 'today' or 'all'
+            self.listing_url,
+            self.title,
+            self.whatsapp_link
+        )
+
+    def to_telegram_text(self) -> str:
+        """One line for the WhatsApp links message."""
+        return f"📱 {self.phone_number}: {self.whatsapp_link}"
@@ -0,0 +1,306 @@
+"""
+Listing Watch - התראות בזמן אמת על מודעות חדשות
+Users save searches (saved_searches.py) and get each new private-owner listing
+that matches one as a Telegram message within a minute or two of it appearing,
+instead of polling with full scans. The watcher process
+(yad2bot_scraper/scraper/watcher.py) polls page 1 of every city/mode some search
+covers and writes one alert row per new listing; the bot starts that process
+while any saved search exists and delivers pending alerts to the users whose
+searches match, using the in-memory search index. Both sides share the bot's
+SQLite database.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from listing import Listing
+from saved_searches import SavedSearch, SavedSearchStore, SearchIndex
+from scan_worker import scraper_env
+
+logger = logging.getLogger(__name__)
+
+# The bot's own database, next to this module (the watcher runs from the scraper dir)
+WATCH_DB_PATH = os.environ.get(
+    'YAD2BOT_WATCH_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'yad2bot.db')
+)
+WATCHER_SCRIPT = os.environ.get('YAD2_WATCHER_SCRIPT', "/root/yad2bot-service-scraper/yad2bot_scraper/scraper/watcher.py")
+# How often the bot looks for new alerts
+DELIVERY_POLL_SECONDS = 2.0
+# Delivered alerts are kept this long (their tokens stop a restarted watcher alerting a listing twice)
+ALERT_RETENTION_SECONDS = 7 * 86400
+# An alert some send failed for is tried again after RETRY_SECONDS * 2 ** (attempts - 1),
+# and given up after MAX_DELIVERY_ATTEMPTS (users it already reached are not sent it twice)
+DELIVERY_RETRY_SECONDS = 30.0
+MAX_DELIVERY_ATTEMPTS = 5
+
+
+class WatchStore:
+    """Saved searches and the alerts the watcher produced for them."""
+
+    def __init__(self, db_path: str = WATCH_DB_PATH):
+        self.db_path = db_path
+        self.searches = SavedSearchStore(db_path)
+        self.init_tables()
+
+    def init_tables(self) -> None:
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS watch_alerts (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        city_code TEXT,
+                        mode TEXT,
+                        token TEXT,
+                        listing TEXT, -- JSON of Listing.to_csv_row()
+                        neighborhood TEXT DEFAULT '',
+                        private BOOLEAN DEFAULT 1,
+                        found_at REAL,
+                        delivered_at REAL,
+                        attempts INTEGER DEFAULT 0, -- deliveries where some send failed
+                        retry_at REAL,
+                        UNIQUE (city_code, mode, token)
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_watch_alerts_pending ON watch_alerts(delivered_at)')
+                # Saved-search matching and delivery retries need these (for existing databases)
+                for column in ("neighborhood TEXT DEFAULT ''", "private BOOLEAN DEFAULT 1",
+                               "attempts INTEGER DEFAULT 0", "retry_at REAL"):
+                    try:
+                        conn.execute(f"ALTER TABLE watch_alerts ADD COLUMN {column}")
+                    except sqlite3.OperationalError:
+                        pass
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error initializing watch tables: {e}")
+
+    def watched_pairs(self) -> List[Tuple[str, str]]:
+        """Distinct (city_code, mode) pairs some saved search covers."""
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                return [tuple(row) for row in
+                        conn.execute('SELECT DISTINCT city_code, mode FROM saved_searches ORDER BY city_code, mode')]
+        except Exception as e:
+            logger.error(f"Error reading watched pairs: {e}")
+            return []
+
+    def push_alert(self, city_code: str, mode: str, listing: Listing, neighborhood: str = '',
+                   private: bool = True) -> bool:
+        """Queue a new listing for delivery; False if it was alerted before."""
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                cursor = conn.execute('''
+                    INSERT OR IGNORE INTO watch_alerts (city_code, mode, token, listing, neighborhood, private, found_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (city_code, mode, listing.id, json.dumps(listing.to_csv_row(), ensure_ascii=False),
+                      neighborhood, private, time.time()))
+                conn.commit()
+            return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Error queuing watch alert for {listing.id}: {e}")
+            return False
+
+    def current_index(self, index: SearchIndex, fingerprint: Optional[Tuple]) -> Tuple[SearchIndex, Tuple]:
+        """(index, fingerprint) - the given index if no search changed since fingerprint, else a rebuilt one."""
+        current = self.searches.fingerprint()
+        if current != fingerprint:
+            index = self.searches.build_index()
+            logger.info(f"Saved search index rebuilt: {index.size} searches")
+        return index, current
+
+    def pending_alerts(self, limit: int = 50) -> List[Dict[str, Any]]:
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                conn.row_factory = sqlite3.Row
+                rows = conn.execute('SELECT * FROM watch_alerts WHERE delivered_at IS NULL '
+                                    'AND (retry_at IS NULL OR retry_at <= ?) ORDER BY id LIMIT ?',
+                                    (time.time(), limit)).fetchall()
+            return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error reading pending watch alerts: {e}")
+            return []
+
+    def mark_delivered(self, alert_id: int) -> None:
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                conn.execute('UPDATE watch_alerts SET delivered_at = ? WHERE id = ?', (time.time(), alert_id))
+                conn.execute('DELETE FROM watch_alerts WHERE delivered_at < ?', (time.time() - ALERT_RETENTION_SECONDS,))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error marking watch alert {alert_id} delivered: {e}")
+
+    def mark_failed(self, alert_id: int) -> int:
+        """Count a delivery where some send failed and schedule the retry; returns the attempts so far."""
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                conn.execute('UPDATE watch_alerts SET attempts = attempts + 1, retry_at = ? + ? * (1 << attempts) '
+                             'WHERE id = ?', (time.time(), DELIVERY_RETRY_SECONDS, alert_id))
+                conn.commit()
+                return conn.execute('SELECT attempts FROM watch_alerts WHERE id = ?', (alert_id,)).fetchone()[0]
+        except Exception as e:
+            logger.error(f"Error recording failed delivery of watch alert {alert_id}: {e}")
+            return MAX_DELIVERY_ATTEMPTS
+
+
+def alert_text(listing: Listing, city_name: str, mode: str, language: str = 'hebrew') -> str:
+    """Telegram message of one new listing, in the user's language."""
+    if language == 'hebrew':
+        mode_text = "השכרה" if mode == 'rent' else "מכירה"
+        header = f"🔔 מודעה חדשה - {mode_text} ב{city_name}" if city_name else f"🔔 מודעה חדשה - {mode_text}"
+        rooms_text = "חדרים"
+    else:
+        mode_text = "Rent" if mode == 'rent' else "Sale"
+        header = f"🔔 New listing - {mode_text} in {city_name}" if city_name else f"🔔 New listing - {mode_text}"
+        rooms_text = "rooms"
+    lines = [header]
+    if listing.title:
+        lines.append(f"🏠 {listing.title}")
+    if listing.address:
+        lines.append(f"📍 {listing.address}")
+    if listing.price:
+        lines.append(f"💰 {listing.price:,} ₪")
+    if listing.rooms:
+        lines.append(f"🛏️ {listing.to_csv_row()['rooms']} {rooms_text}")
+    if listing.has_real_phone:
+        lines.append(listing.to_telegram_text())
+    lines.append(f"🔗 {listing.listing_url}")
+    return "\n".join(lines)
+
+
+class WatchService:
+    """Runs the watcher process while saved searches exist and delivers its alerts."""
+
+    def __init__(self, store: Optional[WatchStore] = None):
+        self.store = store or get_watch_store()
+        self.index = SearchIndex()
+        self._index_fingerprint = None
+        self.bot = None
+        self.process = None
+        self.delivered = 0
+        self.delivery_seconds = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, bot) -> None:
+        """Start the delivery loop in the current asyncio loop."""
+        self.bot = bot
+
+        async def watch_loop():
+            while True:
+                try:
+                    await self._supervise()
+                    await self.deliver_pending()
+                except Exception as e:
+                    logger.error(f"Error in listing watch loop: {e}")
+                await asyncio.sleep(DELIVERY_POLL_SECONDS)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(watch_loop())
+            logger.info("Listing watch service started")
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self.process and self.process.returncode is None:
+            self.process.terminate()
+
+    async def _supervise(self) -> None:
+        """Keep exactly one watcher process running while anything is watched."""
+        watched = bool(self.store.watched_pairs())
+        running = self.process is not None and self.process.returncode is None
+        if watched and not running:
+            if self.process is not None:
+                logger.warning(f"Watcher exited with code {self.process.returncode}, restarting")
+            self.process = await asyncio.create_subprocess_exec(
+                "python3", WATCHER_SCRIPT,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+                cwd=os.path.dirname(WATCHER_SCRIPT),
+                # Watcher fetches are recorded in the fetch ledger under run 'watch'
+                env=scraper_env('watch', 0)
+            )
+            logger.info(f"Watcher started, PID {self.process.pid}")
+        elif running and not watched:
+            logger.info("No saved searches left, stopping the watcher")
+            self.process.terminate()
+            await self.process.wait()
+            self.process = None
+
+    async def deliver_pending(self) -> int:
+        """Send pending alerts to the users whose searches match; returns the number of messages sent."""
+        # Imported here: the watcher process imports this module too, and needs no bot database
+        from database import db
+
+        sent = 0
+        for alert in self.store.pending_alerts():
+            listing = Listing.from_csv_row(json.loads(alert['listing']))
+            matched = self.match(alert['city_code'], alert['mode'], listing, alert['neighborhood'], bool(alert['private']))
+            failed = 0
+            for user_id, search in matched.items():
+                # Listings the user already got from a scan are not announced again
+                if not db.get_unseen_listing_urls(user_id, [listing.listing_url]):
+                    continue
+                try:
+                    await self.bot.send_message(chat_id=user_id,
+                                                text=alert_text(listing, search.city_name, alert['mode'],
+                                                                db.get_user_language(user_id)),
+                                                disable_web_page_preview=True)
+                    db.mark_listings_seen(user_id, [listing.listing_url])
+                    sent += 1
+                except Exception as e:
+                    failed += 1
+                    logger.warning(f"Could not send watch alert {alert['id']} to user {user_id}: {e}")
+            if failed:
+                # Kept pending: the retry skips the users marked seen above
+                attempts = self.store.mark_failed(alert['id'])
+                if attempts < MAX_DELIVERY_ATTEMPTS:
+                    continue
+                logger.warning(f"Giving up on watch alert {alert['id']} after {attempts} attempts "
+                               f"({failed} users not reached)")
+                self.store.mark_delivered(alert['id'])
+                continue
+            self.store.mark_delivered(alert['id'])
+            self.delivered += 1
+            self.delivery_seconds += time.time() - alert['found_at']
+        if sent:
+            logger.info(f"Delivered {sent} watch alerts ({self.get_stats()})")
+        return sent
+
+    def match(self, city_code: str, mode: str, listing: Listing, neighborhood: str = '',
+              private: bool = True) -> Dict[int, SavedSearch]:
+        """user_id -> one of their saved searches the listing matches (each user is alerted once)."""
+        self.index, self._index_fingerprint = self.store.current_index(self.index, self._index_fingerprint)
+        return {search.user_id: search for search in
+                self.index.match(city_code, mode, listing.price, listing.rooms, neighborhood, private)}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'saved_searches': self.index.size,
+            'watched_pairs': len(self.store.watched_pairs()),
+            'alerts_delivered': self.delivered,
+            'avg_delivery_seconds': round(self.delivery_seconds / self.delivered, 1) if self.delivered else None,
+            'watcher_running': self.process is not None and self.process.returncode is None,
+        }
+
+
+_store: Optional[WatchStore] = None
+_service: Optional[WatchService] = None
+
+
+def get_watch_store() -> WatchStore:
+    global _store
+    if _store is None:
+        _store = WatchStore()
+    return _store
+
+
+def get_watch_service() -> WatchService:
+    """Process-wide watch service (started from the bot's post_init)."""
+    global _service
+    if _service is None:
+        _service = WatchService()
+    return _service
@@ -13,12 +13,21 @@ from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
 logger = logging.getLogger(__name__)
 
+# Shared scraper data dir, used when a monitor is not given a run's own directory
+DATA_DIR = "/home/ubuntu/yad2bot_scraper/data"
+
 class FixedProgressMonitor:
-    """Fixed progress monitor with real-time JSON progress tracking."""
+    """Fixed progress monitor with real-time JSON progress tracking.
+    
+    data_dir is where the watched scraper writes its progress files and CSVs: a run's
+    own directory (the scraper's --output-dir), so concurrent scans never read each
+    other's files. Use one monitor per run; the cancel flag and counts are per run.
+    """
     
-    def __init__(self):
+    def __init__(self, data_dir: str = DATA_DIR):
         self.cancel_flag = False
         self.current_user_id = None
+        self.data_dir = data_dir
         
     def set_cancel_flag(self, user_id: int):
         """Set cancel flag for specific user."""
@@ -83,7 +92,7 @@ class FixedProgressMonitor:
                     
                     # 1. Read Found count from CSV (most reliable source)
                     if city_name and mode and filter_type:
-                        expected_csv_pattern = f"/home/ubuntu/yad2bot_scraper/data/{city_name}_{mode}_{filter_type}_{today_str}_*.csv"
+                        expected_csv_pattern = f"{self.data_dir}/{city_name}_{mode}_{filter_type}_{today_str}_*.csv"
                         csv_files = glob.glob(expected_csv_pattern)
                         
                         if csv_files:
@@ -149,15 +158,15 @@ class FixedProgressMonitor:
             # Search for progress files with city and mode filter
             if city_name and mode and filter_type:
                 progress_patterns = [
-                    f"/home/ubuntu/yad2bot_scraper/data/{city_name}_{mode}_{filter_type}*{today_str}*_checking_progress.json",
-                    f"/home/ubuntu/yad2bot_scraper/data/{city_name}_{mode}_{filter_type}*progress*.json"
+                    f"{self.data_dir}/{city_name}_{mode}_{filter_type}*{today_str}*_checking_progress.json",
+                    f"{self.data_dir}/{city_name}_{mode}_{filter_type}*progress*.json"
                 ]
                 logger.info(f"[ProgressMonitor] Looking for progress files: {city_name}_{mode}_{filter_type}")
             else:
                 # Fallback to old behavior
                 progress_patterns = [
-                    f"/home/ubuntu/yad2bot_scraper/data/*{today_str}_checking_progress.json",
-                    f"/home/ubuntu/yad2bot_scraper/data/*{today_str}*progress*.json"
+                    f"{self.data_dir}/*{today_str}_checking_progress.json",
+                    f"{self.data_dir}/*{today_str}*progress*.json"
                 ]
                 logger.warning(f"[ProgressMonitor] No city/mode specified, using fallback patterns")
             
@@ -259,7 +268,7 @@ class FixedProgressMonitor:
                         
                         # Check for CSV file with exact filename pattern (only after we have city_name)
                         if city_name:
-                            expected_csv_pattern = f"/home/ubuntu/yad2bot_scraper/data/{city_name}_{mode}_{filter_type}_*.csv"
+                            expected_csv_pattern = f"{self.data_dir}/{city_name}_{mode}_{filter_type}_*.csv"
                             csv_files = glob.glob(expected_csv_pattern)
                             csv_file_exists = len(csv_files) > 0
                             if csv_file_exists:
@@ -415,10 +424,10 @@ class FixedProgressMonitor:
             # Find progress file pattern
             today = datetime.now().strftime('%Y-%m-%d')
             if city_name and mode and filter_type:
-                progress_pattern = f"/home/ubuntu/yad2bot_scraper/data/{city_name}_{mode}_{filter_type}*{today}*_progress.json"
+                progress_pattern = f"{self.data_dir}/{city_name}_{mode}_{filter_type}*{today}*_progress.json"
                 logger.info(f"[ProgressMonitor] Looking for phone progress: {city_name}_{mode}_{filter_type}")
             else:
-                progress_pattern = f"/home/ubuntu/yad2bot_scraper/data/*{today}*_progress.json"
+                progress_pattern = f"{self.data_dir}/*{today}*_progress.json"
                 logger.warning(f"[ProgressMonitor] No city/mode for phone extraction, using fallback")
             
             max_wait = 1800  # 30 minutes maximum
@@ -548,12 +557,12 @@ class FixedProgressMonitor:
             
             today = datetime.now().strftime('%Y-%m-%d')
             if city_name and mode and filter_type:
-                csv_pattern_with_phones = f"/home/ubuntu/yad2bot_scraper/data/{city_name}_{mode}_{filter_type}*{today}*_with_phones.csv"
-                csv_pattern_regular = f"/home/ubuntu/yad2bot_scraper/data/{city_name}_{mode}_{filter_type}*{today}*.csv"
+                csv_pattern_with_phones = f"{self.data_dir}/{city_name}_{mode}_{filter_type}*{today}*_with_phones.csv"
+                csv_pattern_regular = f"{self.data_dir}/{city_name}_{mode}_{filter_type}*{today}*.csv"
                 logger.info(f"[ProgressMonitor] Looking for results file: {city_name}_{mode}_{filter_type}")
             else:
-                csv_pattern_with_phones = f"/home/ubuntu/yad2bot_scraper/data/*{today}*_with_phones.csv"
-                csv_pattern_regular = f"/home/ubuntu/yad2bot_scraper/data/*{today}*.csv"
+                csv_pattern_with_phones = f"{self.data_dir}/*{today}*_with_phones.csv"
+                csv_pattern_regular = f"{self.data_dir}/*{today}*.csv"
                 logger.warning(f"[ProgressMonitor] No city/mode for results file, using fallback")
             
             wait_time = 0
@@ -561,7 +570,7 @@ class FixedProgressMonitor:
             
             while wait_time < timeout and not self.cancel_flag:
                 # Check if phone extraction is in progress by looking at progress file
-                progress_pattern = f"/home/ubuntu/yad2bot_scraper/data/{city_name}_{mode}_{filter_type}*{today}*_progress.json" if city_name else f"/home/ubuntu/yad2bot_scraper/data/*{today}*_progress.json"
+                progress_pattern = f"{self.data_dir}/{city_name}_{mode}_{filter_type}*{today}*_progress.json" if city_name else f"{self.data_dir}/*{today}*_progress.json"
                 progress_files = glob.glob(progress_pattern)
                 
                 if progress_files:
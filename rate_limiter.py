@@ -0,0 +1,364 @@
+"""
+Rate Limiter - מגביל קצב מבוסס Token Bucket
+Sustained requests-per-second budget per upstream, with short bursts allowed.
+The refill rate is halved for every AdaptiveBackoff level above NORMAL, so the
+limiter slows down exactly when the backoff says the upstream is unhappy.
+Usable from asyncio code (await limiter.acquire()) and from threads
+(limiter.acquire_sync()); the clock and sleep functions are injectable so the
+behaviour can be checked deterministically (python3 rate_limiter.py).
+Upstream buckets are shared by every process on the host (scraper subprocesses,
+phone extractors, the watcher, scan workers): their tokens live in a SQLite row,
+so YAD2_FETCH_RPS is the budget of the whole machine, not of each process.
+Telegram sends go through TelegramSendLimiter: one bucket per chat plus one
+bucket for the whole bot, matching Telegram's two flood limits.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from adaptive_backoff import AdaptiveBackoff, BackoffLevel
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.environ.get('YAD2BOT_STATE_DIR', '/home/ubuntu/yad2bot_scraper/data')
+RATE_LIMIT_DB_PATH = os.environ.get('YAD2BOT_RATE_LIMIT_DB', os.path.join(STATE_DIR, 'rate_limits.db'))
+
+# Refill rate multiplier per backoff level (mirrors the doubling of AdaptiveBackoff.level_delays)
+LEVEL_RATE_FACTORS = {
+    BackoffLevel.NORMAL: 1.0,
+    BackoffLevel.WARNING: 0.5,
+    BackoffLevel.MODERATE: 0.25,
+    BackoffLevel.SEVERE: 0.125,
+    BackoffLevel.CRITICAL: 0.0625,
+}
+
+# (requests per second, burst capacity) per upstream, for all processes on this host together
+# (each broker worker machine has its own)
+UPSTREAM_LIMITS: Dict[str, Tuple[float, float]] = {
+    'www.yad2.co.il': (float(os.environ.get('YAD2_FETCH_RPS', '2')), float(os.environ.get('YAD2_FETCH_BURST', '4'))),
+    # Telegram allows about 30 messages per second over all of a bot's chats
+    'telegram': (float(os.environ.get('TELEGRAM_GLOBAL_RPS', '30')), float(os.environ.get('TELEGRAM_GLOBAL_BURST', '30'))),
+}
+DEFAULT_LIMIT = (1.0, 2.0)
+# Upstreams only one process talks to: their bucket stays in memory
+LOCAL_UPSTREAMS = {'telegram'}
+
+# ... and about one message per second in any one chat
+TELEGRAM_CHAT_LIMIT = (float(os.environ.get('TELEGRAM_SEND_RPS', '1')), float(os.environ.get('TELEGRAM_SEND_BURST', '3')))
+# Idle (full) chat buckets are dropped once there are more than this many
+MAX_CHAT_BUCKETS = 1000
+
+
+class TokenBucket:
+    """Token bucket whose refill rate follows an optional AdaptiveBackoff level."""
+
+    def __init__(self, rate: float, capacity: float, backoff: Optional[AdaptiveBackoff] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        if rate <= 0 or capacity < 1:
+            raise ValueError("rate must be positive and capacity at least 1")
+        self.rate = rate
+        self.capacity = capacity
+        self.backoff = backoff
+        self.clock = clock
+        self.tokens = capacity
+        self.last_refill = clock()
+        self.waited_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def effective_rate(self) -> float:
+        """Refill rate after the backoff level is applied."""
+        if self.backoff is None:
+            return self.rate
+        return self.rate * LEVEL_RATE_FACTORS[self.backoff.current_level]
+
+    def _refill(self) -> None:
+        now = self.clock()
+        elapsed = max(0.0, now - self.last_refill)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.effective_rate)
+        self.last_refill = now
+
+    def _take(self, tokens: float) -> float:
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        return (tokens - self.tokens) / self.effective_rate
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Take tokens if available and return 0, else return the seconds until they will be."""
+        if tokens > self.capacity:
+            raise ValueError(f"Cannot acquire {tokens} tokens from a bucket of {self.capacity}")
+        with self._lock:
+            return self._take(tokens)
+
+    async def acquire(self, tokens: float = 1.0, sleep: Callable = asyncio.sleep) -> float:
+        """Wait (without blocking the event loop) until tokens are taken; returns seconds waited."""
+        waited = 0.0
+        wait = self.try_acquire(tokens)
+        while wait > 0:
+            await sleep(wait)
+            waited += wait
+            wait = self.try_acquire(tokens)
+        self.waited_seconds += waited
+        return waited
+
+    def acquire_sync(self, tokens: float = 1.0, sleep: Callable[[float], None] = time.sleep) -> float:
+        """Blocking variant of acquire() for threads and sync code."""
+        waited = 0.0
+        wait = self.try_acquire(tokens)
+        while wait > 0:
+            sleep(wait)
+            waited += wait
+            wait = self.try_acquire(tokens)
+        self.waited_seconds += waited
+        return waited
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            self._refill()
+            return {
+                'rate': self.rate,
+                'effective_rate': round(self.effective_rate, 4),
+                'capacity': self.capacity,
+                'tokens': round(self.tokens, 2),
+                'waited_seconds': round(self.waited_seconds, 2),
+            }
+
+
+class SharedTokenBucket(TokenBucket):
+    """TokenBucket whose tokens live in a SQLite row, so all processes on the host share one budget.
+
+    Every take loads the row, refills and takes in this process and writes it back in
+    one IMMEDIATE transaction (as shared_backoff does). If the database cannot be used,
+    the bucket falls back to this process's own tokens.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float, backoff: Optional[AdaptiveBackoff] = None,
+                 db_path: str = RATE_LIMIT_DB_PATH, clock: Callable[[], float] = time.time):
+        super().__init__(rate, capacity, backoff, clock)
+        self.name = name
+        self.db_path = db_path
+        self.init_table()
+
+    def init_table(self) -> None:
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                        name TEXT PRIMARY KEY,
+                        tokens REAL,
+                        last_refill REAL
+                    )
+                ''')
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error initializing rate limit store: {e}")
+
+    def _take(self, tokens: float) -> float:
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                row = conn.execute('SELECT tokens, last_refill FROM rate_limit_buckets WHERE name = ?',
+                                   (self.name,)).fetchone()
+                if row:
+                    self.tokens, self.last_refill = row
+                wait = super()._take(tokens)
+                conn.execute('INSERT OR REPLACE INTO rate_limit_buckets (name, tokens, last_refill) VALUES (?, ?, ?)',
+                             (self.name, self.tokens, self.last_refill))
+                conn.execute('COMMIT')
+                return wait
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared rate limit for {self.name} unavailable, using this process's bucket: {e}")
+            return super()._take(tokens)
+
+
+_rate_limiters: Dict[str, TokenBucket] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(upstream: str, backoff: Optional[AdaptiveBackoff] = None) -> TokenBucket:
+    """Bucket for an upstream, shared with the host's other processes unless in LOCAL_UPSTREAMS.
+
+    One instance per process; the first caller may attach its backoff.
+    """
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(upstream)
+        if limiter is None:
+            rate, capacity = UPSTREAM_LIMITS.get(upstream, DEFAULT_LIMIT)
+            if upstream in LOCAL_UPSTREAMS:
+                limiter = TokenBucket(rate, capacity, backoff)
+            else:
+                limiter = SharedTokenBucket(upstream, rate, capacity, backoff)
+            _rate_limiters[upstream] = limiter
+            logger.info(f"Rate limiter for {upstream}: {rate}/s, burst {capacity}")
+        elif backoff is not None and limiter.backoff is None:
+            limiter.backoff = backoff
+        return limiter
+
+
+class TelegramSendLimiter:
+    """Per-chat buckets plus one bot-wide bucket for Telegram sends.
+
+    A long result list in one chat waits on that chat's bucket only; other chats
+    keep sending at full speed until the bot-wide limit is reached.
+    """
+
+    def __init__(self, chat_limit: Tuple[float, float] = TELEGRAM_CHAT_LIMIT,
+                 global_bucket: Optional[TokenBucket] = None, clock: Callable[[], float] = time.monotonic):
+        self.chat_limit = chat_limit
+        self.clock = clock
+        self.global_bucket = global_bucket or get_rate_limiter('telegram')
+        self._chats: Dict[int, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def chat_bucket(self, chat_id: int) -> TokenBucket:
+        with self._lock:
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                if len(self._chats) >= MAX_CHAT_BUCKETS:
+                    self._drop_idle()
+                rate, capacity = self.chat_limit
+                bucket = self._chats[chat_id] = TokenBucket(rate, capacity, clock=self.clock)
+            return bucket
+
+    def _drop_idle(self) -> None:
+        # A full bucket behaves exactly like a new one, so forgetting it changes nothing
+        for chat_id, bucket in list(self._chats.items()):
+            if bucket.get_stats()['tokens'] >= bucket.capacity:
+                del self._chats[chat_id]
+
+    async def acquire(self, chat_id: int, sleep: Callable = asyncio.sleep) -> float:
+        """Wait until a message may be sent to chat_id; returns seconds waited."""
+        # The chat's own limit first, so a busy chat does not hold bot-wide tokens while it waits
+        waited = await self.chat_bucket(chat_id).acquire(sleep=sleep)
+        return waited + await self.global_bucket.acquire(sleep=sleep)
+
+
+_telegram_limiter: Optional[TelegramSendLimiter] = None
+
+
+def get_telegram_limiter() -> TelegramSendLimiter:
+    global _telegram_limiter
+    if _telegram_limiter is None:
+        _telegram_limiter = TelegramSendLimiter()
+    return _telegram_limiter
+
+
+class SimulatedClock:
+    """Manual clock for deterministic checks: sleep() just advances time."""
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+    async def async_sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def _run_simulation() -> None:
+    """Deterministic checks of the bucket on a simulated clock."""
+    clock = SimulatedClock()
+
+    # Burst up to capacity, then exactly one request per 1/rate seconds
+    bucket = TokenBucket(rate=2.0, capacity=4, clock=clock)
+    for _ in range(4):
+        assert bucket.acquire_sync(sleep=clock.sleep) == 0.0
+    assert bucket.acquire_sync(sleep=clock.sleep) == 0.5
+    assert clock.now == 0.5
+
+    # 100 requests at 2/s with a burst of 4 take (100 - 4) / 2 seconds
+    clock = SimulatedClock()
+    bucket = TokenBucket(rate=2.0, capacity=4, clock=clock)
+    for _ in range(100):
+        bucket.acquire_sync(sleep=clock.sleep)
+    assert abs(clock.now - 48.0) < 1e-9, clock.now
+
+    # Idle time refills up to capacity, never beyond
+    clock.sleep(3600)
+    assert bucket.get_stats()['tokens'] == 4
+
+    # Each backoff level halves the refill rate
+    backoff = AdaptiveBackoff()
+    clock = SimulatedClock()
+    bucket = TokenBucket(rate=2.0, capacity=1, backoff=backoff, clock=clock)
+    bucket.acquire_sync(sleep=clock.sleep)
+    backoff.current_level = BackoffLevel.MODERATE
+    assert bucket.acquire_sync(sleep=clock.sleep) == 2.0
+    backoff.current_level = BackoffLevel.NORMAL
+    assert bucket.acquire_sync(sleep=clock.sleep) == 0.5
+
+    # The async path waits the same simulated time without blocking the loop
+    clock = SimulatedClock()
+    bucket = TokenBucket(rate=4.0, capacity=1, clock=clock)
+
+    async def send_five():
+        for _ in range(5):
+            await bucket.acquire(sleep=clock.async_sleep)
+
+    asyncio.run(send_five())
+    assert clock.now == 1.0, clock.now
+
+    # Asking for more than the bucket can ever hold is an error, not a hang
+    try:
+        bucket.try_acquire(2)
+        raise AssertionError("expected ValueError")
+    except ValueError:
+        pass
+
+    # Two processes' buckets for the same upstream draw on one shared budget
+    with tempfile.TemporaryDirectory() as state_dir:
+        clock = SimulatedClock(1000.0)
+        db_path = os.path.join(state_dir, 'rate_limits.db')
+        scraper = SharedTokenBucket('www.yad2.co.il', 2.0, 4, db_path=db_path, clock=clock)
+        extractor = SharedTokenBucket('www.yad2.co.il', 2.0, 4, db_path=db_path, clock=clock)
+        for _ in range(4):
+            assert scraper.acquire_sync(sleep=clock.sleep) == 0.0
+        assert extractor.acquire_sync(sleep=clock.sleep) == 0.5
+        assert scraper.try_acquire() == 0.5
+        clock.sleep(3600)
+        assert extractor.try_acquire() == 0.0
+        # Another upstream has its own row
+        assert SharedTokenBucket('other', 1.0, 1, db_path=db_path, clock=clock).try_acquire() == 0.0
+
+    # Telegram: a long list in one chat is paced at 1/s without slowing other chats
+    clock = SimulatedClock()
+    telegram = TelegramSendLimiter(chat_limit=(1.0, 3), global_bucket=TokenBucket(30.0, 30, clock=clock), clock=clock)
+
+    async def send(chat_id, count):
+        for _ in range(count):
+            await telegram.acquire(chat_id, sleep=clock.async_sleep)
+
+    asyncio.run(send(1, 5))
+    assert clock.now == 2.0, clock.now
+    asyncio.run(send(2, 3))
+    assert clock.now == 2.0, clock.now
+
+    # ... while the bot-wide bucket caps the total over many chats
+    # (32/s rather than 30/s: 1/32 is exact in binary, so the simulated waits add up exactly)
+    clock = SimulatedClock()
+    telegram = TelegramSendLimiter(chat_limit=(1.0, 3), global_bucket=TokenBucket(32.0, 32, clock=clock), clock=clock)
+    for chat_id in range(64):
+        asyncio.run(send(chat_id, 1))
+    assert clock.now == 1.0, clock.now
+
+    print("rate_limiter simulation: all checks passed")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    _run_simulation()
@@ -0,0 +1,350 @@
+"""
+Saved Searches - חיפושים שמורים והתאמת מודעות חדשות
+Users save criteria (city, mode, price range, rooms range, neighborhood,
+private owners only) and every new listing the watcher finds is matched
+against all of them. The searches live in the bot's SQLite database; matching
+runs on an in-memory index: hash maps by city/mode and by neighborhood, and
+under each of those fixed-width price buckets holding the searches whose price
+range overlaps the bucket. A listing is only compared with the searches of its
+own city, neighborhood and price bucket, so matching cost does not grow with
+the number of searches elsewhere.
+python3 saved_searches.py benchmarks the index against 10,000 saved searches.
+"""
+
+import logging
+import os
+import random
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# The bot's own database, next to this module
+SEARCH_DB_PATH = os.environ.get(
+    'YAD2BOT_SEARCH_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'yad2bot.db')
+)
+
+# Width of one price bucket per mode (NIS); prices past the last bucket share it
+PRICE_BUCKET_WIDTH = {'rent': 500, 'sale': 250_000}
+PRICE_BUCKETS = 64
+
+_NO_MIN = float('-inf')
+_NO_MAX = float('inf')
+
+
+def normalize_neighborhood(name: Optional[str]) -> str:
+    """Key of a neighborhood name: trimmed, single-spaced, lower-case ('' = any)."""
+    return ' '.join((name or '').split()).lower()
+
+
+@dataclass
+class SavedSearch:
+    """One user's criteria for new listings; None / '' means any."""
+    user_id: int
+    city_code: str
+    mode: str  # 'rent' or 'sale'
+    city_name: str = ''
+    min_price: Optional[int] = None
+    max_price: Optional[int] = None
+    min_rooms: Optional[float] = None
+    max_rooms: Optional[float] = None
+    neighborhood: str = ''
+    private_only: bool = True
+    id: Optional[int] = None
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> 'SavedSearch':
+        return cls(user_id=row['user_id'], city_code=row['city_code'], mode=row['mode'],
+                   city_name=row['city_name'] or '', min_price=row['min_price'], max_price=row['max_price'],
+                   min_rooms=row['min_rooms'], max_rooms=row['max_rooms'],
+                   neighborhood=row['neighborhood'] or '', private_only=bool(row['private_only']), id=row['id'])
+
+    def matches(self, city_code: str, mode: str, price: Optional[int], rooms: Optional[float],
+                neighborhood: str = '', private: bool = True) -> bool:
+        """Plain check of one listing against this search (what the index answers for all searches)."""
+        if (city_code, mode) != (self.city_code, self.mode):
+            return False
+        if self.neighborhood and normalize_neighborhood(self.neighborhood) != normalize_neighborhood(neighborhood):
+            return False
+        if self.private_only and not private:
+            return False
+        if self.min_price is not None or self.max_price is not None:
+            if price is None or not (_bound(self.min_price, _NO_MIN) <= price <= _bound(self.max_price, _NO_MAX)):
+                return False
+        if self.min_rooms is not None or self.max_rooms is not None:
+            if rooms is None or not (_bound(self.min_rooms, _NO_MIN) <= rooms <= _bound(self.max_rooms, _NO_MAX)):
+                return False
+        return True
+
+    def describe(self) -> str:
+        """Hebrew one-liner for the bot's menus."""
+        parts = [f"📍 {self.city_name or self.city_code} - {'השכרה' if self.mode == 'rent' else 'מכירה'}"]
+        if self.neighborhood:
+            parts.append(f"שכונה: {self.neighborhood}")
+        if self.min_price is not None or self.max_price is not None:
+            parts.append(f"מחיר: {_range_text(self.min_price, self.max_price)} ₪")
+        if self.min_rooms is not None or self.max_rooms is not None:
+            parts.append(f"חדרים: {_range_text(self.min_rooms, self.max_rooms)}")
+        return ", ".join(parts)
+
+
+def _bound(value, default: float) -> float:
+    return default if value is None else value
+
+
+def _range_text(low, high) -> str:
+    def fmt(value):
+        return f"{value:,.0f}" if float(value).is_integer() else f"{value:g}"
+    if low is not None and high is not None:
+        return f"{fmt(low)}-{fmt(high)}"
+    return f"{fmt(low)}+" if low is not None else f"עד {fmt(high)}"
+
+
+def price_bucket(mode: str, price: float) -> int:
+    return max(0, min(PRICE_BUCKETS - 1, int(price // PRICE_BUCKET_WIDTH.get(mode, PRICE_BUCKET_WIDTH['rent']))))
+
+
+@dataclass
+class _Group:
+    """Searches of one city/mode/neighborhood: by price bucket, plus those with no price bounds."""
+    buckets: List[List[Tuple]] = field(default_factory=lambda: [[] for _ in range(PRICE_BUCKETS)])
+    any_price: List[Tuple] = field(default_factory=list)
+
+
+class SearchIndex:
+    """In-memory index answering "which saved searches does this listing match".
+
+    Searches change rarely next to how often listings arrive, so the index is
+    rebuilt from the store after a change rather than updated in place.
+    """
+
+    def __init__(self, searches: Iterable[SavedSearch] = ()):
+        self.groups: Dict[Tuple[str, str, str], _Group] = {}
+        self.size = 0
+        for search in searches:
+            self.add(search)
+
+    def add(self, search: SavedSearch) -> None:
+        key = (search.city_code, search.mode, normalize_neighborhood(search.neighborhood))
+        group = self.groups.setdefault(key, _Group())
+        # Bounds as floats so matching is plain comparisons; private_only first for the cheapest reject
+        entry = (search.private_only,
+                 _bound(search.min_price, _NO_MIN), _bound(search.max_price, _NO_MAX),
+                 _bound(search.min_rooms, _NO_MIN), _bound(search.max_rooms, _NO_MAX),
+                 search.min_rooms is not None or search.max_rooms is not None, search)
+        if search.min_price is None and search.max_price is None:
+            lists = [group.any_price]
+        else:
+            first = price_bucket(search.mode, search.min_price or 0)
+            last = price_bucket(search.mode, search.max_price) if search.max_price is not None else PRICE_BUCKETS - 1
+            lists = group.buckets[first:last + 1]
+        for bucket in lists:
+            bucket.append(entry)
+        self.size += 1
+
+    def match(self, city_code: str, mode: str, price: Optional[int], rooms: Optional[float],
+              neighborhood: str = '', private: bool = True) -> List[SavedSearch]:
+        """Saved searches a listing matches."""
+        keys = [(city_code, mode, '')]
+        neighborhood_key = normalize_neighborhood(neighborhood)
+        if neighborhood_key:
+            keys.append((city_code, mode, neighborhood_key))
+
+        matched = []
+        for key in keys:
+            group = self.groups.get(key)
+            if group is None:
+                continue
+            if price is not None:
+                for private_only, min_price, max_price, min_rooms, max_rooms, rooms_bounded, search in \
+                        group.buckets[price_bucket(mode, price)]:
+                    if (private_only and not private) or not (min_price <= price <= max_price):
+                        continue
+                    if rooms_bounded and (rooms is None or not (min_rooms <= rooms <= max_rooms)):
+                        continue
+                    matched.append(search)
+            for private_only, _, _, min_rooms, max_rooms, rooms_bounded, search in group.any_price:
+                if private_only and not private:
+                    continue
+                if rooms_bounded and (rooms is None or not (min_rooms <= rooms <= max_rooms)):
+                    continue
+                matched.append(search)
+        return matched
+
+    def pairs(self) -> List[Tuple[str, str]]:
+        """Distinct (city_code, mode) with at least one search."""
+        return sorted({(city_code, mode) for city_code, mode, _ in self.groups})
+
+
+class SavedSearchStore:
+    """saved_searches table of the bot's database."""
+
+    def __init__(self, db_path: str = SEARCH_DB_PATH):
+        self.db_path = db_path
+        self.init_table()
+
+    def init_table(self) -> None:
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS saved_searches (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id INTEGER,
+                        city_code TEXT,
+                        mode TEXT, -- 'rent' or 'sale'
+                        city_name TEXT,
+                        min_price INTEGER, -- NULL = no bound
+                        max_price INTEGER,
+                        min_rooms REAL,
+                        max_rooms REAL,
+                        neighborhood TEXT DEFAULT '', -- '' = any
+                        private_only BOOLEAN DEFAULT 1,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_saved_searches_user_id ON saved_searches(user_id)')
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error initializing saved searches table: {e}")
+
+    def add(self, search: SavedSearch) -> Optional[int]:
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                cursor = conn.execute('''
+                    INSERT INTO saved_searches (user_id, city_code, mode, city_name, min_price, max_price,
+                                                min_rooms, max_rooms, neighborhood, private_only)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (search.user_id, search.city_code, search.mode, search.city_name, search.min_price,
+                      search.max_price, search.min_rooms, search.max_rooms, search.neighborhood, search.private_only))
+                conn.commit()
+            search.id = cursor.lastrowid
+            logger.info(f"User {search.user_id} saved search {search.id}: {search.describe()}")
+            return search.id
+        except Exception as e:
+            logger.error(f"Error saving search for user {search.user_id}: {e}")
+            return None
+
+    def remove_user_searches(self, user_id: int) -> bool:
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                conn.execute('DELETE FROM saved_searches WHERE user_id = ?', (user_id,))
+                conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error removing saved searches of user {user_id}: {e}")
+            return False
+
+    def _select(self, where: str = '', params: Tuple = ()) -> List[SavedSearch]:
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                conn.row_factory = sqlite3.Row
+                rows = conn.execute(f'SELECT * FROM saved_searches {where} ORDER BY id', params).fetchall()
+            return [SavedSearch.from_row(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error reading saved searches: {e}")
+            return []
+
+    def get_user_searches(self, user_id: int) -> List[SavedSearch]:
+        return self._select('WHERE user_id = ?', (user_id,))
+
+    def load_all(self) -> List[SavedSearch]:
+        return self._select()
+
+    def fingerprint(self) -> Tuple:
+        """(count, newest id) of the table: changes whenever a search is added or removed.
+
+        Cheap enough to check before every use of an index, also from another process.
+        """
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                return tuple(conn.execute('SELECT COUNT(*), MAX(id) FROM saved_searches').fetchone())
+        except Exception as e:
+            logger.error(f"Error reading saved searches: {e}")
+            return ()
+
+    def build_index(self) -> SearchIndex:
+        return SearchIndex(self.load_all())
+
+
+def _random_search(rng: random.Random, cities: List[str], neighborhoods: List[str], user_id: int) -> SavedSearch:
+    mode = rng.choice(['rent', 'sale'])
+    search = SavedSearch(user_id=user_id, city_code=rng.choice(cities), mode=mode,
+                         private_only=rng.random() < 0.8)
+    step = PRICE_BUCKET_WIDTH[mode]
+    roll = rng.random()
+    if roll < 0.6:
+        search.min_price = rng.randrange(4, 24) * step
+        search.max_price = search.min_price + rng.randrange(2, 12) * step
+    elif roll < 0.8:
+        search.max_price = rng.randrange(6, 30) * step
+    elif roll < 0.9:
+        search.min_price = rng.randrange(4, 30) * step
+    if rng.random() < 0.5:
+        search.min_rooms = rng.choice([1, 2, 2.5, 3, 3.5, 4])
+        search.max_rooms = search.min_rooms + rng.choice([0, 1, 1.5, 2])
+    if rng.random() < 0.3:
+        search.neighborhood = rng.choice(neighborhoods)
+    return search
+
+
+def benchmark(searches: int = 10_000, listings: int = 20_000, scan_listings: int = 500,
+              seed: int = 11) -> Dict[str, Any]:
+    """Match random listings against random saved searches, with the index and by scanning them all.
+
+    Returns index build time, per-listing match time (mean and p99, microseconds)
+    for both, and the mean number of matches; the two must agree on every listing
+    both matched.
+    """
+    rng = random.Random(seed)
+    cities = ['5000', '3000', '4000', '9000', '8300', '7900', '7400', '0070']
+    neighborhoods = [f"neighborhood {n}" for n in range(25)]
+    saved = [_random_search(rng, cities, neighborhoods, user_id) for user_id in range(searches)]
+    for search_id, search in enumerate(saved, 1):
+        search.id = search_id
+
+    start = time.perf_counter()
+    index = SearchIndex(saved)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    samples = []
+    for _ in range(listings):
+        mode = rng.choice(['rent', 'sale'])
+        price = rng.randrange(2, 40) * PRICE_BUCKET_WIDTH[mode] + rng.randrange(PRICE_BUCKET_WIDTH[mode])
+        samples.append((rng.choice(cities), mode, price if rng.random() < 0.95 else None,
+                        rng.choice([1, 2, 2.5, 3, 3.5, 4, 4.5, 5, 6, None]),
+                        rng.choice(neighborhoods), rng.random() < 0.7))
+
+    def timed(match, samples) -> Tuple[List[float], List[List[int]]]:
+        times, results = [], []
+        for sample in samples:
+            start = time.perf_counter()
+            found = match(*sample)
+            times.append((time.perf_counter() - start) * 1e6)
+            results.append(sorted(search.id for search in found))
+        times.sort()
+        return times, results
+
+    index_times, index_results = timed(index.match, samples)
+    # The full scan is slow, so it only runs on the first scan_listings listings
+    scan_times, scan_results = timed(lambda *sample: [search for search in saved if search.matches(*sample)],
+                                     samples[:scan_listings])
+    assert index_results[:scan_listings] == scan_results, "index and full scan disagree"
+
+    return {
+        'searches': searches,
+        'build_ms': round(build_ms, 1),
+        'index_mean_us': round(sum(index_times) / len(index_times), 1),
+        'index_p99_us': round(index_times[int(0.99 * len(index_times))], 1),
+        'scan_mean_us': round(sum(scan_times) / len(scan_times), 1),
+        'mean_matches': round(sum(len(result) for result in index_results) / len(index_results), 2),
+    }
+
+
+if __name__ == '__main__':
+    for count in (1_000, 10_000, 100_000):
+        result = benchmark(searches=count)
+        print(result)
+        if count == 10_000:
+            assert result['index_p99_us'] < 1000
@@ -0,0 +1,578 @@
+"""
+Scan Broker - מתווך עבודות סריקה בין הבוט לצמתי עבודה
+Hands scan jobs from the bot to worker nodes and brings their progress and
+results back, so scans no longer have to run on the bot's host (the scraper
+coordinates through local files, globbing and pkill, which only work there).
+Two interchangeable brokers share one interface:
+- SQLiteBroker: a local file; bot and workers on one host (or a shared disk).
+- RedisBroker: any server speaking the Redis protocol (RESP), over a plain
+  socket, so no client library is needed. MiniRedisServer is a small in-process
+  stand-in for development and for the self-check (python3 scan_broker.py).
+Pick one with YAD2_BROKER_URL: sqlite:///path/to/broker.db or
+redis://[user:password@]host:port/db.
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.environ.get('YAD2BOT_STATE_DIR', '/home/ubuntu/yad2bot_scraper/data')
+DEFAULT_BROKER_URL = f"sqlite:///{os.path.join(STATE_DIR, 'scan_broker.db')}"
+
+# A claimed job whose worker has not sent a heartbeat for this long goes back to the queue
+STALE_CLAIM_SECONDS = float(os.environ.get('YAD2_BROKER_STALE_SECONDS', '300'))
+
+
+class BrokerError(Exception):
+    """The broker rejected a command or could not be reached."""
+
+
+class ScanBroker:
+    """Interface of a scan-job broker.
+
+    Jobs are JSON-able dicts. The bot pushes a job and polls its progress and
+    result; a worker pulls a job, heartbeats while it runs, pushes progress and
+    finally one result dict. A job is forgotten once the bot has its result.
+    """
+
+    def push_job(self, job: Dict[str, Any]) -> str:
+        """Queue a job; returns its id."""
+        raise NotImplementedError
+
+    def pull_job(self, worker: str, timeout: float = 5.0) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Claim the oldest queued job for worker, waiting up to timeout seconds; (job_id, job) or None."""
+        raise NotImplementedError
+
+    def heartbeat(self, job_id: str, worker: str) -> None:
+        """Tell the broker the worker is still running the job."""
+        raise NotImplementedError
+
+    def push_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get_progress(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def push_result(self, job_id: str, result: Dict[str, Any]) -> None:
+        """Store the job's result and release its claim."""
+        raise NotImplementedError
+
+    def get_result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def cancel(self, job_id: str) -> None:
+        """Ask the worker running the job to stop it."""
+        raise NotImplementedError
+
+    def is_cancelled(self, job_id: str) -> bool:
+        raise NotImplementedError
+
+    def requeue_stale(self, max_age: float = STALE_CLAIM_SECONDS) -> int:
+        """Queue again the claimed jobs whose worker went silent; returns how many."""
+        raise NotImplementedError
+
+    def forget(self, job_id: str) -> None:
+        """Drop everything stored for a finished job."""
+        raise NotImplementedError
+
+
+class SQLiteBroker(ScanBroker):
+    """Broker in a SQLite file; workers poll it."""
+
+    def __init__(self, db_path: str, poll_seconds: float = 1.0):
+        self.db_path = db_path
+        self.poll_seconds = poll_seconds
+        self.init_table()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_table(self) -> None:
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS broker_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    payload TEXT NOT NULL,
+                    status TEXT DEFAULT 'queued', -- 'queued', 'claimed', 'done'
+                    worker TEXT,
+                    heartbeat_at REAL,
+                    progress TEXT,
+                    result TEXT,
+                    cancelled INTEGER DEFAULT 0
+                )
+            ''')
+            conn.commit()
+
+    def push_job(self, job: Dict[str, Any]) -> str:
+        conn = self._connect()
+        try:
+            return str(conn.execute('INSERT INTO broker_jobs (payload) VALUES (?)', (json.dumps(job),)).lastrowid)
+        finally:
+            conn.close()
+
+    def pull_job(self, worker: str, timeout: float = 5.0) -> Optional[Tuple[str, Dict[str, Any]]]:
+        deadline = time.time() + timeout
+        while True:
+            conn = self._connect()
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                row = conn.execute("SELECT id, payload FROM broker_jobs WHERE status = 'queued' "
+                                   "ORDER BY id LIMIT 1").fetchone()
+                if row:
+                    conn.execute("UPDATE broker_jobs SET status = 'claimed', worker = ?, heartbeat_at = ? WHERE id = ?",
+                                 (worker, time.time(), row['id']))
+                conn.execute('COMMIT')
+            finally:
+                conn.close()
+            if row:
+                return str(row['id']), json.loads(row['payload'])
+            if time.time() >= deadline:
+                return None
+            time.sleep(min(self.poll_seconds, max(0.0, deadline - time.time())))
+
+    def _update(self, sql: str, args: tuple) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute(sql, args).rowcount
+        finally:
+            conn.close()
+
+    def _get(self, job_id: str, column: str) -> Any:
+        conn = self._connect()
+        try:
+            row = conn.execute(f'SELECT {column} FROM broker_jobs WHERE id = ?', (int(job_id),)).fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id: str, worker: str) -> None:
+        self._update('UPDATE broker_jobs SET heartbeat_at = ?, worker = ? WHERE id = ?', (time.time(), worker, int(job_id)))
+
+    def push_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        self._update('UPDATE broker_jobs SET progress = ?, heartbeat_at = ? WHERE id = ?',
+                     (json.dumps(progress), time.time(), int(job_id)))
+
+    def get_progress(self, job_id: str) -> Optional[Dict[str, Any]]:
+        value = self._get(job_id, 'progress')
+        return json.loads(value) if value else None
+
+    def push_result(self, job_id: str, result: Dict[str, Any]) -> None:
+        self._update("UPDATE broker_jobs SET result = ?, status = 'done' WHERE id = ?", (json.dumps(result), int(job_id)))
+
+    def get_result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        value = self._get(job_id, 'result')
+        return json.loads(value) if value else None
+
+    def cancel(self, job_id: str) -> None:
+        self._update('UPDATE broker_jobs SET cancelled = 1 WHERE id = ?', (int(job_id),))
+
+    def is_cancelled(self, job_id: str) -> bool:
+        return bool(self._get(job_id, 'cancelled'))
+
+    def requeue_stale(self, max_age: float = STALE_CLAIM_SECONDS) -> int:
+        requeued = self._update("UPDATE broker_jobs SET status = 'queued', worker = NULL "
+                                "WHERE status = 'claimed' AND heartbeat_at < ?", (time.time() - max_age,))
+        if requeued:
+            logger.warning(f"Re-queued {requeued} scan jobs from silent workers")
+        return requeued
+
+    def forget(self, job_id: str) -> None:
+        self._update('DELETE FROM broker_jobs WHERE id = ?', (int(job_id),))
+
+
+def _encode(value: Any) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode('utf-8')
+
+
+class RespConnection:
+    """Minimal Redis-protocol (RESP2) client over one socket.
+
+    With a password every new connection sends AUTH (with the username too, for
+    Redis 6 ACL users) before SELECT.
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 6379, db: int = 0, timeout: float = 60.0,
+                 username: Optional[str] = None, password: Optional[str] = None):
+        self.address = (host, port)
+        self.db = db
+        self.timeout = timeout
+        self.username = username
+        self.password = password
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._file = None
+
+    def _connect(self) -> None:
+        self._sock = socket.create_connection(self.address, timeout=self.timeout)
+        self._file = self._sock.makefile('rb')
+        try:
+            if self.password:
+                self._send(('AUTH', self.username, self.password) if self.username else ('AUTH', self.password))
+                self._read()
+            if self.db:
+                self._send(('SELECT', self.db))
+                self._read()
+        except BrokerError:
+            # Rejected credentials or database: the next command starts a fresh connection
+            self.close()
+            raise
+
+    def _send(self, args: tuple) -> None:
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in map(_encode, args):
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        self._sock.sendall(b''.join(parts))
+
+    def _read(self) -> Any:
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Connection closed by the broker")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode('utf-8')
+        if kind == b'-':
+            raise BrokerError(rest.decode('utf-8'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            return None if length < 0 else self._file.read(length + 2)[:-2].decode('utf-8')
+        if kind == b'*':
+            length = int(rest)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise BrokerError(f"Unexpected reply from broker: {line!r}")
+
+    def command(self, *args) -> Any:
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self._connect()
+                self._send(args)
+                return self._read()
+            except OSError as e:
+                # Drop the broken socket; the next command reconnects
+                self.close()
+                raise BrokerError(f"Broker at {self.address[0]}:{self.address[1]} unreachable: {e}") from e
+
+    def close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._file = None
+
+
+class RedisBroker(ScanBroker):
+    """Broker on a Redis-protocol server: a list of job ids plus per-job keys.
+
+    New jobs are LPUSHed and workers take the oldest one from the right with
+    BRPOPLPUSH, which moves it into the worker's own processing list in the same
+    command: a worker that dies right after taking a job leaves it there, and
+    requeue_stale() finds it.
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 6379, db: int = 0, prefix: str = 'yad2:',
+                 username: Optional[str] = None, password: Optional[str] = None):
+        self.conn = RespConnection(host, port, db, username=username, password=password)
+        self.prefix = prefix
+
+    def _key(self, *parts: str) -> str:
+        return self.prefix + ':'.join(parts)
+
+    def push_job(self, job: Dict[str, Any]) -> str:
+        job_id = str(self.conn.command('INCR', self._key('job_seq')))
+        self.conn.command('SET', self._key('job', job_id), json.dumps(job))
+        self.conn.command('LPUSH', self._key('jobs'), job_id)
+        return job_id
+
+    def pull_job(self, worker: str, timeout: float = 5.0) -> Optional[Tuple[str, Dict[str, Any]]]:
+        # When the worker was last seen pulling: the age of a job it took but never claimed
+        self.conn.command('HSET', self._key('workers'), worker, str(time.time()))
+        job_id = self.conn.command('BRPOPLPUSH', self._key('jobs'), self._key('processing', worker),
+                                   max(1, int(timeout)))
+        if not job_id:
+            return None
+        self.heartbeat(job_id, worker)
+        payload = self.conn.command('GET', self._key('job', job_id))
+        if payload is None:
+            # Forgotten while queued
+            self._release(job_id)
+            return None
+        return job_id, json.loads(payload)
+
+    def heartbeat(self, job_id: str, worker: str) -> None:
+        self.conn.command('HSET', self._key('claimed'), job_id, f"{worker}|{time.time()}")
+
+    def _release(self, job_id: str) -> None:
+        """Drop a job's claim and take it off its worker's processing list."""
+        claim = self.conn.command('HGET', self._key('claimed'), job_id)
+        if claim:
+            self.conn.command('LREM', self._key('processing', claim.rsplit('|', 1)[0]), 0, job_id)
+        self.conn.command('HDEL', self._key('claimed'), job_id)
+
+    def push_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        self.conn.command('SET', self._key('progress', job_id), json.dumps(progress))
+
+    def get_progress(self, job_id: str) -> Optional[Dict[str, Any]]:
+        value = self.conn.command('GET', self._key('progress', job_id))
+        return json.loads(value) if value else None
+
+    def push_result(self, job_id: str, result: Dict[str, Any]) -> None:
+        self.conn.command('SET', self._key('result', job_id), json.dumps(result))
+        self._release(job_id)
+
+    def get_result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        value = self.conn.command('GET', self._key('result', job_id))
+        return json.loads(value) if value else None
+
+    def cancel(self, job_id: str) -> None:
+        self.conn.command('SET', self._key('cancel', job_id), '1')
+
+    def is_cancelled(self, job_id: str) -> bool:
+        return self.conn.command('GET', self._key('cancel', job_id)) is not None
+
+    def requeue_stale(self, max_age: float = STALE_CLAIM_SECONDS) -> int:
+        workers = self.conn.command('HGETALL', self._key('workers')) or []
+        now = time.time()
+        requeued = 0
+        for worker, last_pull in zip(workers[::2], workers[1::2]):
+            processing = self._key('processing', worker)
+            for job_id in self.conn.command('LRANGE', processing, 0, -1) or []:
+                claim = self.conn.command('HGET', self._key('claimed'), job_id)
+                last_seen = float(claim.rsplit('|', 1)[1]) if claim else float(last_pull)
+                # LREM decides between two bots requeueing the same job at once
+                if now - last_seen > max_age and self.conn.command('LREM', processing, 0, job_id):
+                    self.conn.command('HDEL', self._key('claimed'), job_id)
+                    # Back at the taking end, so it runs next
+                    self.conn.command('RPUSH', self._key('jobs'), job_id)
+                    requeued += 1
+            if now - float(last_pull) > max_age and not self.conn.command('LLEN', processing):
+                self.conn.command('HDEL', self._key('workers'), worker)
+        if requeued:
+            logger.warning(f"Re-queued {requeued} scan jobs from silent workers")
+        return requeued
+
+    def forget(self, job_id: str) -> None:
+        self.conn.command('DEL', *(self._key(kind, job_id) for kind in ('job', 'progress', 'result', 'cancel')))
+        self._release(job_id)
+
+
+def get_scan_broker(url: Optional[str] = None) -> ScanBroker:
+    """Broker for YAD2_BROKER_URL (sqlite:///path or redis://[user:password@]host:port/db)."""
+    url = url or os.environ.get('YAD2_BROKER_URL', DEFAULT_BROKER_URL)
+    parsed = urlparse(url)
+    if parsed.scheme == 'sqlite':
+        return SQLiteBroker(parsed.path)
+    if parsed.scheme == 'redis':
+        db = int(parsed.path.strip('/') or 0)
+        return RedisBroker(parsed.hostname or 'localhost', parsed.port or 6379, db,
+                           username=unquote(parsed.username) if parsed.username else None,
+                           password=unquote(parsed.password) if parsed.password else None)
+    raise ValueError(f"Unsupported broker URL: {url}")
+
+
+class MiniRedisServer:
+    """In-process stand-in for a Redis server: the commands RedisBroker uses, nothing more.
+
+    Single database, no persistence. With a password, connections must AUTH first.
+    For development and the self-check only.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, password: Optional[str] = None):
+        self.data: Dict[str, Any] = {}
+        self.changed = threading.Condition()
+        self.password = password
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                authenticated = server.password is None
+                while True:
+                    args = server._read_command(self.rfile)
+                    if args is None:
+                        return
+                    if args[0].upper() == 'AUTH':
+                        authenticated = args[-1] == server.password
+                        reply = True if authenticated else BrokerError('WRONGPASS invalid username-password pair')
+                    elif not authenticated:
+                        reply = BrokerError('NOAUTH Authentication required.')
+                    else:
+                        try:
+                            reply = server.execute(args)
+                        except Exception as e:
+                            reply = BrokerError(str(e))
+                    self.wfile.write(server._encode_reply(reply))
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = self.server.server_address
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> Tuple[str, int]:
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.address
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    @staticmethod
+    def _read_command(rfile) -> Optional[List[str]]:
+        line = rfile.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int(rfile.readline()[1:-2])
+            args.append(rfile.read(length + 2)[:-2].decode('utf-8'))
+        return args
+
+    @classmethod
+    def _encode_reply(cls, reply: Any) -> bytes:
+        if isinstance(reply, BrokerError):
+            return b'-ERR %s\r\n' % str(reply).encode('utf-8')
+        if reply is True:
+            return b'+OK\r\n'
+        if isinstance(reply, int):
+            return b':%d\r\n' % reply
+        if reply is None:
+            return b'$-1\r\n'
+        if isinstance(reply, list):
+            return b'*%d\r\n' % len(reply) + b''.join(cls._encode_reply(item) for item in reply)
+        data = str(reply).encode('utf-8')
+        return b'$%d\r\n%s\r\n' % (len(data), data)
+
+    def execute(self, args: List[str]) -> Any:
+        name, args = args[0].upper(), args[1:]
+        with self.changed:
+            if name in ('PING', 'SELECT'):
+                return True
+            if name == 'INCR':
+                self.data[args[0]] = int(self.data.get(args[0], 0)) + 1
+                return self.data[args[0]]
+            if name == 'SET':
+                self.data[args[0]] = args[1]
+                return True
+            if name == 'GET':
+                return self.data.get(args[0])
+            if name == 'DEL':
+                return sum(1 for key in args if self.data.pop(key, None) is not None)
+            if name in ('RPUSH', 'LPUSH'):
+                items = self.data.setdefault(args[0], [])
+                for value in args[1:]:
+                    items.append(value) if name == 'RPUSH' else items.insert(0, value)
+                self.changed.notify_all()
+                return len(items)
+            if name == 'BRPOPLPUSH':
+                source, destination = args[0], args[1]
+                deadline = time.time() + float(args[2])
+                while not self.data.get(source):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return None
+                    self.changed.wait(remaining)
+                value = self.data[source].pop()
+                self.data.setdefault(destination, []).insert(0, value)
+                return value
+            if name == 'LRANGE':
+                items = self.data.get(args[0], [])
+                stop = int(args[2])
+                return items[int(args[1]):None if stop == -1 else stop + 1]
+            if name == 'LREM':
+                items = self.data.get(args[0], [])
+                kept = [item for item in items if item != args[2]]
+                self.data[args[0]] = kept
+                return len(items) - len(kept)
+            if name == 'LLEN':
+                return len(self.data.get(args[0], []))
+            if name == 'HSET':
+                self.data.setdefault(args[0], {})[args[1]] = args[2]
+                return 1
+            if name == 'HGET':
+                return self.data.get(args[0], {}).get(args[1])
+            if name == 'HDEL':
+                fields = self.data.get(args[0], {})
+                return sum(1 for field in args[1:] if fields.pop(field, None) is not None)
+            if name == 'HGETALL':
+                return [item for pair in self.data.get(args[0], {}).items() for item in pair]
+        raise BrokerError(f"unknown command '{name}'")
+
+
+def _check_broker(broker: ScanBroker) -> None:
+    """The same job lifecycle, run against any broker implementation."""
+    ids = [broker.push_job({'user_id': user_id, 'mode': 'rent'}) for user_id in (1, 2, 3)]
+    job_id, job = broker.pull_job('node-a', timeout=1)
+    assert job_id == ids[0] and job['user_id'] == 1, (job_id, job)
+
+    broker.push_progress(job_id, {'current_listing': 5, 'total_listings': 20})
+    assert broker.get_progress(job_id)['current_listing'] == 5
+    assert broker.get_result(job_id) is None
+    broker.push_result(job_id, {'status': 'completed', 'csv_text': 'a,b\n1,2\n'})
+    assert broker.get_result(job_id)['csv_text'] == 'a,b\n1,2\n'
+    broker.forget(job_id)
+    assert broker.get_result(job_id) is None
+
+    # A worker that claims a job and goes silent loses it to the next worker
+    stale_id, _ = broker.pull_job('node-b', timeout=1)
+    assert stale_id == ids[1]
+    assert broker.requeue_stale(max_age=-1) == 1
+    assert broker.pull_job('node-c', timeout=1)[0] == ids[1]
+
+    broker.cancel(ids[2])
+    assert broker.is_cancelled(ids[2]) and not broker.is_cancelled(ids[1])
+    assert broker.pull_job('node-a', timeout=1)[0] == ids[2]
+    assert broker.pull_job('node-a', timeout=1) is None
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    logging.basicConfig(level=logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        _check_broker(get_scan_broker(f"sqlite:///{os.path.join(tmp, 'broker.db')}"))
+        print("SQLiteBroker: all checks passed")
+
+    standin = MiniRedisServer(password='s3cret')
+    host, port = standin.start()
+    try:
+        _check_broker(get_scan_broker(f"redis://worker:s3cret@{host}:{port}/0"))
+
+        # Without the password every command is refused
+        try:
+            get_scan_broker(f"redis://{host}:{port}/0").push_job({'user_id': 4})
+            raise AssertionError("expected NOAUTH")
+        except BrokerError as e:
+            assert 'NOAUTH' in str(e), e
+
+        # A worker that dies between taking a job and claiming it does not lose the job
+        broker = get_scan_broker(f"redis://:s3cret@{host}:{port}/0")
+        broker.prefix = 'crash:'  # away from the jobs the lifecycle check left claimed
+        job_id = broker.push_job({'user_id': 5})
+        broker.conn.command('HSET', broker._key('workers'), 'node-d', str(time.time()))
+        assert broker.conn.command('BRPOPLPUSH', broker._key('jobs'), broker._key('processing', 'node-d'), 1) == job_id
+        assert broker.requeue_stale() == 0
+        assert broker.requeue_stale(max_age=-1) == 1
+        assert broker.pull_job('node-e', timeout=1)[0] == job_id
+        broker.push_result(job_id, {'status': 'completed'})
+        assert broker.conn.command('LLEN', broker._key('processing', 'node-e')) == 0
+        print(f"RedisBroker against the stand-in on {host}:{port}: all checks passed")
+    finally:
+        standin.stop()
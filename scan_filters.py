@@ -0,0 +1,178 @@
+"""
+Scan Filters - סינון בצד השרת בכתובת הפיד
+Structured filters of one scan (price range, rooms range, property types,
+neighborhood, private owners only). Everything the Yad2 feed URL can express is
+pushed down into it (price=, rooms=, property=, neighborhood=), so Yad2 drops the
+unwanted listings before they fill the pages we pay ZenRows for. The scraper
+still checks every listing with matches(), which keeps the result set the same
+whether or not Yad2 honored a parameter; private-only has no feed parameter and
+is always checked client-side.
+Filters travel between the bot, the queue, the broker and the scraper's
+--filters argument as canonical JSON (to_json / from_json).
+"""
+
+import json
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Dict, List, Optional, Tuple
+
+from saved_searches import SavedSearch, normalize_neighborhood
+
+# Yad2 feed's value for an open end of a range ("price=-1-6000" = up to 6000)
+OPEN_BOUND = -1
+
+# Yad2 property type codes
+PROPERTY_TYPES = {
+    1: 'דירה',
+    3: 'דירת גן',
+    4: 'גג/פנטהאוז',
+    5: 'דופלקס',
+    6: 'דירת נופש',
+    7: 'מרתף/פרטר',
+    11: 'סטודיו/לופט',
+    22: 'בית פרטי/קוטג\'',
+    39: 'דו משפחתי',
+}
+
+
+def _range_param(low, high) -> Optional[str]:
+    if low is None and high is None:
+        return None
+
+    def fmt(value):
+        if value is None:
+            return str(OPEN_BOUND)
+        return str(int(value)) if float(value).is_integer() else str(value)
+
+    return f"{fmt(low)}-{fmt(high)}"
+
+
+def _range_text(low, high) -> str:
+    def fmt(value):
+        return f"{value:,.0f}" if float(value).is_integer() else str(value)
+
+    if low is None:
+        return f"עד {fmt(high)}"
+    if high is None:
+        return f"{fmt(low)}+"
+    return f"{fmt(low)}-{fmt(high)}"
+
+
+def _to_number(value) -> Optional[float]:
+    try:
+        return float(str(value).replace(',', '')) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+
+@dataclass
+class ScanFilters:
+    """Filters of one scan; None / empty means any."""
+    min_price: Optional[int] = None
+    max_price: Optional[int] = None
+    min_rooms: Optional[float] = None
+    max_rooms: Optional[float] = None
+    property_types: List[int] = field(default_factory=list)
+    neighborhood_code: str = ''  # Yad2 neighborhood id, pushed into the URL
+    neighborhood: str = ''       # neighborhood name, checked client-side
+    private_only: bool = False
+
+    def __post_init__(self):
+        self.property_types = sorted({int(code) for code in self.property_types})
+
+    @classmethod
+    def from_saved_search(cls, search: SavedSearch) -> 'ScanFilters':
+        return cls(min_price=search.min_price, max_price=search.max_price,
+                   min_rooms=search.min_rooms, max_rooms=search.max_rooms,
+                   neighborhood=search.neighborhood, private_only=search.private_only)
+
+    @classmethod
+    def from_json(cls, text: Optional[str]) -> Optional['ScanFilters']:
+        """Filters from to_json() output (None for an empty or missing value)."""
+        if not text:
+            return None
+        data = json.loads(text)
+        known = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in known})
+
+    def to_json(self) -> str:
+        """Canonical JSON: equal filters give equal strings (they are part of scan keys)."""
+        return json.dumps(asdict(self), sort_keys=True, separators=(',', ':'))
+
+    @property
+    def is_empty(self) -> bool:
+        return self == ScanFilters()
+
+    def query_params(self) -> List[Tuple[str, str]]:
+        """The feed URL parameters these filters push down to Yad2."""
+        params = []
+        price = _range_param(self.min_price, self.max_price)
+        if price:
+            params.append(('price', price))
+        rooms = _range_param(self.min_rooms, self.max_rooms)
+        if rooms:
+            params.append(('rooms', rooms))
+        if self.property_types:
+            params.append(('property', ','.join(str(code) for code in self.property_types)))
+        if self.neighborhood_code:
+            params.append(('neighborhood', str(self.neighborhood_code)))
+        return params
+
+    def matches(self, item: Dict[str, Any], private: bool = True) -> bool:
+        """Whether a raw feed item passes the filters (private = the item's private-owner flag)."""
+        if self.private_only and not private:
+            return False
+        if not self.matches_pushed(item):
+            return False
+        neighborhood = ((item.get('address') or {}).get('neighborhood') or {})
+        if self.neighborhood and normalize_neighborhood(neighborhood.get('text')) != \
+                normalize_neighborhood(self.neighborhood):
+            return False
+        return True
+
+    def matches_pushed(self, item: Dict[str, Any]) -> bool:
+        """Whether a raw feed item passes the filters pushed into the feed URL (see query_params).
+
+        The feed should only return items that do, so a failure means Yad2 ignored a parameter;
+        private-only and the neighborhood name are only ever checked client-side.
+        """
+        price = _to_number(item.get('price'))
+        if price is not None:
+            if self.min_price is not None and price < self.min_price:
+                return False
+            if self.max_price is not None and price > self.max_price:
+                return False
+        elif self.min_price is not None or self.max_price is not None:
+            return False
+        additional_details = item.get('additionalDetails') or {}
+        rooms = _to_number(additional_details.get('roomsCount'))
+        if rooms is not None:
+            if self.min_rooms is not None and rooms < self.min_rooms:
+                return False
+            if self.max_rooms is not None and rooms > self.max_rooms:
+                return False
+        elif self.min_rooms is not None or self.max_rooms is not None:
+            return False
+        if self.property_types:
+            property_id = (additional_details.get('property') or {}).get('id')
+            if property_id is not None and int(property_id) not in self.property_types:
+                return False
+        neighborhood = ((item.get('address') or {}).get('neighborhood') or {})
+        if self.neighborhood_code and neighborhood.get('id') is not None \
+                and str(neighborhood['id']) != str(self.neighborhood_code):
+            return False
+        return True
+
+    def describe(self) -> str:
+        """Hebrew one-liner for status messages ('' without filters)."""
+        parts = []
+        if self.min_price is not None or self.max_price is not None:
+            parts.append(f"מחיר: {_range_text(self.min_price, self.max_price)} ₪")
+        if self.min_rooms is not None or self.max_rooms is not None:
+            parts.append(f"חדרים: {_range_text(self.min_rooms, self.max_rooms)}")
+        if self.property_types:
+            parts.append("סוג: " + "/".join(PROPERTY_TYPES.get(code, str(code)) for code in self.property_types))
+        if self.neighborhood:
+            parts.append(f"שכונה: {self.neighborhood}")
+        if self.private_only:
+            parts.append("בעלים פרטיים בלבד")
+        return ", ".join(parts)
@@ -0,0 +1,340 @@
+"""
+Scan Queue - תור סריקות עם עובדים, הוגנות בין משתמשים ועדיפויות
+Every scan (interactive or scheduled) becomes a row in a scan_jobs table and is
+run by one of a fixed number of async workers, so a burst of users can no longer
+start more scraper subprocesses than the host and the ZenRows keys can take.
+Jobs are ordered by priority class (test scans, then full scans, then scheduled
+scans), and inside a class round-robin across users: every user's first queued
+job goes before anyone's second. A user never has two jobs running at once.
+The table lives in the bot's SQLite database, so queued jobs survive a restart;
+jobs that were running when the bot stopped are queued again on start-up.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# The bot's own database, next to this module
+QUEUE_DB_PATH = os.environ.get(
+    'YAD2BOT_QUEUE_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'yad2bot.db')
+)
+# Scans (scraper + phone extractor pipelines) run at once; every run writes into
+# its own directory (scan_worker.run_dir), so they never see each other's files
+SCAN_WORKERS = int(os.environ.get('YAD2_SCAN_WORKERS', '3'))
+
+# Priority classes, lower runs first
+PRIORITY_TEST = 0
+PRIORITY_FULL = 1
+PRIORITY_SCHEDULED = 2
+PRIORITY_NAMES = {PRIORITY_TEST: 'test', PRIORITY_FULL: 'full', PRIORITY_SCHEDULED: 'scheduled'}
+
+# Duration assumed for ETAs until jobs of a class have finished
+DEFAULT_JOB_SECONDS = 180.0
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+
+def scan_priority(kind: str, filter_type: str, page_limit: Optional[int] = None) -> int:
+    """Priority class of a scan: one-page test scans first, scheduled scans last."""
+    if kind == 'scheduled':
+        return PRIORITY_SCHEDULED
+    if filter_type == 'test' or page_limit == 1:
+        return PRIORITY_TEST
+    return PRIORITY_FULL
+
+
+@dataclass
+class ScanJob:
+    """One queued or running scan."""
+    id: int
+    user_id: int
+    kind: str  # 'interactive' or 'scheduled'
+    priority: int
+    mode: str
+    filter_type: str
+    city_code: Optional[str] = None
+    page_limit: Optional[int] = None
+    followers: List[int] = field(default_factory=list)
+    chat_id: Optional[int] = None
+    filters: Optional[str] = None  # ScanFilters.to_json()
+    status: str = JOB_QUEUED
+    enqueued_at: float = 0.0
+    started_at: Optional[float] = None
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> 'ScanJob':
+        return cls(
+            id=row['id'], user_id=row['user_id'], kind=row['kind'], priority=row['priority'],
+            mode=row['mode'], filter_type=row['filter_type'], city_code=row['city_code'],
+            page_limit=row['page_limit'], followers=json.loads(row['followers'] or '[]'),
+            chat_id=row['chat_id'], status=row['status'], enqueued_at=row['enqueued_at'],
+            started_at=row['started_at'], filters=row['filters']
+        )
+
+
+# Jobs a user started within this window count against their place in the queue
+FAIRNESS_WINDOW_SECONDS = 3600
+
+# Queued jobs in run order: priority class, then round-robin across users (each
+# user's 1st, 2nd, ... queued job, counting the jobs they started recently), then age.
+_RUN_ORDER_SQL = '''
+    WITH ranked AS (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY priority, id) AS user_rank
+        FROM scan_jobs
+        WHERE status = 'queued'
+    ), served AS (
+        SELECT user_id, COUNT(*) AS recent FROM scan_jobs
+        WHERE status != 'queued' AND started_at > :since
+        GROUP BY user_id
+    )
+    SELECT ranked.* FROM ranked LEFT JOIN served ON served.user_id = ranked.user_id
+    {where}
+    ORDER BY ranked.priority, ranked.user_rank + COALESCE(served.recent, 0), ranked.id
+'''
+# Users with a running job are skipped when claiming (one session per user)
+_CLAIM_SQL = _RUN_ORDER_SQL.format(
+    where="WHERE ranked.user_id NOT IN (SELECT user_id FROM scan_jobs WHERE status = 'running')"
+) + ' LIMIT 1'
+_QUEUE_ORDER_SQL = _RUN_ORDER_SQL.format(where='')
+
+
+class ScanQueue:
+    """Persistent, fair scan queue served by a fixed pool of async workers."""
+
+    def __init__(self, db_path: str = QUEUE_DB_PATH, workers: int = SCAN_WORKERS):
+        self.db_path = db_path
+        self.workers = max(1, workers)
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self.init_table()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_table(self) -> None:
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS scan_jobs (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id INTEGER NOT NULL,
+                        kind TEXT NOT NULL, -- 'interactive', 'scheduled'
+                        priority INTEGER NOT NULL,
+                        mode TEXT,
+                        filter_type TEXT,
+                        city_code TEXT,
+                        page_limit INTEGER,
+                        followers TEXT, -- JSON list of user ids sharing a scheduled scan
+                        chat_id INTEGER,
+                        filters TEXT, -- ScanFilters JSON pushed into the feed URL
+                        status TEXT DEFAULT 'queued', -- 'queued', 'running', 'done', 'failed', 'cancelled'
+                        enqueued_at REAL,
+                        started_at REAL,
+                        finished_at REAL
+                    )
+                ''')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_scan_jobs_status ON scan_jobs(status, priority)')
+                # Added with scan filters (for existing databases)
+                try:
+                    cursor.execute('ALTER TABLE scan_jobs ADD COLUMN filters TEXT')
+                except sqlite3.OperationalError:
+                    pass
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error initializing scan queue: {e}")
+
+    def enqueue(self, user_id: int, kind: str, mode: str, filter_type: str, city_code: Optional[str] = None,
+                page_limit: Optional[int] = None, followers: Optional[List[int]] = None,
+                chat_id: Optional[int] = None, filters: Optional[str] = None) -> ScanJob:
+        """Add a scan to the queue and wake a worker."""
+        priority = scan_priority(kind, filter_type, page_limit)
+        now = time.time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute('''
+                INSERT INTO scan_jobs (user_id, kind, priority, mode, filter_type, city_code, page_limit,
+                                       followers, chat_id, filters, status, enqueued_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'queued', ?)
+            ''', (user_id, kind, priority, mode, filter_type, city_code, page_limit,
+                  json.dumps(list(followers or [])), chat_id if chat_id is not None else user_id, filters, now))
+            job_id = cursor.lastrowid
+        finally:
+            conn.close()
+        if self._wakeup:
+            self._wakeup.set()
+        logger.info(f"Queued {PRIORITY_NAMES[priority]} scan job {job_id} for user {user_id}")
+        return ScanJob(id=job_id, user_id=user_id, kind=kind, priority=priority, mode=mode,
+                       filter_type=filter_type, city_code=city_code, page_limit=page_limit,
+                       followers=list(followers or []), chat_id=chat_id, filters=filters, enqueued_at=now)
+
+    def claim(self) -> Optional[ScanJob]:
+        """Atomically take the next job to run, or None if nothing can run now."""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            running = conn.execute("SELECT COUNT(*) FROM scan_jobs WHERE status = 'running'").fetchone()[0]
+            row = (conn.execute(_CLAIM_SQL, {'since': time.time() - FAIRNESS_WINDOW_SECONDS}).fetchone()
+                   if running < self.workers else None)
+            if row is None:
+                conn.execute('ROLLBACK')
+                return None
+            now = time.time()
+            conn.execute("UPDATE scan_jobs SET status = 'running', started_at = ? WHERE id = ?", (now, row['id']))
+            conn.execute('COMMIT')
+            job = ScanJob.from_row(row)
+            job.status, job.started_at = JOB_RUNNING, now
+            return job
+        finally:
+            conn.close()
+
+    def finish(self, job_id: int, status: str = JOB_DONE) -> None:
+        conn = self._connect()
+        try:
+            conn.execute('UPDATE scan_jobs SET status = ?, finished_at = ? WHERE id = ?',
+                         (status, time.time(), job_id))
+        finally:
+            conn.close()
+        if self._wakeup:
+            self._wakeup.set()
+
+    def recover(self) -> int:
+        """Queue again the jobs that were running when the bot stopped; returns how many."""
+        conn = self._connect()
+        try:
+            cursor = conn.execute("UPDATE scan_jobs SET status = 'queued', started_at = NULL WHERE status = 'running'")
+            recovered = cursor.rowcount
+        finally:
+            conn.close()
+        if recovered:
+            logger.warning(f"Re-queued {recovered} scan jobs interrupted by a restart")
+        return recovered
+
+    def cancel_user(self, user_id: int) -> int:
+        """Cancel the user's queued (not yet running) jobs; returns how many."""
+        conn = self._connect()
+        try:
+            cursor = conn.execute("UPDATE scan_jobs SET status = 'cancelled', finished_at = ? "
+                                  "WHERE user_id = ? AND status = 'queued'", (time.time(), user_id))
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def has_pending(self, user_id: int) -> bool:
+        """Whether the user has a queued or running job."""
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT 1 FROM scan_jobs WHERE user_id = ? AND status IN ('queued', 'running') "
+                                "LIMIT 1", (user_id,)).fetchone() is not None
+        finally:
+            conn.close()
+
+    def pending_count(self) -> int:
+        """Queued plus running jobs."""
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM scan_jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+        finally:
+            conn.close()
+
+    def average_duration(self, priority: int, sample: int = 50) -> float:
+        """Mean run time of the last finished jobs of a priority class."""
+        conn = self._connect()
+        try:
+            row = conn.execute('''
+                SELECT AVG(finished_at - started_at) FROM (
+                    SELECT finished_at, started_at FROM scan_jobs
+                    WHERE priority = ? AND status = 'done' AND started_at IS NOT NULL
+                    ORDER BY id DESC LIMIT ?
+                )
+            ''', (priority, sample)).fetchone()
+            return row[0] or DEFAULT_JOB_SECONDS
+        finally:
+            conn.close()
+
+    def position(self, job_id: int) -> Tuple[int, float]:
+        """(jobs ahead in the queue, estimated seconds until the job starts).
+
+        The estimate assumes jobs ahead take the recent average for their class
+        and that a worker frees up every average-duration / workers seconds.
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute(_QUEUE_ORDER_SQL, {'since': time.time() - FAIRNESS_WINDOW_SECONDS}).fetchall()
+            running = conn.execute("SELECT COUNT(*) FROM scan_jobs WHERE status = 'running'").fetchone()[0]
+        finally:
+            conn.close()
+        ids = [row['id'] for row in rows]
+        if job_id not in ids:
+            return 0, 0.0
+        ahead = ids.index(job_id)
+        waiting_for = ahead + 1 - max(0, self.workers - running)
+        if waiting_for <= 0:
+            return ahead, 0.0
+        durations = {priority: self.average_duration(priority) for priority in {row['priority'] for row in rows}}
+        mean = sum(durations[row['priority']] for row in rows[:ahead + 1]) / (ahead + 1)
+        return ahead, math.ceil(waiting_for / self.workers) * mean
+
+    def get_stats(self) -> Dict[str, Any]:
+        conn = self._connect()
+        try:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM scan_jobs "
+                                       "WHERE status IN ('queued', 'running') GROUP BY status").fetchall())
+        finally:
+            conn.close()
+        return {'workers': self.workers, 'queued': counts.get(JOB_QUEUED, 0), 'running': counts.get(JOB_RUNNING, 0)}
+
+    def start(self, run_job: Callable[[ScanJob], Awaitable[Any]], poll_seconds: float = 5.0) -> None:
+        """Start the workers in the current asyncio loop; run_job(job) runs one scan to completion."""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+
+        async def worker(number: int):
+            while True:
+                try:
+                    job = self.claim()
+                except Exception as e:
+                    logger.error(f"Scan worker {number} could not claim a job: {e}")
+                    job = None
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), poll_seconds)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                logger.info(f"Scan worker {number} running job {job.id} ({PRIORITY_NAMES[job.priority]}) "
+                            f"for user {job.user_id}, waited {job.started_at - job.enqueued_at:.0f}s")
+                try:
+                    await run_job(job)
+                except asyncio.CancelledError:
+                    # Shutting down: the job stays 'running' and recover() queues it again
+                    raise
+                except Exception as e:
+                    logger.error(f"Scan job {job.id} failed: {e}")
+                    self.finish(job.id, JOB_FAILED)
+                else:
+                    self.finish(job.id, JOB_DONE)
+
+        self._tasks = [asyncio.create_task(worker(number)) for number in range(self.workers)]
+        logger.info(f"Scan queue started with {self.workers} workers ({self.get_stats()})")
+
+    def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Scan Worker - צומת עבודה שמריץ סריקות מהמתווך
+Runs on any machine with the scraper checked out: pulls scan jobs from the
+broker (see scan_broker.py), runs the scraper subprocess locally, pushes its
+progress file while it runs and, when it exits, pushes one result with the
+results CSV and the run's fetch-ledger rows. Add machines to add capacity.
+Each run writes into its own directory under DATA_DIR/runs (the scraper's
+--output-dir), so runs never see or delete each other's progress files and CSVs.
+
+    YAD2_BROKER_URL=redis://broker-host:6379/0 python3 scan_worker.py --node node-2
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from fetch_ledger import FetchLedger
+from scan_broker import ScanBroker, get_scan_broker
+from zenrows_key_pool import load_api_keys
+
+logger = logging.getLogger(__name__)
+
+SCRAPER_SCRIPT = os.environ.get('YAD2_SCRAPER_SCRIPT', "/root/yad2bot-service-scraper/yad2bot_scraper/scraper/main.py")
+# Where the scraper writes its progress files and CSVs
+DATA_DIR = os.environ.get('YAD2_SCRAPER_DATA_DIR', "/home/ubuntu/yad2bot_scraper/data")
+# One directory per run id under here (see run_dir)
+RUNS_DIR = os.path.join(DATA_DIR, 'runs')
+# Run directories left behind (crashed bot, unread results) are removed after this long
+RUN_DIR_MAX_AGE_SECONDS = 24 * 3600
+# How often progress is pushed (it doubles as the job's heartbeat)
+PROGRESS_SECONDS = 5.0
+
+# City code -> name used in the scraper's output file names
+CITY_FILE_NAMES = {
+    '5000': 'TelAviv',
+    '4000': 'Haifa',
+    '3000': 'Jerusalem',
+    '9000': 'BeerSheva',
+    '7400': 'Netanya',
+    '8300': 'RishonLeZion',
+    '7900': 'PetahTikva',
+    '0070': 'Ashdod'
+}
+
+
+def scraper_command(mode: str, filter_type: str, city_code: Optional[str] = None,
+                    page_limit: Optional[int] = None, incremental: bool = False,
+                    filters: Optional[str] = None, output_dir: Optional[str] = None) -> List[str]:
+    """Command line of one scraper run (it runs the phone extractor itself before exiting).
+
+    filters is ScanFilters.to_json() output; the scraper pushes it into the feed URL.
+    output_dir is the run's own directory (run_dir); without it the scraper uses the shared DATA_DIR.
+    """
+    command = ["python3", SCRAPER_SCRIPT, "--mode", mode, "--filter", filter_type]
+    if city_code:
+        command.extend(["--city", city_code])
+    if page_limit:
+        command.extend(["--max-pages", str(page_limit)])
+    if incremental:
+        command.append("--incremental")
+    if filters:
+        command.extend(["--filters", filters])
+    if output_dir:
+        command.extend(["--output-dir", output_dir])
+    return command
+
+
+def scraper_env(run_id: str, user_id: int) -> Dict[str, str]:
+    """Environment of a scraper run: the key pool and the ledger tags."""
+    return {
+        **os.environ,
+        'ZENROWS_API_KEYS': ','.join(load_api_keys()),
+        'YAD2BOT_RUN_ID': run_id,
+        'YAD2BOT_USER_ID': str(user_id)
+    }
+
+
+def run_dir(run_id: str) -> str:
+    """The run's own output directory (created on first use)."""
+    path = os.path.join(RUNS_DIR, run_id)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def remove_run_dir(path: str) -> None:
+    """Remove a run directory once its results were read (only ever under RUNS_DIR)."""
+    if os.path.dirname(os.path.abspath(path)) == os.path.abspath(RUNS_DIR):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def purge_run_dirs(max_age: float = RUN_DIR_MAX_AGE_SECONDS) -> int:
+    """Remove run directories older than max_age seconds; returns how many were removed."""
+    removed = 0
+    cutoff = time.time() - max_age
+    for path in glob.glob(os.path.join(RUNS_DIR, '*')):
+        try:
+            if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def stop_process_group(pid: int, sig: int = signal.SIGTERM) -> bool:
+    """Signal a scraper started with start_new_session=True together with its phone extractor.
+
+    Only this run's processes get the signal, never other scans; False if it already exited.
+    """
+    try:
+        os.killpg(pid, sig)
+        return True
+    except ProcessLookupError:
+        return False
+
+
+def _file_prefix(city_name: Optional[str], mode: str, filter_type: str, directory: str = DATA_DIR) -> str:
+    today = datetime.now().strftime('%Y-%m-%d')
+    return os.path.join(directory, f"{city_name}_{mode}_{filter_type}*{today}*")
+
+
+def find_results_file(city_name: Optional[str], mode: str, filter_type: str,
+                      directory: str = DATA_DIR) -> Optional[str]:
+    """Newest results CSV of a finished run: the _with_phones file if extraction produced one.
+
+    Pass the run's own directory (run_dir); in the shared DATA_DIR the newest match
+    may belong to another scan of the same city/mode/filter.
+    """
+    prefix = _file_prefix(city_name, mode, filter_type, directory)
+    with_phones = glob.glob(f"{prefix}_with_phones.csv")
+    if with_phones:
+        return max(with_phones, key=os.path.getmtime)
+    regular = [f for f in glob.glob(f"{prefix}.csv") if '_with_phones' not in f]
+    return max(regular, key=os.path.getmtime) if regular else None
+
+
+def read_progress(city_name: Optional[str], mode: str, filter_type: str,
+                  directory: str = DATA_DIR) -> Dict[str, Any]:
+    """Contents of the run's newest progress file ({} before the scraper wrote one)."""
+    files = glob.glob(f"{_file_prefix(city_name, mode, filter_type, directory)}_progress.json")
+    if not files:
+        return {}
+    try:
+        with open(max(files, key=os.path.getmtime), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def run_job(job: Dict[str, Any], on_progress: Callable[[Dict[str, Any]], None],
+            should_cancel: Callable[[], bool], node: str) -> Dict[str, Any]:
+    """Run one scan job on this node and return its result dict."""
+    mode, filter_type, city_code = job['mode'], job['filter_type'], job.get('city_code')
+    city_name = CITY_FILE_NAMES.get(city_code, 'Unknown') if city_code else None
+    started = time.time()
+    purge_run_dirs()
+    output_dir = run_dir(job['run_id'])
+
+    command = scraper_command(mode, filter_type, city_code, job.get('page_limit'), job.get('incremental', False),
+                              job.get('filters'), output_dir)
+    logger.info(f"[{node}] Running job for user {job['user_id']}: {' '.join(command)}")
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, cwd=os.path.dirname(SCRAPER_SCRIPT),
+                                   env=scraper_env(job['run_id'], job['user_id']),
+                                   stdout=subprocess.DEVNULL, stderr=stderr, start_new_session=True)
+        cancelled = False
+        while process.poll() is None:
+            if should_cancel():
+                logger.info(f"[{node}] Job {job['run_id']} cancelled, stopping the scraper")
+                stop_process_group(process.pid)
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    stop_process_group(process.pid, signal.SIGKILL)
+                    process.wait()
+                cancelled = True
+                break
+            on_progress(read_progress(city_name, mode, filter_type, output_dir))
+            time.sleep(PROGRESS_SECONDS)
+        if process.returncode:
+            stderr.seek(0)
+            logger.error(f"[{node}] Scraper exited with code {process.returncode}: "
+                         f"{stderr.read()[-2000:].decode('utf-8', errors='ignore')}")
+
+    result = {
+        'status': 'cancelled' if cancelled else 'no_results',
+        'node': node,
+        'returncode': process.returncode,
+        'duration': round(time.time() - started, 1),
+        'csv_name': None,
+        'csv_text': None,
+        'ledger_rows': FetchLedger(run_id=job['run_id']).export_run(job['run_id']),
+    }
+    results_file = None if cancelled else find_results_file(city_name, mode, filter_type, output_dir)
+    if results_file:
+        with open(results_file, 'r', encoding='utf-8') as f:
+            result.update(status='completed', csv_name=os.path.basename(results_file), csv_text=f.read())
+    # The CSV text travels in the result; nothing else reads this run's directory
+    remove_run_dir(output_dir)
+    return result
+
+
+def serve(broker: ScanBroker, node: str, once: bool = False) -> None:
+    """Pull and run jobs until interrupted (or after one job with once=True)."""
+    logger.info(f"[{node}] Worker started, waiting for scan jobs")
+    while True:
+        pulled = broker.pull_job(node, timeout=PROGRESS_SECONDS * 2)
+        if pulled is None:
+            continue
+        job_id, job = pulled
+
+        def on_progress(progress: Dict[str, Any]) -> None:
+            broker.push_progress(job_id, {**progress, 'node': node})
+            broker.heartbeat(job_id, node)
+
+        try:
+            result = run_job(job, on_progress, lambda: broker.is_cancelled(job_id), node)
+        except Exception as e:
+            logger.error(f"[{node}] Job {job_id} failed: {e}")
+            result = {'status': 'failed', 'node': node, 'error': str(e), 'ledger_rows': []}
+        broker.push_result(job_id, result)
+        logger.info(f"[{node}] Job {job_id} finished: {result['status']}")
+        if once:
+            return
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Run scan jobs from the broker on this machine')
+    parser.add_argument('--broker', default=None, help='Broker URL (default: YAD2_BROKER_URL)')
+    parser.add_argument('--node', default=socket.gethostname(), help='Name of this worker node')
+    parser.add_argument('--once', action='store_true', help='Exit after one job')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_api_keys()  # fail now, not on the first job, when no ZenRows key is configured
+    serve(get_scan_broker(args.broker), args.node, once=args.once)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,10 +2,13 @@
 New scheduler module for Yad2bot using APScheduler
 """
 import logging
+import os
+import time
 from datetime import datetime
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from database import db
+from scan_dispatcher import ScanDispatcher
 
 logger = logging.getLogger(__name__)
 
@@ -16,11 +19,16 @@ class BotScheduler:
         self.scheduler = AsyncIOScheduler()
         self.scraper_manager = None
         self.bot_instance = None
+        # Due scans are queued and started as scan capacity allows, not all at the trigger second
+        self.dispatcher = ScanDispatcher()
         logger.info("BotScheduler initialized with APScheduler")
     
     def set_scraper_manager(self, scraper_manager):
         """Set scraper manager instance"""
         self.scraper_manager = scraper_manager
+        # Scans start as fast as the scan queue's workers take them, so start-delay
+        # estimates use the same capacity
+        self.dispatcher.capacity = scraper_manager.queue.workers
         logger.info("Scraper manager set in scheduler")
     
     def set_bot_instance(self, bot):
@@ -32,7 +40,12 @@ class BotScheduler:
         """Start the scheduler and load schedules from database"""
         try:
             self.scheduler.start()
-            logger.info("✅ Scheduler started")
+            self.dispatcher.start(
+                launch=self._launch_scheduled_scrape,
+                running_count=self._running_scan_count,
+                on_queued=self._notify_queued
+            )
+            logger.info(f"✅ Scheduler started (scan capacity {self.dispatcher.capacity})")
             
             # Load existing schedules from database
             await self.load_schedules_from_database()
@@ -44,6 +57,7 @@ class BotScheduler:
         """Stop the scheduler"""
         try:
             self.scheduler.shutdown()
+            self.dispatcher.stop()
             logger.info("Scheduler stopped")
         except Exception as e:
             logger.error(f"Error stopping scheduler: {e}")
@@ -69,7 +83,7 @@ class BotScheduler:
                 trigger = CronTrigger(hour=hour, minute=minute, timezone='Asia/Jerusalem')
                 
                 self.scheduler.add_job(
-                    self._run_scheduled_scrape,
+                    self._enqueue_scheduled_scrape,
                     trigger=trigger,
                     id=job_id,
                     args=[user_id, mode, filter_type, city],
@@ -81,78 +95,113 @@ class BotScheduler:
         except Exception as e:
             logger.error(f"Error loading schedules from database: {e}")
     
-    async def _run_scheduled_scrape(self, user_id: int, mode: str, filter_type: str, city: str):
-        """Run scheduled scrape - called by APScheduler"""
+    async def _enqueue_scheduled_scrape(self, user_id: int, mode: str, filter_type: str, city: str):
+        """Queue a due scheduled scrape - called by APScheduler"""
+        self.dispatcher.submit(user_id, time.time(), mode=mode, filter_type=filter_type, city=city)
+        logger.info(f"🕐 Queued scheduled scrape for user {user_id} ({self.dispatcher.get_stats()})")
+    
+    async def _notify_queued(self, job, expected_delay: float):
+        """Tell the user when their scheduled scrape will start, if it is not right away"""
+        logger.info(f"Scheduled scrape for user {job.user_id} expected to start in {expected_delay:.0f}s")
+        if expected_delay < 60 or not self.bot_instance:
+            return
+        try:
+            await self.bot_instance.send_message(
+                chat_id=job.user_id,
+                text=f"⏳ הסריקה המתוזמנת שלך בתור ותתחיל בעוד כ-{round(expected_delay / 60)} דקות"
+            )
+        except Exception as e:
+            logger.error(f"Error sending queue notification: {e}")
+    
+    def _running_scan_count(self) -> int:
+        """Scans queued or running in the scan queue, interactive or scheduled"""
+        return self.scraper_manager.queue.pending_count() if self.scraper_manager else 0
+    
+    async def _launch_scheduled_scrape(self, user_id: int, mode: str, filter_type: str, city: str, followers: list = None):
+        """Start a queued scheduled scrape (possibly shared by followers) - called by the dispatcher"""
+        group = [user_id] + list(followers or [])
+        # The scan runs under a user who is not scraping right now; the rest get its results
+        leader = next((uid for uid in group if not self.scraper_manager
+                       or not self.scraper_manager.is_scraping_active(uid)), user_id)
+        followers = [uid for uid in group if uid != leader]
+        summary = await self._run_scheduled_scrape(leader, mode, filter_type, city, followers)
+        if summary and summary['status'] == 'completed':
+            # Real scan durations feed the dispatcher's start-delay estimates
+            self.dispatcher.record_duration(summary['duration'])
+    
+    async def _run_scheduled_scrape(self, user_id: int, mode: str, filter_type: str, city: str, followers: list = None):
+        """Run scheduled scrape headless and send the user one summary - called by the dispatcher"""
+        followers = followers or []
         try:
-            logger.info(f"🤖 Running scheduled scrape for user {user_id}: {mode} {filter_type} in {city}")
+            logger.info(f"🤖 Running scheduled scrape for user {user_id}: {mode} {filter_type} in {city}"
+                        f"{f' (shared with {len(followers)} users)' if followers else ''}")
             
             if not self.scraper_manager or not self.bot_instance:
                 logger.error("Scraper manager or bot instance not set!")
-                return
+                return None
             
-            # Send notification to user
-            try:
-                mode_text = "השכרה" if mode == "rent" else "מכירה"
-                filter_text = "מהיום בלבד" if filter_type == "today" else "כללי"
-                
-                await self.bot_instance.send_message(
-                    chat_id=user_id,
-                    text=f"🤖 **סריקה מתוזמנת מתחילה...**\n\n"
-                         f"📍 עיר: {city}\n"
-                         f"🏠 סוג: {mode_text}\n"
-                         f"📊 טווח: {filter_text}",
-                    parse_mode='Markdown'
-                )
-            except Exception as e:
-                logger.error(f"Error sending notification: {e}")
+            # Send notification to every user the scan runs for
+            mode_text = "השכרה" if mode == "rent" else "מכירה"
+            filter_text = "מהיום בלבד" if filter_type == "today" else "כללי"
+            for chat_id in [user_id] + followers:
+                try:
+                    await self.bot_instance.send_message(
+                        chat_id=chat_id,
+                        text=f"🤖 **סריקה מתוזמנת מתחילה...**\n\n"
+                             f"📍 עיר: {city}\n"
+                             f"🏠 סוג: {mode_text}\n"
+                             f"📊 טווח: {filter_text}",
+                        parse_mode='Markdown'
+                    )
+                except Exception as e:
+                    logger.error(f"Error sending notification: {e}")
+            
+            # Queue the scrape (headless, no progress UI); returns once it has really finished
+            summary = await self.scraper_manager.queue_scan_job(
+                user_id=user_id,
+                mode=mode,
+                filter_type=filter_type,
+                city_code=city,
+                page_limit=1,  # Single page for scheduled scrapes
+                followers=followers
+            )
+            logger.info(f"✅ Scheduled scrape for user {user_id} finished: {summary}")
             
-            # Run the actual scrape
             try:
-                # Create a mock status message for scraper
-                class MockMessage:
-                    def __init__(self, chat_id):
-                        self.chat = type('obj', (object,), {'id': chat_id})
-                
-                status_message = MockMessage(user_id)
-                
-                # Create mock context
-                from telegram.ext import ContextTypes
-                context = type('obj', (object,), {
-                    'mode': mode,
-                    'filter_type': filter_type,
-                    'city_code': city,
-                    'bot': self.bot_instance
-                })
-                
-                # Run scraper
-                await self.scraper_manager.run_scraper_with_message(
-                    status_message=status_message,
-                    context=context,
-                    mode=mode,
-                    filter_type=filter_type,
-                    city_code=city,
-                    page_limit=1  # Single page for scheduled scrapes
-                )
-                
-                logger.info(f"✅ Scheduled scrape completed for user {user_id}")
-                
-                # Send completion notification
-                await self.bot_instance.send_message(
-                    chat_id=user_id,
-                    text=f"✅ **סריקה מתוזמנת הושלמה!**\n\n"
-                         f"התוצאות נשמרו ב-CRM.",
-                    parse_mode='Markdown'
-                )
-                
-            except Exception as scrape_error:
-                logger.error(f"Error running scheduled scrape: {scrape_error}")
-                await self.bot_instance.send_message(
-                    chat_id=user_id,
-                    text=f"❌ שגיאה בסריקה מתוזמנת: {str(scrape_error)}"
-                )
+                await self._send_scheduled_summary(user_id, summary)
+            except Exception as e:
+                logger.error(f"Error sending scheduled scrape summary: {e}")
+            return summary
             
         except Exception as e:
             logger.error(f"Error in scheduled scrape: {e}")
+            return None
+    
+    async def _send_scheduled_summary(self, user_id: int, summary: dict):
+        """The one message a user gets when their scheduled scrape is done"""
+        status = summary['status']
+        if status in ('completed', 'cached'):
+            text = (f"✅ **סריקה מתוזמנת הושלמה!**\n\n"
+                    f"📊 נמצאו: {summary['total_listings']} מודעות\n"
+                    f"🔍 מספרי טלפון: {summary['phone_count']}\n\n"
+                    f"התוצאות נשמרו ב-CRM.")
+            if summary['phone_count'] > 0:
+                with open(summary['results_file'], 'rb') as f:
+                    await self.bot_instance.send_document(
+                        chat_id=user_id,
+                        document=f,
+                        filename=os.path.basename(summary['results_file']),
+                        caption=text,
+                        parse_mode='Markdown'
+                    )
+                return
+        elif status == 'no_results':
+            text = "✅ **סריקה מתוזמנת הושלמה!**\n\nלא נמצאו מודעות חדשות."
+        elif status == 'busy':
+            text = "⚠️ הסריקה המתוזמנת לא הופעלה כי יש לך כבר סריקה פעילה."
+        else:
+            text = f"❌ שגיאה בסריקה מתוזמנת ({status})"
+        await self.bot_instance.send_message(chat_id=user_id, text=text, parse_mode='Markdown')
     
     async def add_schedule(self, user_id: int, mode: str, filter_type: str, city: str, hour: int, minute: int = 0):
         """Add a new schedule"""
@@ -191,7 +240,7 @@ class BotScheduler:
             trigger = CronTrigger(hour=hour, minute=minute, timezone='Asia/Jerusalem')
             
             self.scheduler.add_job(
-                self._run_scheduled_scrape,
+                self._enqueue_scheduled_scrape,
                 trigger=trigger,
                 id=job_id,
                 args=[user_id, mode, filter_type, city],
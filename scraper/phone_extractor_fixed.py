@@ -27,7 +27,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # ZenRows configuration
-ZENROWS_API_KEY = '3f50019a0655a46ab2198f4b29a29de2ba11f133'
+ZENROWS_API_KEY = os.environ.get('ZENROWS_API_KEY', '')
 ZENROWS_API_URL = 'https://api.zenrows.com/v1/'
 
 class FixedPhoneExtractor:
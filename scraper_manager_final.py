@@ -6,30 +6,83 @@ Final Scraper Manager - Fixes all critical issues:
 3. No race conditions between monitor and main process
 4. Proper process termination and cleanup
 5. Reliable phone extraction with ZenRows
+6. Identical scans started close together share one run (single-flight),
+   and a just-finished run's results serve identical requests for a few minutes
+7. Scans go through a persistent, fair job queue with a fixed worker count
+8. Scan filters (price, rooms, ...) are pushed into the Yad2 feed URL
 """
 
 import asyncio
 import os
 import glob
-import subprocess
 import logging
 import json
 import csv
+import shutil
+import signal
+import time
 from datetime import datetime
+from types import SimpleNamespace
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from database import db
+from listing import Listing
 from progress_monitor_fixed import FixedProgressMonitor
+from scan_broker import get_scan_broker
+from scan_worker import (CITY_FILE_NAMES, SCRAPER_SCRIPT, find_results_file, purge_run_dirs, run_dir, scraper_command,
+                         scraper_env, stop_process_group)
+from fetch_ledger import FetchLedger, new_run_id
+from scan_queue import ScanJob, ScanQueue
+from scan_filters import ScanFilters
 
 logger = logging.getLogger(__name__)
 
+# How long a finished scan's results answer identical requests
+RESULT_CACHE_SECONDS = int(os.environ.get('YAD2_SCAN_CACHE_SECONDS', '300'))
+# Cached copies are named by run id, so runs of the same city/mode/filter never share one
+RESULT_CACHE_DIR = "/home/ubuntu/yad2bot_scraper/data/scan_cache"
+# Longest a headless (scheduled) scan may run before it is killed
+SCAN_JOB_TIMEOUT = int(os.environ.get('YAD2_SCAN_JOB_TIMEOUT', '3600'))
+# Scheduled scans only process listings new since the same user's last scan of their
+# city/mode (main.py --incremental, watermark scoped per user, filter type and filters)
+SCHEDULED_INCREMENTAL = os.environ.get('YAD2_SCHEDULED_INCREMENTAL', 'false').lower() == 'true'
+
+
+
+class _ProgressFanout:
+    """A running scan's status message that repeats every edit on the attached users' messages."""
+    
+    def __init__(self, message):
+        self.message = message
+        self.subscribers = []
+    
+    def __getattr__(self, name):
+        return getattr(self.message, name)
+    
+    async def edit_text(self, *args, **kwargs):
+        result = await self.message.edit_text(*args, **kwargs)
+        for subscriber in list(self.subscribers):
+            try:
+                await subscriber.edit_text(*args, **kwargs)
+            except Exception as e:
+                logger.debug(f"[ScraperManager] Could not mirror progress to {subscriber.chat_id}: {e}")
+        return result
+
+
 class FinalScraperManager:
     """Final scraper manager with all critical issues fixed."""
     
     def __init__(self):
-        self.scraper_script = "/root/yad2bot-service-scraper/yad2bot_scraper/scraper/main.py"
+        self.scraper_script = SCRAPER_SCRIPT
         self.bot_instance = None
         self.active_sessions = {}  # user_id -> session_data
+        self.inflight = {}  # scan key -> session of the run doing the work
+        self.result_cache = {}  # scan key -> {'results_file', 'run_id', 'completed_at'}
+        self.queue = ScanQueue()
+        self._job_messages = {}  # job id -> (status_message, context) of interactive jobs
+        self._job_waiters = {}  # job id -> future resolved with a scheduled job's summary
+        # With YAD2_BROKER_URL set, scans run on worker nodes (scan_worker.py) instead of here
+        self.broker = get_scan_broker() if os.environ.get('YAD2_BROKER_URL') else None
         self.progress_monitor = FixedProgressMonitor()
     
     def set_bot_instance(self, bot):
@@ -41,78 +94,155 @@ class FinalScraperManager:
         """Check if user has an active scraping session."""
         return user_id in self.active_sessions
     
+    @staticmethod
+    def _scan_key(mode: str, filter_type: str, city_code: str, page_limit: int, incremental: bool = False,
+                  filters: str = None) -> tuple:
+        # An incremental run's results are only the new listings, so it never answers a full scan
+        return (mode, filter_type, city_code or '', page_limit or 0, incremental, filters or '')
+    
+    def _cached_result(self, key: tuple):
+        """Results of an identical scan that finished less than RESULT_CACHE_SECONDS ago, if any."""
+        now = time.time()
+        for cached_key, entry in list(self.result_cache.items()):
+            if now - entry['completed_at'] > RESULT_CACHE_SECONDS:
+                del self.result_cache[cached_key]
+                # The cached file and the per-follower copies _fan_out_results wrote next to it
+                base, ext = os.path.splitext(entry['results_file'])
+                for path in [entry['results_file']] + glob.glob(f"{glob.escape(base)}_user*{ext}"):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+        entry = self.result_cache.get(key)
+        if entry and os.path.exists(entry['results_file']):
+            return entry
+        return None
+    
+    def _cache_result(self, key: tuple, results_file: str, run_id: str):
+        try:
+            os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+            cached_file = os.path.join(RESULT_CACHE_DIR, f"{run_id}_{os.path.basename(results_file)}")
+            shutil.copyfile(results_file, cached_file)
+            # The run's directory (with its checking_progress file) outlives the cache entry
+            self.result_cache[key] = {'results_file': cached_file, 'run_id': run_id, 'completed_at': time.time(),
+                                      'progress_dir': os.path.dirname(results_file)}
+        except Exception as e:
+            logger.warning(f"[ScraperManager] Could not cache results {results_file}: {e}")
+    
+    def _detach(self, session):
+        """Stop following a shared run (the run itself goes on for the others)."""
+        leader = session.get('attached_to')
+        if leader:
+            if session in leader['subscribers']:
+                leader['subscribers'].remove(session)
+            fanout = leader['status_message']
+            if session['status_message'] in fanout.subscribers:
+                fanout.subscribers.remove(session['status_message'])
+        self.active_sessions.pop(session['user_id'], None)
+    
+    def _finish_inflight(self, session, served: bool = False):
+        """Forget a run as in-flight and release the users attached to it.
+        
+        served=True means the attached users got (or are about to get) the run's results.
+        Otherwise the run was cancelled or failed: each of them is told so and queued
+        for a run of their own, so no one is left with a frozen progress message.
+        """
+        key = session.get('scan_key')
+        if key and self.inflight.get(key) is session:
+            del self.inflight[key]
+        if session.get('done'):
+            # Wakes headless jobs waiting for this run
+            session['done'].set()
+        for subscriber in list(session.get('subscribers', [])):
+            self._detach(subscriber)
+            if not served:
+                self._requeue_subscriber(subscriber, session)
+    
+    def _requeue_subscriber(self, subscriber, leader):
+        """Queue the scan again for a user whose shared run stopped, and tell them."""
+        user_id = subscriber['user_id']
+        status_message = subscriber['status_message']
+        try:
+            job = self.queue.enqueue(user_id, 'interactive', leader['mode'], leader['filter_type'],
+                                     leader.get('city_code'), leader.get('page_limit'),
+                                     chat_id=status_message.chat_id, filters=leader.get('filters'))
+        except Exception as e:
+            logger.error(f"[ScraperManager] Could not re-queue user {user_id} after run {leader.get('run_id')}: {e}")
+            job = None
+        if job:
+            self._job_messages[job.id] = (status_message, subscriber.get('context') or SimpleNamespace())
+            logger.info(f"[ScraperManager] User {user_id} re-queued as job {job.id} after shared run "
+                        f"{leader.get('run_id')} stopped")
+        
+        language = subscriber['language']
+        if language == 'hebrew':
+            text = "⚠️ הסריקה המשותפת שאליה הצטרפת הופסקה."
+            text += "\n⏳ הסריקה שלך הוחזרה לתור ותתחיל בקרוב." if job else "\n❌ נסה שוב מאוחר יותר."
+        else:
+            text = "⚠️ The shared scan you joined was stopped."
+            text += "\n⏳ Your scan is back in the queue and will start soon." if job else "\n❌ Please try again later."
+        
+        async def notify():
+            try:
+                await status_message.edit_text(f"{subscriber['selection_info']}\n\n{text}",
+                                               reply_markup=self.progress_monitor.create_cancel_keyboard(language)
+                                               if job else None)
+            except Exception as e:
+                logger.debug(f"[ScraperManager] Could not tell user {user_id} their shared run stopped: {e}")
+        
+        try:
+            asyncio.get_running_loop().create_task(notify())
+        except RuntimeError:
+            logger.warning(f"[ScraperManager] No event loop to tell user {user_id} their shared run stopped")
+    
     def cancel_current_scraping(self, user_id: int) -> bool:
         """Cancel current scraping process for user - IMPROVED VERSION."""
         logger.info(f"[ScraperManager] Cancel requested for user {user_id}")
         
-        # Set cancel flag in progress monitor first
-        cancel_set = self.progress_monitor.set_cancel_flag(user_id)
+        # A scan still waiting in the queue is just dropped
+        if self.queue.cancel_user(user_id) and not self.is_scraping_active(user_id):
+            logger.info(f"[ScraperManager] Cancelled queued scan of user {user_id}")
+            return True
+        
+        # A user attached to someone else's run only stops following it
+        session = self.active_sessions.get(user_id)
+        if session and session.get('broker_job_id'):
+            # Running on a worker node: the worker stops it (local pkill would hit the wrong scans)
+            self.broker.cancel(session['broker_job_id'])
+            logger.info(f"[ScraperManager] Cancel sent to broker job {session['broker_job_id']}")
+            return True
+        if session and session.get('attached_to'):
+            self._detach(session)
+            logger.info(f"[ScraperManager] User {user_id} detached from shared run {session['attached_to']['run_id']}")
+            return True
+        
+        # Set cancel flag in the run's progress monitor first
+        cancel_set = bool(session and session.get('progress_monitor')
+                          and session['progress_monitor'].set_cancel_flag(user_id))
         logger.info(f"[ScraperManager] Cancel flag set: {cancel_set}")
         
-        # Create cancel flag files for all possible scraping sessions
-        try:
-            import glob
-            data_dir = "/home/ubuntu/yad2bot_scraper/data"
-            today_str = datetime.now().strftime('%Y-%m-%d')
-            
-            # Create cancel flags for all possible combinations
-            cancel_patterns = [
-                f"*_{today_str}_cancel.flag",
-                f"*_rent_*_{today_str}_cancel.flag", 
-                f"*_sale_*_{today_str}_cancel.flag"
-            ]
-            
-            for pattern in cancel_patterns:
-                # Find existing progress files to create matching cancel files
-                progress_files = glob.glob(os.path.join(data_dir, pattern.replace('_cancel.flag', '_progress.json')))
-                for progress_file in progress_files:
-                    cancel_file = progress_file.replace('_progress.json', '_cancel.flag')
-                    try:
-                        with open(cancel_file, 'w') as f:
-                            f.write(f"cancelled_by_user_{user_id}")
-                        logger.info(f"[ScraperManager] Created cancel flag: {cancel_file}")
-                    except Exception as e:
-                        logger.warning(f"[ScraperManager] Error creating cancel flag {cancel_file}: {e}")
+        # Stop this user's own run: its cancel flag, then its process group (scraper + phone extractor).
+        # Other users' scans keep running.
+        processes_killed = False
+        if session:
+            try:
+                today_str = datetime.now().strftime('%Y-%m-%d')
+                city_name = session.get('city_name') or 'all_cities'
+                cancel_file = os.path.join(session['output_dir'],
+                                           f"{city_name}_{session.get('mode')}_{session.get('filter_type')}_{today_str}_cancel.flag")
+                with open(cancel_file, 'w') as f:
+                    f.write(f"cancelled_by_user_{user_id}")
+                logger.info(f"[ScraperManager] Created cancel flag: {cancel_file}")
+            except Exception as e:
+                logger.warning(f"[ScraperManager] Error creating cancel flag: {e}")
             
-            # Also create generic cancel flags
-            generic_cancel_files = [
-                os.path.join(data_dir, f"rent_today_{today_str}_cancel.flag"),
-                os.path.join(data_dir, f"sale_today_{today_str}_cancel.flag"),
-                os.path.join(data_dir, f"rent_all_{today_str}_cancel.flag"),
-                os.path.join(data_dir, f"sale_all_{today_str}_cancel.flag")
-            ]
+            process = session.get('process')
+            if process and process.returncode is None:
+                processes_killed = stop_process_group(process.pid)
+                logger.info(f"[ScraperManager] Stopped scraper process group {process.pid} of user {user_id}")
             
-            for cancel_file in generic_cancel_files:
-                try:
-                    with open(cancel_file, 'w') as f:
-                        f.write(f"cancelled_by_user_{user_id}")
-                    logger.info(f"[ScraperManager] Created generic cancel flag: {cancel_file}")
-                except Exception as e:
-                    logger.warning(f"[ScraperManager] Error creating generic cancel flag {cancel_file}: {e}")
-                    
-        except Exception as e:
-            logger.error(f"[ScraperManager] Error creating cancel flags: {e}")
-        
-        # Kill all running scraper processes (more aggressive approach)
-        processes_killed = False
-        
-        try:
-            # Kill main scraper processes (specific path to avoid killing bot)
-            result = subprocess.run(['pkill', '-f', '/yad2bot_scraper/main.py'], capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                logger.info("[ScraperManager] Killed scraper main.py processes")
-                processes_killed = True
-        except Exception as e:
-            logger.warning(f"[ScraperManager] Error killing scraper main.py: {e}")
-        
-        try:
-            # Kill phone extractor processes
-            result = subprocess.run(['pkill', '-f', 'phone_extractor'], capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                logger.info("[ScraperManager] Killed phone extractor processes")
-                processes_killed = True
-        except Exception as e:
-            logger.warning(f"[ScraperManager] Error killing phone extractor: {e}")
+            # Users who attached to this run are told and queued for a run of their own
+            self._finish_inflight(session)
         
         # Clean up session if exists
         if user_id in self.active_sessions:
@@ -141,117 +271,14 @@ class FinalScraperManager:
         logger.info(f"[ScraperManager] Cancel operation result: {result}")
         return result
     
-    async def cleanup_old_files(self):
-        """Clean up old progress and CSV files to ensure fresh start."""
-        try:
-            logger.info("[ScraperManager] Cleaning up old files - START")
-            
-            # Clean up old progress files (both regular and checking progress)
-            # BUT keep today's checking_progress files for duplicate counting
-            today = datetime.now().strftime('%Y-%m-%d')
-            progress_patterns = [
-                "/root/yad2bot-service-scraper/yad2bot_scraper/data/*_progress.json",
-                "/root/yad2bot-service-scraper/yad2bot_scraper/data/*_checking_progress.json",
-                "/home/ubuntu/yad2bot_scraper/data/*_progress.json",
-                "/home/ubuntu/yad2bot_scraper/data/*_checking_progress.json"
-            ]
-            
-            all_progress_files = []
-            for pattern in progress_patterns:
-                logger.info(f"[ScraperManager] Looking for progress files: {pattern}")
-                files = await asyncio.to_thread(glob.glob, pattern)
-                # Filter out today's checking_progress files
-                for f in files:
-                    if '_checking_progress.json' in f and today in f:
-                        logger.info(f"[ScraperManager] Keeping today's checking_progress: {f}")
-                        continue
-                    all_progress_files.append(f)
-            
-            logger.info(f"[ScraperManager] Found {len(all_progress_files)} progress files to delete")
-            
-            # Parallel deletion of progress files
-            if all_progress_files:
-                await asyncio.gather(
-                    *[asyncio.to_thread(os.remove, f) for f in all_progress_files],
-                    return_exceptions=True
-                )
-                logger.info(f"[ScraperManager] Removed {len(all_progress_files)} progress files")
-            
-            # Clean up today's CSV files to force new scan
-            today = datetime.now().strftime('%Y-%m-%d')
-            csv_patterns = [
-                f"/root/yad2bot-service-scraper/yad2bot_scraper/data/*{today}*.csv",
-                f"/home/ubuntu/yad2bot_scraper/data/*{today}*.csv"
-            ]
-            
-            all_csv_files = []
-            for csv_pattern in csv_patterns:
-                logger.info(f"[ScraperManager] Looking for CSV files: {csv_pattern}")
-                csv_files = await asyncio.to_thread(glob.glob, csv_pattern)
-                all_csv_files.extend(csv_files)
-            
-            # Parallel deletion of CSV files
-            if all_csv_files:
-                await asyncio.gather(
-                    *[asyncio.to_thread(os.remove, f) for f in all_csv_files],
-                    return_exceptions=True
-                )
-                logger.info(f"[ScraperManager] Removed {len(all_csv_files)} CSV files")
-            
-            logger.info("[ScraperManager] File cleanup completed")
-            
-        except Exception as e:
-            logger.error(f"[ScraperManager] Error during file cleanup: {e}")
-    
-    async def kill_existing_processes(self):
-        """Kill any existing scraper processes to ensure clean start."""
-        try:
-            logger.info("[ScraperManager] Killing existing processes...")
-            
-            # Kill main scraper processes using specific path to avoid killing the bot
-            # Use asyncio.to_thread to avoid blocking the event loop
-            try:
-                result = await asyncio.to_thread(
-                    subprocess.run,
-                    ['pkill', '-f', '/root/yad2bot-service-scraper/yad2bot_scraper/scraper/main.py'],
-                    capture_output=True, text=True, timeout=5
-                )
-                if result.returncode == 0:
-                    logger.info("[ScraperManager] Killed existing scraper main.py processes")
-            except Exception as e:
-                logger.warning(f"[ScraperManager] Error killing scraper main.py processes: {e}")
-            
-            # Kill phone extractor processes
-            # Use asyncio.to_thread to avoid blocking the event loop
-            try:
-                result = await asyncio.to_thread(
-                    subprocess.run,
-                    ['pkill', '-f', 'phone_extractor'],
-                    capture_output=True, text=True, timeout=5
-                )
-                if result.returncode == 0:
-                    logger.info("[ScraperManager] Killed existing phone extractor processes")
-            except Exception as e:
-                logger.warning(f"[ScraperManager] Error killing phone extractor processes: {e}")
-            
-            # Wait for processes to terminate
-            try:
-                await asyncio.sleep(2)
-            except asyncio.CancelledError:
-                logger.info("[ScraperManager] Process cleanup was cancelled")
-            except Exception as e:
-                logger.warning(f"[ScraperManager] Error during sleep: {e}")
-            logger.info("[ScraperManager] Process cleanup completed")
-            
-        except Exception as e:
-            logger.error(f"[ScraperManager] Error during process cleanup: {e}")
-    
     def get_selection_info(self, context: ContextTypes.DEFAULT_TYPE, language: str) -> str:
         """Get formatted selection information for display."""
         try:
             mode = getattr(context, 'mode', 'rent')
             filter_type = getattr(context, 'filter_type', 'all')
             city_code = getattr(context, 'city_code', None)
+            filters = ScanFilters.from_json(getattr(context, 'scan_filters', None))
+            filters_text = f"\n🔎 {filters.describe()}" if filters and not filters.is_empty else ""
             
             if language == 'hebrew':
                 mode_text = "השכרה" if mode == 'rent' else "מכירה"
@@ -274,9 +301,9 @@ class FinalScraperManager:
                         '0070': 'אשדוד'
                     }
                     city_text = city_names.get(city_code, city_code)
-                    return f"🏠 {mode_text} - {city_text}\n📅 {filter_text}"
+                    return f"🏠 {mode_text} - {city_text}\n📅 {filter_text}{filters_text}"
                 else:
-                    return f"🏠 {mode_text} - כל הארץ\n📅 {filter_text}"
+                    return f"🏠 {mode_text} - כל הארץ\n📅 {filter_text}{filters_text}"
             else:
                 mode_text = "Rent" if mode == 'rent' else "Sale"
                 if filter_type == 'test':
@@ -298,16 +325,105 @@ class FinalScraperManager:
                         '0070': 'Ashdod'
                     }
                     city_text = city_names.get(city_code, city_code)
-                    return f"🏠 {mode_text} - {city_text}\n📅 {filter_text}"
+                    return f"🏠 {mode_text} - {city_text}\n📅 {filter_text}{filters_text}"
                 else:
-                    return f"🏠 {mode_text} - All Israel\n📅 {filter_text}"
+                    return f"🏠 {mode_text} - All Israel\n📅 {filter_text}{filters_text}"
                     
         except Exception as e:
             logger.error(f"[ScraperManager] Error getting selection info: {e}")
             return "🏠 סריקה" if language == 'hebrew' else "🏠 Scanning"
     
-    async def run_scraper_with_message(self, status_message, context: ContextTypes.DEFAULT_TYPE, mode: str, filter_type: str, city_code: str = None, page_limit: int = None):
-        """Run scraper with proper cleanup and monitoring - FINAL VERSION."""
+    def start_queue(self):
+        """Start the scan workers (call once the event loop runs); resumes jobs left from a restart."""
+        self.queue.recover()
+        self.queue.start(self._run_queued_job)
+    
+    async def submit_scan(self, status_message, context: ContextTypes.DEFAULT_TYPE, mode: str, filter_type: str, city_code: str = None, page_limit: int = None, filters: str = None):
+        """Queue an interactive scan and tell the user their place in line if they have to wait.
+        
+        filters is ScanFilters.to_json() output, pushed into the feed URL by the scraper.
+        Returns False (after telling the user) when they already have a scan running or queued.
+        """
+        user_id = status_message.chat.id
+        language = db.get_user_language(user_id)
+        
+        if self.is_scraping_active(user_id) or self.queue.has_pending(user_id):
+            logger.info(f"[ScraperManager] User {user_id} already has a scan running or queued")
+            # A new message, so the menu the user pressed stays usable
+            busy_text = ("⚠️ יש לך כבר סריקה פעילה. אנא המתן לסיום או בטל אותה." if language == 'hebrew'
+                         else "⚠️ You already have an active scraping session. Please wait for completion or cancel it.")
+            try:
+                await status_message.reply_text(busy_text)
+            except Exception as e:
+                logger.debug(f"[ScraperManager] Could not send the busy message: {e}")
+            return False
+        
+        job = self.queue.enqueue(user_id, 'interactive', mode, filter_type, city_code, page_limit,
+                                 chat_id=status_message.chat_id, filters=filters)
+        self._job_messages[job.id] = (status_message, context)
+        
+        ahead, eta = self.queue.position(job.id)
+        if eta > 0:
+            minutes = max(1, round(eta / 60))
+            if language == 'hebrew':
+                text = f"⏳ הסריקה שלך בתור (מקום {ahead + 1}).\nזמן משוער לתחילת הסריקה: כ-{minutes} דקות."
+            else:
+                text = f"⏳ Your scan is queued (position {ahead + 1}).\nEstimated start in about {minutes} min."
+            try:
+                await status_message.edit_text(text, reply_markup=self.progress_monitor.create_cancel_keyboard(language))
+            except Exception as e:
+                logger.debug(f"[ScraperManager] Could not show queue position: {e}")
+        return True
+    
+    async def queue_scan_job(self, user_id: int, mode: str, filter_type: str, city_code: str = None,
+                             page_limit: int = None, followers: list = None, filters: str = None) -> dict:
+        """Queue a headless (scheduled) scan and wait for its run_scan_job summary."""
+        job = self.queue.enqueue(user_id, 'scheduled', mode, filter_type, city_code, page_limit, followers,
+                                 filters=filters)
+        future = asyncio.get_running_loop().create_future()
+        self._job_waiters[job.id] = future
+        return await future
+    
+    async def _run_queued_job(self, job: ScanJob):
+        """Run one queue job to completion - called by the queue's workers."""
+        if job.kind == 'scheduled':
+            summary = await self.run_scan_job(job.user_id, job.mode, job.filter_type, job.city_code,
+                                              job.page_limit, job.followers, filters=job.filters)
+            future = self._job_waiters.pop(job.id, None)
+            if future and not future.done():
+                future.set_result(summary)
+            elif self.bot_instance:
+                # Nobody waits for a job recovered after a restart: tell the user directly
+                await self.bot_instance.send_message(
+                    chat_id=job.user_id,
+                    text=f"✅ סריקה מתוזמנת הושלמה ({summary['status']}): "
+                         f"{summary['total_listings']} מודעות, {summary['phone_count']} מספרי טלפון"
+                )
+            return
+        
+        status_message, context = self._job_messages.pop(job.id, (None, None))
+        if status_message is None:
+            # Queued before a restart: the old message object is gone, start a fresh one
+            if not self.bot_instance:
+                raise RuntimeError("No bot instance to resume a queued scan")
+            status_message = await self.bot_instance.send_message(chat_id=job.chat_id, text="🔄 הסריקה שלך מתחילה...")
+            context = SimpleNamespace()
+        if self.broker:
+            await self._run_remote_interactive(job, status_message, context)
+            return
+        await self.run_scraper_with_message(status_message, context, job.mode, job.filter_type,
+                                            job.city_code, job.page_limit, filters=job.filters)
+        # Hold the worker until the run (scraper + phone extraction + results) is over
+        session = self.active_sessions.get(job.user_id)
+        if session and session.get('done'):
+            await session['done'].wait()
+    
+    async def run_scraper_with_message(self, status_message, context: ContextTypes.DEFAULT_TYPE, mode: str, filter_type: str, city_code: str = None, page_limit: int = None, followers: list = None, filters: str = None):
+        """Run scraper with proper cleanup and monitoring - FINAL VERSION.
+        
+        followers are users whose identical scheduled scan is served by this one;
+        they get the results (minus listings they already have) when it completes.
+        """
         user_id = status_message.chat.id
         language = db.get_user_language(user_id)
         
@@ -320,35 +436,58 @@ class FinalScraperManager:
                 # Removed: await status_message.edit_text(active_message)
                 return
             
-            # STEP 1: Complete cleanup to ensure fresh start
-            await self.cleanup_old_files()
-            # Removed kill_existing_processes - it was causing hangs
-            
-            # STEP 2: Store context data
+            # Get selection info for display
             context.mode = mode
             context.filter_type = filter_type
             context.city_code = city_code
-            
-            # Get selection info for display
+            context.scan_filters = filters
             selection_info = self.get_selection_info(context, language)
             
-            # STEP 3: Create session
+            # Identical scan finished moments ago: answer from its results
+            scan_key = self._scan_key(mode, filter_type, city_code, page_limit, filters=filters)
+            cached = self._cached_result(scan_key)
+            if cached:
+                logger.info(f"[ScraperManager] Serving user {user_id} from cached run {cached['run_id']}")
+                # No fetches were made for this user, so the result row carries no fetch cost
+                await self._send_final_results(status_message, cached['results_file'], language, selection_info,
+                                               progress_dir=cached.get('progress_dir'))
+                return
+            
+            # Identical scan in flight: follow its progress and share its results
+            leader = self.inflight.get(scan_key)
+            if leader and leader['user_id'] in self.active_sessions and not leader.get('headless'):
+                session = {
+                    'user_id': user_id,
+                    'status_message': status_message,
+                    'language': language,
+                    'selection_info': selection_info,
+                    'context': context,
+                    'attached_to': leader
+                }
+                self.active_sessions[user_id] = session
+                leader['subscribers'].append(session)
+                leader['status_message'].subscribers.append(status_message)
+                logger.info(f"[ScraperManager] User {user_id} attached to in-flight run {leader['run_id']} "
+                            f"({len(leader['subscribers'])} attached)")
+                return
+            
             # Get city name for file matching
-            city_name_mapping = {
-                '5000': 'TelAviv',
-                '4000': 'Haifa',
-                '3000': 'Jerusalem',
-                '9000': 'BeerSheva',
-                '7400': 'Netanya',
-                '8300': 'RishonLeZion',
-                '7900': 'PetahTikva',
-                '0070': 'Ashdod'
-            }
-            city_name = city_name_mapping.get(city_code, 'Unknown') if city_code else None
+            city_name = CITY_FILE_NAMES.get(city_code, 'Unknown') if city_code else None
             
+            # STEP 1: Drop run directories nobody read (the run gets a fresh one below)
+            await asyncio.to_thread(purge_run_dirs)
+            # Removed kill_existing_processes - it was causing hangs
+            
+            # STEP 2: Create session
+            
+            run_id = new_run_id(user_id)
+            # The run writes into its own directory, so scans running at the same time
+            # never read or overwrite each other's progress files and CSVs
+            output_dir = run_dir(run_id)
             session = {
                 'user_id': user_id,
-                'status_message': status_message,
+                # Progress edits are repeated for users who attach to this run
+                'status_message': _ProgressFanout(status_message),
                 'chat_id': status_message.chat_id,
                 'message_id': status_message.message_id,
                 'context': context,
@@ -358,34 +497,24 @@ class FinalScraperManager:
                 'mode': mode,
                 'filter_type': filter_type,
                 'process': None,
-                'monitor_task': None
+                'monitor_task': None,
+                # Tags every ZenRows request of this scan in the fetch ledger
+                'run_id': run_id,
+                'output_dir': output_dir,
+                'progress_monitor': FixedProgressMonitor(output_dir),
+                'city_code': city_code,
+                'page_limit': page_limit,
+                'followers': list(followers or []),
+                'filters': filters,
+                'scan_key': scan_key,
+                'subscribers': [],
+                'done': asyncio.Event()
             }
             self.active_sessions[user_id] = session
+            self.inflight[scan_key] = session
             
-            # STEP 4: Build and start scraper command
-            command = [
-                "python3",
-                self.scraper_script,
-                "--mode", mode,
-                "--filter", filter_type
-            ]
-            
-            if city_code:
-                command.extend(["--city", city_code])
-            
-            if page_limit:
-                command.extend(["--max-pages", str(page_limit)])
-            
-            logger.info(f"[ScraperManager] Command: {' '.join(command)}")
-            
-            # Start scraper process
-            process = await asyncio.create_subprocess_exec(
-                *command,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                cwd=os.path.dirname(self.scraper_script),
-                env={**os.environ, 'ZENROWS_API_KEY': '3f50019a0655a46ab2198f4b29a29de2ba11f133'}
-            )
+            # STEP 3: Build and start scraper command
+            process = await self._start_scraper_process(session, mode, filter_type, city_code, page_limit)
             
             session['process'] = process
             logger.info(f"[ScraperManager] Started scraper process PID {process.pid}")
@@ -404,14 +533,14 @@ class FinalScraperManager:
             
             asyncio.create_task(log_process_output())
             
-            # STEP 5: Start monitoring in background (don't await it)
+            # STEP 4: Start monitoring in background (don't await it)
             monitor_task = asyncio.create_task(
                 self._monitor_complete_process(session),
                 name=f"monitor_complete_user_{user_id}"
             )
             session['monitor_task'] = monitor_task
             
-            # STEP 6: Return immediately, let monitoring run in background
+            # STEP 5: Return immediately, let monitoring run in background
             logger.info(f"[ScraperManager] Monitoring task started in background for user {user_id}")
             return  # Don't await, let it run in background
             
@@ -420,6 +549,7 @@ class FinalScraperManager:
             
             # Clean up on error
             if user_id in self.active_sessions:
+                self._finish_inflight(self.active_sessions[user_id])
                 del self.active_sessions[user_id]
             
             error_message = "❌ שגיאה בסריקה. נסה שוב מאוחר יותר." if language == 'hebrew' else "❌ Scraping error. Try again later."
@@ -430,6 +560,266 @@ class FinalScraperManager:
             if user_id in self.active_sessions:
                 del self.active_sessions[user_id]
     
+    async def _start_scraper_process(self, session, mode: str, filter_type: str, city_code: str = None, page_limit: int = None):
+        """Start the scraper subprocess (it runs the phone extractor itself before exiting)."""
+        command = scraper_command(mode, filter_type, city_code, page_limit, session.get('incremental', False),
+                                  session.get('filters'), session.get('output_dir'))
+        logger.info(f"[ScraperManager] Command: {' '.join(command)}")
+        
+        return await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=os.path.dirname(self.scraper_script),
+            env=scraper_env(session['run_id'], session['user_id']),
+            # Own process group, so a cancel stops this run's phone extractor too and nothing else
+            start_new_session=True
+        )
+    
+    @staticmethod
+    def _count_results(results_file: str) -> tuple:
+        """(listings, listings with a real phone number) in a results CSV."""
+        total_listings = phone_count = 0
+        with open(results_file, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                total_listings += 1
+                if Listing.from_csv_row(row).has_real_phone:
+                    phone_count += 1
+        return total_listings, phone_count
+    
+    async def run_scan_job(self, user_id: int, mode: str, filter_type: str, city_code: str = None,
+                           page_limit: int = None, followers: list = None, timeout: int = SCAN_JOB_TIMEOUT,
+                           filters: str = None) -> dict:
+        """Run a scan headless (no Telegram progress) and return once it has really finished.
+        
+        Used for scheduled scans: no status message is edited and no progress files are
+        polled; the subprocess is awaited, its results are saved for the user (and fanned
+        out to followers), and a summary dict is returned for the caller to deliver:
+        status ('completed', 'no_results', 'cached', 'busy', 'timeout', 'failed'),
+        results_file, total_listings, phone_count, run_id, shared_by, duration.
+        """
+        started = time.time()
+        followers = list(followers or [])
+        summary = {'status': 'failed', 'results_file': None, 'total_listings': 0, 'phone_count': 0,
+                   'run_id': None, 'shared_by': 1 + len(followers), 'duration': 0.0}
+        
+        if self.is_scraping_active(user_id):
+            summary['status'] = 'busy'
+            return summary
+        
+        # The watermark is the leader's, so a run shared with followers scans in full
+        incremental = SCHEDULED_INCREMENTAL and not followers
+        scan_key = self._scan_key(mode, filter_type, city_code, page_limit, incremental, filters)
+        city_name = CITY_FILE_NAMES.get(city_code, 'Unknown') if city_code else None
+        
+        # An identical run is in flight: wait for it instead of scraping the same pages again
+        leader = self.inflight.get(scan_key)
+        if leader:
+            logger.info(f"[ScraperManager] Headless scan for user {user_id} waits for in-flight run {leader['run_id']}")
+            try:
+                await asyncio.wait_for(leader['done'].wait(), timeout)
+            except asyncio.TimeoutError:
+                summary.update(status='timeout', duration=time.time() - started)
+                return summary
+        
+        cached = self._cached_result(scan_key)
+        if cached:
+            total_listings, phone_count = self._count_results(cached['results_file'])
+            # No fetches were made for this user, so the result row carries no fetch cost
+            db.save_scraping_result(user_id=user_id, mode=mode, filter_type=filter_type,
+                                    csv_file_path=cached['results_file'], total_listings=total_listings,
+                                    phone_numbers_count=phone_count, city_code=city_code)
+            summary.update(status='cached', results_file=cached['results_file'], total_listings=total_listings,
+                           phone_count=phone_count, run_id=cached['run_id'], shared_by=1,
+                           duration=time.time() - started)
+            if followers:
+                await self._fan_out_results({'mode': mode, 'filter_type': filter_type, 'city_code': city_code,
+                                             'run_id': None, 'followers': followers}, cached['results_file'])
+            return summary
+        
+        session = {
+            'user_id': user_id,
+            'headless': True,
+            'status_message': None,
+            'mode': mode,
+            'filter_type': filter_type,
+            'city_code': city_code,
+            'city_name': city_name,
+            'run_id': new_run_id(user_id),
+            'followers': followers,
+            'incremental': incremental,
+            'filters': filters,
+            'scan_key': scan_key,
+            'subscribers': [],
+            'done': asyncio.Event(),
+            'process': None
+        }
+        summary['run_id'] = session['run_id']
+        # The run's files live in its own directory: no other scan finds or cleans them up,
+        # and the results stay readable until the scheduler has delivered them
+        session['output_dir'] = run_dir(session['run_id'])
+        self.active_sessions[user_id] = session
+        self.inflight[scan_key] = session
+        
+        try:
+            run = self._run_on_broker if self.broker else self._run_locally
+            status, results_file = await run(session, page_limit, timeout)
+            if not results_file:
+                summary['status'] = status
+                return summary
+            
+            total_listings, phone_count = self._count_results(results_file)
+            session['results_file'] = results_file
+            self._cache_result(scan_key, results_file, session['run_id'])
+            db.save_scraping_result(user_id=user_id, mode=mode, filter_type=filter_type,
+                                    csv_file_path=results_file, total_listings=total_listings,
+                                    phone_numbers_count=phone_count, city_code=city_code,
+                                    run_id=session['run_id'], shared_by=summary['shared_by'])
+            summary.update(status='completed', results_file=results_file,
+                           total_listings=total_listings, phone_count=phone_count)
+            if followers:
+                await self._fan_out_results(session, results_file)
+            return summary
+        
+        except Exception as e:
+            logger.error(f"[ScraperManager] Headless scan for user {user_id} failed: {e}")
+            summary['status'] = 'failed'
+            return summary
+        
+        finally:
+            summary['duration'] = time.time() - started
+            self._finish_inflight(session)
+            self.active_sessions.pop(user_id, None)
+    
+    async def _run_locally(self, session, page_limit: int, timeout: int) -> tuple:
+        """Run a headless scan as a subprocess of the bot; (status, results file or None)."""
+        await asyncio.to_thread(purge_run_dirs)
+        process = await self._start_scraper_process(session, session['mode'], session['filter_type'],
+                                                    session['city_code'], page_limit)
+        session['process'] = process
+        logger.info(f"[ScraperManager] Headless scan {session['run_id']} started, PID {process.pid}")
+        
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            stop_process_group(process.pid, signal.SIGKILL)
+            await process.wait()
+            logger.error(f"[ScraperManager] Headless scan {session['run_id']} killed after {timeout}s")
+            return 'timeout', None
+        if stderr:
+            logger.error(f"[Scraper STDERR] {stderr.decode('utf-8', errors='ignore')}")
+        logger.info(f"[Scraper] Headless scan {session['run_id']} exited with code {process.returncode}")
+        
+        results_file = find_results_file(session['city_name'], session['mode'], session['filter_type'],
+                                         session['output_dir'])
+        return ('completed', results_file) if results_file else ('no_results', None)
+    
+    async def _run_on_broker(self, session, page_limit: int, timeout: int, on_progress=None) -> tuple:
+        """Run a scan on a worker node through the broker; (status, local copy of the results or None).
+        
+        on_progress(progress_dict) is awaited whenever the worker pushed new progress.
+        The worker's fetch-ledger rows are imported, so the run's cost is reported as usual.
+        """
+        job = {
+            'user_id': session['user_id'],
+            'mode': session['mode'],
+            'filter_type': session['filter_type'],
+            'city_code': session['city_code'],
+            'page_limit': page_limit,
+            'incremental': session.get('incremental', False),
+            'filters': session.get('filters'),
+            'run_id': session['run_id']
+        }
+        job_id = await asyncio.to_thread(self.broker.push_job, job)
+        session['broker_job_id'] = job_id
+        logger.info(f"[ScraperManager] Scan {session['run_id']} sent to the broker as job {job_id}")
+        
+        deadline = time.time() + timeout
+        last_progress = None
+        try:
+            while True:
+                result = await asyncio.to_thread(self.broker.get_result, job_id)
+                if result:
+                    break
+                if time.time() > deadline:
+                    await asyncio.to_thread(self.broker.cancel, job_id)
+                    logger.error(f"[ScraperManager] Broker job {job_id} timed out after {timeout}s")
+                    return 'timeout', None
+                # A worker that died mid-scan hands its job to another node
+                await asyncio.to_thread(self.broker.requeue_stale)
+                progress = await asyncio.to_thread(self.broker.get_progress, job_id)
+                if on_progress and progress and progress != last_progress:
+                    last_progress = progress
+                    try:
+                        await on_progress(progress)
+                    except Exception as e:
+                        logger.debug(f"[ScraperManager] Progress update failed: {e}")
+                await asyncio.sleep(5)
+            
+            logger.info(f"[ScraperManager] Broker job {job_id} finished on {result.get('node')}: {result['status']}")
+            if result.get('ledger_rows'):
+                FetchLedger().import_rows(result['ledger_rows'])
+            if result['status'] != 'completed' or not result.get('csv_text'):
+                return result['status'], None
+            
+            results_file = os.path.join(session.get('output_dir') or run_dir(session['run_id']), result['csv_name'])
+            with open(results_file, 'w', encoding='utf-8') as f:
+                f.write(result['csv_text'])
+            return 'completed', results_file
+        finally:
+            await asyncio.to_thread(self.broker.forget, job_id)
+    
+    async def _run_remote_interactive(self, job: ScanJob, status_message, context):
+        """Interactive scan on a worker node: progress comes from the broker instead of local files."""
+        user_id = job.user_id
+        language = db.get_user_language(user_id)
+        context.mode, context.filter_type, context.city_code = job.mode, job.filter_type, job.city_code
+        context.scan_filters = job.filters
+        selection_info = self.get_selection_info(context, language)
+        
+        scan_key = self._scan_key(job.mode, job.filter_type, job.city_code, job.page_limit, filters=job.filters)
+        cached = self._cached_result(scan_key)
+        if cached:
+            await self._send_final_results(status_message, cached['results_file'], language, selection_info,
+                                               progress_dir=cached.get('progress_dir'))
+            return
+        
+        session = {
+            'user_id': user_id,
+            'status_message': status_message,
+            'language': language,
+            'selection_info': selection_info,
+            'mode': job.mode,
+            'filter_type': job.filter_type,
+            'city_code': job.city_code,
+            'filters': job.filters,
+            'run_id': new_run_id(user_id),
+            'done': asyncio.Event()
+        }
+        self.active_sessions[user_id] = session
+        keyboard = self.progress_monitor.create_cancel_keyboard(language)
+        
+        async def show_progress(progress):
+            current = progress.get('current_listing', 0)
+            total = progress.get('total_listings_to_check', 0)
+            if language == 'hebrew':
+                text = f"{selection_info}\n\n🔄 סורק... {current}/{total}\n\n⏹️ לחץ על כפתור הביטול כדי לעצור את הסריקה"
+            else:
+                text = f"{selection_info}\n\n🔄 Scanning... {current}/{total}\n\n⏹️ Click cancel button to stop scraping"
+            await status_message.edit_text(text, reply_markup=keyboard)
+        
+        try:
+            status, results_file = await self._run_on_broker(session, job.page_limit, SCAN_JOB_TIMEOUT, show_progress)
+            if results_file:
+                self._cache_result(scan_key, results_file, session['run_id'])
+                await self._send_final_results(status_message, results_file, language, selection_info, session['run_id'])
+            elif status != 'cancelled':
+                completion_text = "✅ הסריקה הושלמה - לא נמצאו מודעות" if language == 'hebrew' else "✅ Scraping completed - no listings found"
+                await status_message.edit_text(f"{selection_info}\n\n{completion_text}")
+        finally:
+            session['done'].set()
+            self.active_sessions.pop(user_id, None)
+    
     async def _monitor_complete_process(self, session):
         """Monitor the complete scraping and phone extraction process."""
         user_id = session['user_id']
@@ -442,13 +832,14 @@ class FinalScraperManager:
         mode = session.get('mode')
         filter_type = session.get('filter_type')
         process = session['process']
+        progress_monitor = session['progress_monitor']
         
         try:  # Main monitoring try block
             logger.info(f"[Monitor] Starting complete process monitoring for user {user_id}")
             
             # PHASE 1: Monitor scraper progress with real-time updates
             logger.info(f"[Monitor] Starting scraper progress monitoring")
-            await self.progress_monitor.monitor_scraper_progress(
+            await progress_monitor.monitor_scraper_progress(
                 status_message, language, user_id, selection_info, city_name, mode, filter_type
             )
             logger.info(f"[Monitor] Scraper progress monitoring completed")
@@ -469,7 +860,7 @@ class FinalScraperManager:
             
             # Find the CSV file that was created
             today_str = datetime.now().strftime('%Y-%m-%d')
-            expected_csv_pattern = f"/home/ubuntu/yad2bot_scraper/data/{city_name}_{mode}_{filter_type}_{today_str}_*.csv"
+            expected_csv_pattern = os.path.join(session['output_dir'], f"{city_name}_{mode}_{filter_type}_{today_str}_*.csv")
             csv_files = glob.glob(expected_csv_pattern)
             
             found_listings_count = 0
@@ -491,7 +882,7 @@ class FinalScraperManager:
                 logger.warning(f"[Monitor] No CSV file found matching pattern: {expected_csv_pattern}")
             
             # Store the count for Phase 2 to use
-            self.progress_monitor.csv_listings_count = found_listings_count
+            progress_monitor.csv_listings_count = found_listings_count
             
             # ========== ALWAYS CONTINUE TO PHASE 2 ==========
             if found_listings_count == 0:
@@ -504,7 +895,7 @@ class FinalScraperManager:
             
             # PHASE 2: Monitor phone extraction progress
             logger.info(f"[Monitor] Calling monitor_phone_extraction_progress")
-            result = await self.progress_monitor.monitor_phone_extraction_progress(
+            result = await progress_monitor.monitor_phone_extraction_progress(
                 status_message, language, user_id, selection_info, city_name, mode, filter_type
             )
             
@@ -514,23 +905,47 @@ class FinalScraperManager:
             
             # PHASE 3: Wait for final results and send them
             logger.info(f"[Monitor] Waiting for final results file")
-            results_file = await self.progress_monitor.wait_for_results_file(user_id, city_name, mode, filter_type)
+            results_file = await progress_monitor.wait_for_results_file(user_id, city_name, mode, filter_type)
             
             if results_file:
-                await self._send_final_results(status_message, results_file, language, selection_info)
+                followers = session.get('followers', [])
+                subscribers = list(session.get('subscribers', []))
+                shared_by = 1 + len(followers) + len(subscribers)
+                session['results_file'] = results_file
+                self._cache_result(session['scan_key'], results_file, session.get('run_id'))
+                self._finish_inflight(session, served=True)
+                await self._send_final_results(status_message, results_file, language, selection_info,
+                                               session.get('run_id'), shared_by=shared_by,
+                                               progress_dir=session['output_dir'])
+                # Users who attached to this run get the same result file
+                for subscriber in subscribers:
+                    await self._send_final_results(subscriber['status_message'], results_file,
+                                                   subscriber['language'], subscriber['selection_info'],
+                                                   session.get('run_id'), shared_by=shared_by,
+                                                   progress_dir=session['output_dir'])
+                if followers:
+                    await self._fan_out_results(session, results_file)
                 return "completed_with_results"
             else:
                 # No results file found, but process completed
                 completion_text = "✅ הסריקה הושלמה" if language == 'hebrew' else "✅ Scraping completed"
                 # Removed: await status_message.edit_text(completion_text)
+                # Attached users saw the same final progress; running it again would find nothing either
+                self._finish_inflight(session, served=True)
                 return "completed_no_results"
             
         except Exception as e:
             logger.error(f"[Monitor] Error in complete process monitoring: {e}")
             return f"monitor_error: {str(e)}"
+        
+        finally:
+            self._finish_inflight(session)
     
-    async def _send_final_results(self, status_message, results_file: str, language: str, selection_info: str):
-        """Send final results to user."""
+    async def _send_final_results(self, status_message, results_file: str, language: str, selection_info: str, run_id: str = None, shared_by: int = 1, progress_dir: str = None):
+        """Send final results to user.
+        
+        progress_dir is the run's own directory; its checking_progress file has the duplicates count.
+        """
         try:
             logger.info(f"[Results] Sending final results: {results_file}")
             
@@ -545,8 +960,7 @@ class FinalScraperManager:
                     reader = csv.DictReader(f)
                     for row in reader:
                         total_listings += 1
-                        phone = row.get('phone_number', '').strip()
-                        if phone and phone != '0501234567' and len(phone) >= 9:
+                        if Listing.from_csv_row(row).has_real_phone:
                             phone_count += 1
             except Exception as e:
                 logger.error(f"[Results] Error counting phones: {e}")
@@ -555,12 +969,8 @@ class FinalScraperManager:
             
             # Count duplicates from checking_progress file
             try:
-                import os
-                import glob
-                data_dir = '/home/ubuntu/yad2bot_scraper/data'
-                
-                # Find the most recent checking_progress file
-                progress_files = glob.glob(os.path.join(data_dir, '*_checking_progress.json'))
+                # The run's checking_progress file (none for runs on worker nodes)
+                progress_files = glob.glob(os.path.join(progress_dir, '*_checking_progress.json')) if progress_dir else []
                 if progress_files:
                     # Sort by modification time, get most recent
                     latest_file = max(progress_files, key=os.path.getmtime)
@@ -688,7 +1098,9 @@ class FinalScraperManager:
                     csv_file_path=results_file,
                     total_listings=total_listings,
                     phone_numbers_count=phone_count,
-                    city_code=city_code
+                    city_code=city_code,
+                    run_id=run_id,
+                    shared_by=shared_by
                 )
                 
                 logger.info(f"[Results] Saved results to database for user {user_id}")
@@ -716,6 +1128,75 @@ class FinalScraperManager:
             else:
                 logger.warning(f"[Monitor] Session for user {user_id} was already removed from active_sessions")
     
+    async def _fan_out_results(self, session, results_file: str):
+        """Send a shared scan's results to its followers, each without the listings they already have."""
+        mode = session.get('mode')
+        filter_type = session.get('filter_type')
+        followers = session.get('followers', [])
+        shared_by = 1 + len(followers)
+        bot = self.bot_instance or session['status_message'].get_bot()
+        
+        try:
+            with open(results_file, 'r', encoding='utf-8') as f:
+                reader = csv.DictReader(f)
+                fieldnames = reader.fieldnames
+                rows = list(reader)
+        except Exception as e:
+            logger.error(f"[Results] Error reading shared results {results_file}: {e}")
+            return
+        
+        for follower_id in followers:
+            try:
+                listings = [Listing.from_csv_row(row) for row in rows]
+                unseen = db.get_unseen_listing_urls(follower_id, [l.listing_url for l in listings if l.listing_url])
+                user_rows = [row for row, listing in zip(rows, listings)
+                             if not listing.listing_url or listing.listing_url in unseen]
+                duplicates_count = len(rows) - len(user_rows)
+                phone_count = sum(1 for row in user_rows if Listing.from_csv_row(row).has_real_phone)
+                
+                # Each follower gets their own file, so their CRM sync and result row stay their own
+                base, ext = os.path.splitext(results_file)
+                user_file = f"{base}_user{follower_id}{ext}"
+                with open(user_file, 'w', encoding='utf-8', newline='') as f:
+                    writer = csv.DictWriter(f, fieldnames=fieldnames)
+                    writer.writeheader()
+                    writer.writerows(user_rows)
+                
+                language = db.get_user_language(follower_id)
+                selection_info = self.get_selection_info(session.get('context') or SimpleNamespace(
+                    mode=mode, filter_type=filter_type, city_code=session.get('city_code')), language)
+                if language == 'hebrew':
+                    text = (f"{selection_info}\n\n✅ הסריקה המתוזמנת הושלמה!\n\n📊 נמצאו: {len(user_rows)} מודעות\n"
+                            f"⏭️ כפילויות: {duplicates_count}\n🔍 מספרי טלפון: {phone_count}")
+                else:
+                    text = (f"{selection_info}\n\n✅ Scheduled scan completed!\n\n📊 Found: {len(user_rows)} listings\n"
+                            f"📞 Phone numbers: {phone_count}")
+                
+                if phone_count > 0:
+                    with open(user_file, 'rb') as f:
+                        await bot.send_document(chat_id=follower_id, document=f,
+                                                filename=os.path.basename(user_file), caption=text)
+                else:
+                    await bot.send_message(chat_id=follower_id, text=text)
+                
+                db.save_scraping_result(
+                    user_id=follower_id,
+                    mode=mode,
+                    filter_type=filter_type,
+                    csv_file_path=user_file,
+                    total_listings=len(user_rows),
+                    phone_numbers_count=phone_count,
+                    city_code=session.get('city_code'),
+                    run_id=session.get('run_id'),
+                    shared_by=shared_by
+                )
+                logger.info(f"[Results] Shared scan results sent to user {follower_id}: "
+                            f"{len(user_rows)} listings, {duplicates_count} already seen")
+            except Exception as e:
+                logger.error(f"[Results] Error sending shared results to user {follower_id}: {e}")
+        
+        logger.info(f"[Results] Scan {session.get('run_id')} served {shared_by} users (dedup ratio {shared_by:.1f})")
+    
     async def run_scraper(self, update: Update, context: ContextTypes.DEFAULT_TYPE, mode: str, filter_type: str, city_code: str = None):
         """Run scraper with callback query - delegates to main method."""
         try:
@@ -725,8 +1206,8 @@ class FinalScraperManager:
             # Use the existing message for progress updates
             status_message = update.callback_query.message
             
-            # Delegate to the main method
-            await self.run_scraper_with_message(status_message, context, mode, filter_type, city_code)
+            # Queue it; a worker runs it through the main method
+            await self.submit_scan(status_message, context, mode, filter_type, city_code)
                 
         except Exception as e:
             logger.error(f"[ScraperManager] Error in run_scraper: {e}")
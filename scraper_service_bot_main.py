@@ -5,7 +5,8 @@ import signal
 import sys
 from dotenv import load_dotenv
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
-from bot_handlers import BotHandlers
+from bot_handlers import BotHandlers, TelegramRequestLimiter
+from zenrows_key_pool import load_api_keys
 
 load_dotenv('yad2bot.env')
 
@@ -41,6 +42,13 @@ async def post_init(application):
     scheduler.set_bot_instance(application.bot)
     scheduler.set_scraper_manager(handlers.scraper_manager)
     
+    # Start scan queue workers (resumes scans queued before a restart)
+    handlers.scraper_manager.start_queue()
+    
+    # Deliver live new-listing alerts (starts the watcher while anyone watches a city)
+    from listing_watch import get_watch_service
+    get_watch_service().start(application.bot)
+    
     # Start scheduler
     await scheduler.start()
     logger.info("✅ Scheduler started and loaded")
@@ -50,7 +58,12 @@ def main():
     
     logger.info(f"Starting Scraper Service Bot")
     
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Every scan needs a ZenRows key: refuse to start without one
+    logger.info(f"✅ {len(load_api_keys())} ZenRows API key(s) configured")
+    
+    # Every send and edit (handlers, scheduler, watch alerts, progress) stays under
+    # Telegram's per-chat and bot-wide flood limits
+    application = Application.builder().token(BOT_TOKEN).rate_limiter(TelegramRequestLimiter()).build()
     
     handlers = BotHandlers()
     handlers.bot = application.bot
@@ -0,0 +1,257 @@
+"""
+Shared Backoff - מצב Backoff ומפסק זרם משותף לכל התהליכים
+AdaptiveBackoff whose level and counters live in a small SQLite file, keyed per
+upstream host, plus a circuit breaker (closed / open / half-open) on top of it.
+Every scraper subprocess, phone extractor and worker reads and updates the
+same row in one IMMEDIATE transaction, so a new scan starts from the level the
+previous one left behind instead of from NORMAL.
+The sliding health window (error rate, latency, blocking indicators) stays
+per process; only the level, counters and circuit state are shared.
+"""
+
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from adaptive_backoff import AdaptiveBackoff, BackoffLevel
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.environ.get('YAD2BOT_STATE_DIR', '/home/ubuntu/yad2bot_scraper/data')
+BACKOFF_DB_PATH = os.environ.get('YAD2BOT_BACKOFF_DB', os.path.join(STATE_DIR, 'backoff_state.db'))
+
+# Host whose blocking the scraper watches (ZenRows is only the transport)
+DEFAULT_UPSTREAM_HOST = os.environ.get('YAD2_UPSTREAM_HOST', 'www.yad2.co.il')
+
+# Consecutive failures that open the circuit
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('YAD2_CIRCUIT_FAILURES', '5'))
+# How long an open circuit rejects requests before letting one probe through
+CIRCUIT_OPEN_SECONDS = float(os.environ.get('YAD2_CIRCUIT_OPEN_SECONDS', '120'))
+# A half-open probe that never reports back frees the slot after this long
+PROBE_TIMEOUT_SECONDS = 90.0
+# State untouched for this long is stale; the host is treated as healthy again
+STATE_TTL_SECONDS = float(os.environ.get('YAD2_BACKOFF_TTL_SECONDS', '1800'))
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+
+class BackoffStore:
+    """SQLite table of backoff and circuit state, one row per upstream host."""
+
+    def __init__(self, db_path: str = BACKOFF_DB_PATH):
+        self.db_path = db_path
+        self.init_table()
+
+    def init_table(self) -> None:
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS backoff_state (
+                        host TEXT PRIMARY KEY,
+                        level INTEGER DEFAULT 0,
+                        consecutive_failures INTEGER DEFAULT 0,
+                        consecutive_successes INTEGER DEFAULT 0,
+                        total_failures INTEGER DEFAULT 0,
+                        total_successes INTEGER DEFAULT 0,
+                        last_failure_time REAL,
+                        circuit_state TEXT DEFAULT 'closed', -- 'closed', 'open', 'half_open'
+                        opened_until REAL DEFAULT 0,
+                        probe_started REAL DEFAULT 0,
+                        updated_at REAL
+                    )
+                ''')
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error initializing backoff store: {e}")
+
+    @contextmanager
+    def transaction(self, host: str) -> Iterator[Dict[str, Any]]:
+        """Yield the host's row as a dict under a write lock and store it back on exit."""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.row_factory = sqlite3.Row
+            # IMMEDIATE takes the write lock up front: read-modify-write is atomic across processes
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT * FROM backoff_state WHERE host = ?', (host,)).fetchone()
+            state = dict(row) if row else {
+                'host': host, 'level': 0, 'consecutive_failures': 0, 'consecutive_successes': 0,
+                'total_failures': 0, 'total_successes': 0, 'last_failure_time': None,
+                'circuit_state': CIRCUIT_CLOSED, 'opened_until': 0, 'probe_started': 0, 'updated_at': None
+            }
+            try:
+                yield state
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            state['updated_at'] = time.time()
+            conn.execute('''
+                INSERT OR REPLACE INTO backoff_state (host, level, consecutive_failures, consecutive_successes,
+                    total_failures, total_successes, last_failure_time, circuit_state, opened_until,
+                    probe_started, updated_at)
+                VALUES (:host, :level, :consecutive_failures, :consecutive_successes, :total_failures,
+                    :total_successes, :last_failure_time, :circuit_state, :opened_until, :probe_started, :updated_at)
+            ''', state)
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+
+class SharedAdaptiveBackoff(AdaptiveBackoff):
+    """AdaptiveBackoff for one host, with state and circuit breaker shared through a BackoffStore.
+
+    The in-memory fields are a cache of the shared row: every call loads the row,
+    applies the normal AdaptiveBackoff logic and writes it back in one transaction.
+    """
+
+    def __init__(self, host: str = DEFAULT_UPSTREAM_HOST, store: Optional[BackoffStore] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.host = host
+        self.store = store or get_backoff_store()
+        self.circuit_state = CIRCUIT_CLOSED
+        self.opened_until = 0.0
+        self.refresh()
+
+    def _load(self, state: Dict[str, Any]) -> None:
+        now = time.time()
+        if (state['circuit_state'] == CIRCUIT_CLOSED and state['last_failure_time']
+                and now - state['last_failure_time'] > STATE_TTL_SECONDS):
+            # An old incident should not slow down a scan started much later
+            state.update(level=0, consecutive_failures=0, consecutive_successes=0)
+        self.current_level = BackoffLevel(state['level'])
+        self.consecutive_failures = state['consecutive_failures']
+        self.consecutive_successes = state['consecutive_successes']
+        self.total_failures = state['total_failures']
+        self.total_successes = state['total_successes']
+        self.last_failure_time = state['last_failure_time']
+        self.circuit_state = state['circuit_state']
+        self.opened_until = state['opened_until'] or 0.0
+
+    def _dump(self, state: Dict[str, Any]) -> None:
+        state.update(
+            level=self.current_level.value,
+            consecutive_failures=self.consecutive_failures,
+            consecutive_successes=self.consecutive_successes,
+            total_failures=self.total_failures,
+            total_successes=self.total_successes,
+            last_failure_time=self.last_failure_time,
+            circuit_state=self.circuit_state,
+            opened_until=self.opened_until
+        )
+
+    def _open_circuit(self, state: Dict[str, Any]) -> None:
+        self.circuit_state = CIRCUIT_OPEN
+        self.opened_until = time.time() + CIRCUIT_OPEN_SECONDS
+        state['probe_started'] = 0
+        logger.warning(f"Circuit for {self.host} opened for {CIRCUIT_OPEN_SECONDS:.0f}s "
+                       f"({self.consecutive_failures} consecutive failures, level {self.current_level.name})")
+
+    def refresh(self) -> None:
+        """Reload the shared state into this instance."""
+        try:
+            with self.store.transaction(self.host) as state:
+                self._load(state)
+        except Exception as e:
+            logger.warning(f"Could not read shared backoff state for {self.host}: {e}")
+
+    def register_success(self, latency: Optional[float] = None) -> None:
+        try:
+            with self.store.transaction(self.host) as state:
+                self._load(state)
+                super().register_success(latency)
+                if self.circuit_state != CIRCUIT_CLOSED:
+                    logger.info(f"Circuit for {self.host} closed after a successful probe")
+                    self.circuit_state = CIRCUIT_CLOSED
+                    self.opened_until = 0.0
+                    state['probe_started'] = 0
+                self._dump(state)
+        except Exception as e:
+            logger.warning(f"Could not update shared backoff state for {self.host}: {e}")
+            super().register_success(latency)
+
+    def register_failure(self, error_info: Optional[Dict[str, Any]] = None,
+                         latency: Optional[float] = None) -> None:
+        try:
+            with self.store.transaction(self.host) as state:
+                self._load(state)
+                super().register_failure(error_info, latency)
+                if self.circuit_state == CIRCUIT_HALF_OPEN:
+                    # The probe failed: stay away for another full period
+                    self._open_circuit(state)
+                elif (self.circuit_state == CIRCUIT_CLOSED
+                      and self.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD):
+                    self._open_circuit(state)
+                self._dump(state)
+        except Exception as e:
+            logger.warning(f"Could not update shared backoff state for {self.host}: {e}")
+            super().register_failure(error_info, latency)
+
+    def wait_time(self) -> float:
+        """Seconds to wait before the next request to this host (0 = go ahead).
+
+        When an open circuit's period is over, the first caller becomes the
+        half-open probe; everyone else waits until it reports back.
+        """
+        try:
+            with self.store.transaction(self.host) as state:
+                self._load(state)
+                now = time.time()
+                wait = 0.0
+                if self.circuit_state == CIRCUIT_OPEN:
+                    if now < self.opened_until:
+                        wait = self.opened_until - now
+                    else:
+                        self.circuit_state = CIRCUIT_HALF_OPEN
+                        state['probe_started'] = now
+                        logger.info(f"Circuit for {self.host} half-open, sending one probe request")
+                elif self.circuit_state == CIRCUIT_HALF_OPEN:
+                    probe_age = now - (state['probe_started'] or 0)
+                    if probe_age < PROBE_TIMEOUT_SECONDS:
+                        wait = min(5.0, PROBE_TIMEOUT_SECONDS - probe_age)
+                    else:
+                        state['probe_started'] = now
+                self._dump(state)
+                return wait
+        except Exception as e:
+            logger.warning(f"Could not read shared backoff state for {self.host}: {e}")
+            return 0.0
+
+    def should_abort(self) -> bool:
+        return self.circuit_state == CIRCUIT_OPEN or super().should_abort()
+
+    def get_stats(self) -> Dict[str, Any]:
+        self.refresh()
+        stats = super().get_stats()
+        stats.update(host=self.host, circuit_state=self.circuit_state,
+                     open_for=max(0.0, round(self.opened_until - time.time(), 1)))
+        return stats
+
+    def reset(self) -> None:
+        with self.store.transaction(self.host) as state:
+            super().reset()
+            self.circuit_state = CIRCUIT_CLOSED
+            self.opened_until = 0.0
+            state['probe_started'] = 0
+            self._dump(state)
+
+
+_backoff_store: Optional[BackoffStore] = None
+_shared_backoffs: Dict[str, SharedAdaptiveBackoff] = {}
+
+
+def get_backoff_store() -> BackoffStore:
+    global _backoff_store
+    if _backoff_store is None:
+        _backoff_store = BackoffStore()
+    return _backoff_store
+
+
+def get_shared_backoff(host: str = DEFAULT_UPSTREAM_HOST) -> SharedAdaptiveBackoff:
+    """Process-wide SharedAdaptiveBackoff for host."""
+    if host not in _shared_backoffs:
+        _shared_backoffs[host] = SharedAdaptiveBackoff(host)
+    return _shared_backoffs[host]
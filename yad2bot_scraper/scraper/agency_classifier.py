@@ -0,0 +1,142 @@
+"""
+Agency Classifier - detects agency/broker listings by keyword
+Compiles all agency keywords into one multi-pattern regex, built once, so each
+field is scanned a single time instead of once per keyword.
+"""
+
+import json
+import logging
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Pattern, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Hebrew agency keywords (same list is_private_owner always used)
+DEFAULT_AGENCY_KEYWORDS = ['תיווך', 'מתווך', 'משרד', 'רימקס', 'אנגלו סכסון', 'קבלן', 'חברה', 'נדל"ן']
+
+# Extra keywords, comma separated, e.g. YAD2_AGENCY_KEYWORDS="remax,century 21"
+EXTRA_KEYWORDS_ENV = 'YAD2_AGENCY_KEYWORDS'
+
+# Fields checked per listing, in the order they are reported
+AGENCY_FIELDS: List[Tuple[str, Callable[[Dict], Any]]] = [
+    ('title', lambda item: item.get('title', '')),
+    ('subtitle', lambda item: item.get('subtitle', '')),
+    ('merchant_name', lambda item: item.get('merchant_name', '')),
+    ('contact_name', lambda item: item.get('contact_name', '')),
+    ('description', lambda item: item.get('description', '')),
+    ('contact.name', lambda item: (item.get('contact') or {}).get('name', '')),
+    ('merchant.name', lambda item: (item.get('merchant') or {}).get('name', '')),
+]
+
+
+@dataclass(frozen=True)
+class AgencyMatch:
+    """Which keyword marked a listing as an agency, and where it was found."""
+    keyword: str
+    field: str
+
+
+def compile_keywords(keywords: Iterable[str]) -> Optional[Pattern]:
+    """Compile keywords into one alternation; longer keywords first so they win at the same offset."""
+    unique = sorted({keyword.lower() for keyword in keywords if keyword}, key=lambda k: (-len(k), k))
+    if not unique:
+        return None
+    return re.compile('|'.join(re.escape(keyword) for keyword in unique))
+
+
+class AgencyClassifier:
+    """Classifies feed items as agency listings using a precompiled keyword matcher."""
+
+    def __init__(self, keywords: Optional[Iterable[str]] = None,
+                 fields: Sequence[Tuple[str, Callable[[Dict], Any]]] = AGENCY_FIELDS):
+        self.fields = list(fields)
+        self._keywords = list(keywords) if keywords is not None else load_agency_keywords()
+        self._pattern = compile_keywords(self._keywords)
+
+    @property
+    def keywords(self) -> List[str]:
+        return sorted({keyword.lower() for keyword in self._keywords if keyword})
+
+    def add_keywords(self, keywords: Iterable[str]) -> None:
+        """Extend the keyword set and recompile the matcher."""
+        self._keywords.extend(keywords)
+        self._pattern = compile_keywords(self._keywords)
+
+    def classify(self, listing: Dict) -> Optional[AgencyMatch]:
+        """Return the first agency match for one listing, or None."""
+        if self._pattern is None:
+            return None
+
+        search = self._pattern.search
+        for field_name, getter in self.fields:
+            value = getter(listing)
+            if value:
+                match = search(str(value).lower())
+                if match:
+                    return AgencyMatch(keyword=match.group(), field=field_name)
+        return None
+
+    def classify_batch(self, listings: Sequence[Dict]) -> List[Optional[AgencyMatch]]:
+        """Return the first agency match (or None) for each listing on a page."""
+        return [self.classify(listing) for listing in listings]
+
+
+def load_agency_keywords() -> List[str]:
+    """Default keywords plus any extra ones from YAD2_AGENCY_KEYWORDS."""
+    keywords = list(DEFAULT_AGENCY_KEYWORDS)
+    extra = os.environ.get(EXTRA_KEYWORDS_ENV, '')
+    keywords.extend(keyword.strip() for keyword in extra.split(',') if keyword.strip())
+    return keywords
+
+
+def _naive_classify(listing: Dict, keywords: Sequence[str]) -> Optional[AgencyMatch]:
+    """The original per-field any(keyword in field) check, kept for benchmarking."""
+    for field_name, getter in AGENCY_FIELDS:
+        field = getter(listing)
+        if field:
+            field_lower = str(field).lower()
+            for indicator in keywords:
+                if indicator.lower() in field_lower:
+                    return AgencyMatch(keyword=indicator.lower(), field=field_name)
+    return None
+
+
+def benchmark(listings: Sequence[Dict], rounds: int = 5) -> Dict[str, Any]:
+    """Time the compiled matcher against the naive per-keyword scan on recorded feed items."""
+    classifier = AgencyClassifier()
+    keywords = classifier.keywords
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        naive = [_naive_classify(listing, keywords) for listing in listings]
+    naive_seconds = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        batched = classifier.classify_batch(listings)
+    batch_seconds = (time.perf_counter() - start) / rounds
+
+    return {
+        'listings': len(listings),
+        'agencies': sum(1 for match in batched if match),
+        'verdicts_agree': [m is None for m in naive] == [m is None for m in batched],
+        'naive_ms': round(naive_seconds * 1000, 2),
+        'batch_ms': round(batch_seconds * 1000, 2),
+    }
+
+
+if __name__ == '__main__':
+    # Usage: python3 agency_classifier.py <recorded_feed_items.json>
+    # The file holds a JSON list of feed items (e.g. dumped feedData entries)
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) != 2:
+        print("Usage: python3 agency_classifier.py <recorded_feed_items.json>")
+        sys.exit(1)
+
+    with open(sys.argv[1], 'r', encoding='utf-8') as f:
+        recorded = json.load(f)
+    print(benchmark(recorded))
@@ -0,0 +1,124 @@
+"""
+Feed Path Cache - remembers where listings live inside __NEXT_DATA__
+Persists the JSON path that yielded listings so the next page (and the next run)
+can go straight to it instead of walking the whole Next.js tree.
+"""
+
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+PathElement = Union[str, int]
+JsonPath = Tuple[PathElement, ...]
+
+
+def resolve_path(data: Any, path: JsonPath) -> Any:
+    """Follow a path of dict keys / list indices, returning None on any miss."""
+    current = data
+    for element in path:
+        if isinstance(element, int):
+            if not isinstance(current, list) or element >= len(current):
+                return None
+        elif not isinstance(current, dict) or element not in current:
+            return None
+        current = current[element]
+    return current
+
+
+def format_path(path: JsonPath) -> str:
+    """Render a path the same way the deep search logs it (a.b[0].c)."""
+    rendered = ""
+    for element in path:
+        if isinstance(element, int):
+            rendered += f"[{element}]"
+        else:
+            rendered += f".{element}" if rendered else element
+    return rendered
+
+
+class FeedPathCache:
+    """Persistent cache of discovered feed JSON paths, keyed by mode and page type."""
+
+    def __init__(self, cache_file: str):
+        self.cache_file = cache_file
+        self.paths: Dict[str, Dict[str, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    @staticmethod
+    def _key(mode: str, page_type: str) -> str:
+        return f"{mode}:{page_type}"
+
+    def _load(self) -> None:
+        """Load cached paths from disk (missing or corrupt file means empty cache)."""
+        try:
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    self.paths = json.load(f)
+                logger.info(f"Loaded {len(self.paths)} cached feed paths from {self.cache_file}")
+        except Exception as e:
+            logger.warning(f"Could not load feed path cache {self.cache_file}: {e}")
+            self.paths = {}
+
+    def _save(self) -> None:
+        """Write the cache atomically so concurrent scrapers never read half a file."""
+        try:
+            tmp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.paths, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.cache_file)
+        except Exception as e:
+            logger.warning(f"Could not save feed path cache {self.cache_file}: {e}")
+
+    def get(self, mode: str, page_type: str) -> Optional[Tuple[JsonPath, str]]:
+        """Return the cached (path, source) for this mode/page type, if any."""
+        entry = self.paths.get(self._key(mode, page_type))
+        if not entry:
+            return None
+        return tuple(entry['path']), entry.get('source', '')
+
+    def remember(self, mode: str, page_type: str, path: JsonPath, source: str) -> None:
+        """Store a newly discovered path (no-op if it is already the cached one)."""
+        key = self._key(mode, page_type)
+        entry = self.paths.get(key)
+        if entry and tuple(entry['path']) == tuple(path):
+            return
+
+        self.paths[key] = {
+            'path': list(path),
+            'source': source,
+            'discovered_at': datetime.now().isoformat()
+        }
+        logger.info(f"Discovered feed path for {key} via {source}: {format_path(path)}")
+        self._save()
+
+    def forget(self, mode: str, page_type: str) -> None:
+        """Drop a path that no longer validates."""
+        key = self._key(mode, page_type)
+        if self.paths.pop(key, None) is not None:
+            logger.info(f"Cached feed path for {key} no longer valid, removed")
+            self._save()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache hit/miss counters for logging."""
+        return {
+            'cached_paths': len(self.paths),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+def unwrap_feed_items(items: List[Any]) -> List[Dict]:
+    """Unwrap feed items the way extract_listings_from_nextjs always has (feedData or the item itself)."""
+    listings = []
+    for item in items:
+        if isinstance(item, dict) and 'feedData' in item:
+            listings.append(item['feedData'])
+        elif isinstance(item, dict):
+            listings.append(item)
+    return listings
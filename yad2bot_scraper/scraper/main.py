@@ -12,11 +12,23 @@ import re
 import subprocess
 import sys
 import time
+import tracemalloc
 from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlencode
 
 import requests
 from bs4 import BeautifulSoup
 
+from agency_classifier import AgencyClassifier
+from feed_path_cache import FeedPathCache, format_path, resolve_path, unwrap_feed_items
+from partial_json import decode_paths, find_next_data_bounds, measure_peak_mb
+from config import DEFAULT_EXTRACTION_STRATEGY
+from phone_strategies import (
+    PHONE_STRATEGIES, STRATEGY_STATS_FILE, StrategyStats,
+    configured_strategies, find_phone_in_html, find_phone_in_outputs
+)
+from scan_watermark import ScanWatermark, listing_version, watermark_scope
+
 # Import database check function
 sys.path.insert(0, '/root/yad2bot-service-scraper')
 try:
@@ -29,15 +41,19 @@ except ImportError as e:
     def check_lead_exists_in_mysql(url):
         return False
 
+from listing import CSV_FIELDS, Listing
+from scan_filters import ScanFilters
+from zenrows_fetcher import ZenRowsFetcher
+from zenrows_key_pool import NoKeyAvailable, get_key_pool
+from fetch_ledger import get_fetch_ledger
+from concurrency_controller import get_concurrency_controller
+
 # Configuration
 BASE_URLS = {
     'rent': 'https://www.yad2.co.il/realestate/rent?',
     'sale': 'https://www.yad2.co.il/realestate/forsale?'
 }
 
-ZENROWS_API_KEY = os.environ.get('ZENROWS_API_KEY')
-if not ZENROWS_API_KEY:
-    raise ValueError("ZENROWS_API_KEY environment variable is required")
 ZENROWS_API_URL = 'https://api.zenrows.com/v1/'
 
 # Directory configuration
@@ -60,10 +76,48 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Known locations of the feed items inside __NEXT_DATA__, tried in order
+FEED_LOCATIONS = [
+    # Original paths (with corrected feedItems)
+    ('props', 'pageProps', 'feed', 'feedItems'),
+    ('props', 'pageProps', 'initialData', 'feed', 'feedItems'),
+    ('props', 'pageProps', 'serverPage', 'feed', 'feedItems'),
+    
+    # Legacy paths (keep for compatibility)
+    ('props', 'pageProps', 'feed', 'feed_items'),
+    ('props', 'pageProps', 'initialData', 'feed', 'feed_items'),
+    ('props', 'pageProps', 'serverPage', 'feed', 'feed_items'),
+    
+    # Additional paths found in previous fixes
+    ('props', 'pageProps', 'feedData', 'items'),
+    ('props', 'pageProps', 'searchResults', 'items'),
+    ('props', 'pageProps', 'listings'),
+    ('props', 'pageProps', 'items')
+]
+
+# Feed pagination metadata, decoded alongside the feed items
+PAGINATION_LOCATIONS = [
+    ('props', 'pageProps', 'feed', 'pagination'),
+    ('props', 'pageProps', 'initialData', 'feed', 'pagination'),
+    ('props', 'pageProps', 'serverPage', 'feed', 'pagination')
+]
+
+# Decode only the feed arrays and pagination from feed pages (set to 'false' for full decode)
+PARTIAL_DECODE = os.environ.get('YAD2_PARTIAL_DECODE', 'true').lower() == 'true'
+# Log how much memory each feed page's decode allocated at its peak (tracemalloc slows
+# every allocation while it traces, so this is for measuring, not for production runs)
+DECODE_MEMORY_STATS = os.environ.get('YAD2_DECODE_MEMORY_STATS', 'false').lower() == 'true'
+
 class Yad2Scraper:
     """Enhanced Yad2 scraper supporting both rentals and sales."""
     
-    def __init__(self):
+    def __init__(self, partial_decode: bool = PARTIAL_DECODE, output_dir: Optional[str] = None):
+        self.partial_decode = partial_decode
+        if DECODE_MEMORY_STATS and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # Progress files, cancel flag and CSVs of this run (a per-run dir keeps concurrent scans apart)
+        self.output_dir = output_dir or DATA_DIR
+        os.makedirs(self.output_dir, exist_ok=True)
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
@@ -73,42 +127,62 @@ class Yad2Scraper:
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1'
         })
+        
+        # Learned location of the feed inside __NEXT_DATA__ (persisted across runs)
+        self.feed_path_cache = FeedPathCache(os.path.join(DATA_DIR, 'feed_path_cache.json'))
+        self.deep_search_count = 0
+        
+        # Tokens earlier scans of each city/mode handled, for --incremental runs
+        self.watermark = ScanWatermark(os.path.join(DATA_DIR, 'scan_watermarks.db'))
+        self.pending_watermark = None
+        # Pages the last filtered scrape_listings() fetched and saved (see report_pushdown)
+        self.pushdown_report = None
+        
+        # Agency keywords compiled once per scraper, not on every listing
+        self.agency_classifier = AgencyClassifier()
+        
+        # Phone strategy success/latency history, shared with the phone extractor
+        self.strategy_stats = StrategyStats(STRATEGY_STATS_FILE)
+        
+        # Static -> premium proxy -> js_render, learning per page type which tier is needed
+        # API keys come from the shared pool (ZENROWS_API_KEYS), least-loaded key per request
+        self.key_pool = get_key_pool()
+        # Every outbound fetch is recorded against YAD2BOT_RUN_ID / YAD2BOT_USER_ID
+        self.ledger = get_fetch_ledger()
+        # AIMD concurrency/pacing shared by every fetch this process makes
+        self.controller = get_concurrency_controller()
+        self.fetcher = ZenRowsFetcher(self.key_pool, ledger=self.ledger, controller=self.controller)
     
-    def fetch_with_zenrows(self, url: str) -> Optional[str]:
-        """Fetch URL using ZenRows API with simplified parameters."""
+    def fetch_with_zenrows(self, url: str, page_type: str = 'feed') -> Optional[str]:
+        """Fetch URL using ZenRows, cheapest tier first, escalating until __NEXT_DATA__ is present."""
         try:
-            # Simplified parameters to avoid timeouts
-            params = {
-                'url': url,
-                'apikey': ZENROWS_API_KEY,
-                'js_render': 'true',
-                'premium_proxy': 'true',
-                'proxy_country': 'IL'
-            }
-            
-            response = requests.get(ZENROWS_API_URL, params=params, timeout=60)
-            
-            if response.status_code == 200:
-                logger.info(f"Successfully fetched {url} (content length: {len(response.text)})")
-                return response.text
-            else:
-                logger.error(f"ZenRows API error: {response.status_code} - {response.text}")
-                return None
+            result = self.fetcher.fetch(url, page_type=page_type)
+            if result:
+                return result.text
+            return None
                 
         except Exception as e:
             logger.error(f"Error fetching {url}: {e}")
             return None
     
-    def extract_nextjs_data(self, html: str) -> Optional[Dict]:
-        """Extract Next.js data from HTML."""
+    def extract_nextjs_data(self, html: str, wanted_paths: Optional[List[Tuple]] = None) -> Optional[Dict]:
+        """Extract Next.js data from HTML.
+        
+        With wanted_paths, only those paths are decoded (partial decode) and the
+        rest of the tree is skipped; the result is a sparse tree.
+        """
         try:
             # Look for __NEXT_DATA__ script
-            pattern = r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>'
-            match = re.search(pattern, html, re.DOTALL)
-            
-            if match:
-                json_str = match.group(1)
-                return json.loads(json_str)
+            bounds = find_next_data_bounds(html)
+            
+            if bounds:
+                start, end = bounds
+                if wanted_paths:
+                    partial_data = decode_paths(html, wanted_paths, start)
+                    if resolve_path(partial_data, ('props', 'pageProps')):
+                        return partial_data
+                    logger.info("None of the wanted paths found in __NEXT_DATA__, decoding the full tree")
+                return json.loads(html[start:end])
             else:
                 logger.warning("No __NEXT_DATA__ found in HTML")
                 return None
@@ -117,52 +191,61 @@ class Yad2Scraper:
             logger.error(f"Error extracting Next.js data: {e}")
             return None
     
-    def extract_listings_from_nextjs(self, nextjs_data: Dict) -> List[Dict]:
+    def _feed_wanted_paths(self, mode: str) -> List[Tuple]:
+        """Paths the partial decoder keeps for feed pages: feed arrays and pagination."""
+        wanted = list(FEED_LOCATIONS) + list(PAGINATION_LOCATIONS)
+        cached = self.feed_path_cache.get(mode, 'feed')
+        if cached:
+            wanted.insert(0, cached[0])
+        return wanted
+    
+    def _get_pagination(self, nextjs_data: Dict) -> Optional[Dict]:
+        """Return the feed pagination metadata, if the page has it."""
+        for path in PAGINATION_LOCATIONS:
+            pagination = resolve_path(nextjs_data, path)
+            if isinstance(pagination, dict):
+                return pagination
+        return None
+    
+    def extract_listings_from_nextjs(self, nextjs_data: Dict, mode: str = 'rent', page_type: str = 'feed') -> List[Dict]:
         """Extract listings from Next.js data with enhanced strategy."""
         try:
             listings = []
             
             # Navigate through the data structure to find listings
             if 'props' in nextjs_data and 'pageProps' in nextjs_data['props']:
-                page_props = nextjs_data['props']['pageProps']
+                # Try the path that worked last time first
+                cached = self.feed_path_cache.get(mode, page_type)
+                if cached:
+                    cached_path, source = cached
+                    # Paths found by the deep search must still look like listings;
+                    # known feed locations are trusted as they always were
+                    listings = self._listings_at_path(nextjs_data, cached_path, strict=(source == 'deep_search'))
+                    if listings:
+                        self.feed_path_cache.hits += 1
+                        logger.info(f"Found {len(listings)} listings at cached path {format_path(cached_path)}")
+                        return listings
+                    self.feed_path_cache.misses += 1
+                    self.feed_path_cache.forget(mode, page_type)
                 
                 # Enhanced feed locations based on previous fixes
-                feed_locations = [
-                    # Original paths (with corrected feedItems)
-                    page_props.get('feed', {}).get('feedItems', []),
-                    page_props.get('initialData', {}).get('feed', {}).get('feedItems', []),
-                    page_props.get('serverPage', {}).get('feed', {}).get('feedItems', []),
-                    
-                    # Legacy paths (keep for compatibility)
-                    page_props.get('feed', {}).get('feed_items', []),
-                    page_props.get('initialData', {}).get('feed', {}).get('feed_items', []),
-                    page_props.get('serverPage', {}).get('feed', {}).get('feed_items', []),
-                    
-                    # Additional paths found in previous fixes
-                    page_props.get('feedData', {}).get('items', []),
-                    page_props.get('searchResults', {}).get('items', []),
-                    page_props.get('listings', []),
-                    page_props.get('items', [])
-                ]
-                
-                for location in feed_locations:
+                for path in FEED_LOCATIONS:
+                    location = resolve_path(nextjs_data, path)
                     if location and isinstance(location, list):
                         # Check if items have feedData structure
-                        for item in location:
-                            if isinstance(item, dict) and 'feedData' in item:
-                                listings.append(item['feedData'])
-                            elif isinstance(item, dict):
-                                listings.append(item)
+                        listings = unwrap_feed_items(location)
                         
                         if listings:
                             logger.info(f"Found {len(listings)} listings in feed location")
+                            self.feed_path_cache.remember(mode, page_type, path, 'feed_location')
                             break
                 
                 # If still no listings, do a deep search
                 if not listings:
-                    listings = self._deep_search_for_listings(page_props)
+                    listings, path = self._deep_search_for_listings(nextjs_data['props']['pageProps'])
                     if listings:
                         logger.info(f"Found {len(listings)} listings via deep search")
+                        self.feed_path_cache.remember(mode, page_type, ('props', 'pageProps') + path, 'deep_search')
             
             logger.info(f"Extracted {len(listings)} listings from Next.js data")
             return listings
@@ -171,31 +254,45 @@ class Yad2Scraper:
             logger.error(f"Error extracting listings from Next.js data: {e}")
             return []
     
-    def _deep_search_for_listings(self, data) -> List[Dict]:
-        """Recursively search for listings in data structure with enhanced patterns."""
-        listings = []
+    def _listings_at_path(self, nextjs_data: Dict, path: Tuple, strict: bool = True) -> List[Dict]:
+        """Return the listings at a cached path, or [] if the path no longer holds listings."""
+        location = resolve_path(nextjs_data, path)
+        if not location or not isinstance(location, list):
+            return []
         
-        def search_recursive(obj, path=""):
-            nonlocal listings
-            
+        listings = unwrap_feed_items(location)
+        # Validate: the first item must still look like a listing
+        if listings and (not strict or self._looks_like_listing(listings[0])):
+            return listings
+        return []
+    
+    def _deep_search_for_listings(self, data) -> Tuple[List[Dict], Tuple]:
+        """Recursively search for listings in data structure with enhanced patterns.
+        
+        Returns the listings and the path (relative to data) where they were found.
+        """
+        self.deep_search_count += 1
+        logger.info(f"Running deep search for listings (walk #{self.deep_search_count} this run)")
+        
+        # Check for known listing array patterns
+        listing_keys = [
+            'feed_items', 'feedItems', 'items', 'listings', 'results', 
+            'data', 'content', 'ads', 'properties', 'realestate'
+        ]
+        
+        def search_recursive(obj, path=()):
             if isinstance(obj, dict):
-                # Check for known listing array patterns
-                listing_keys = [
-                    'feed_items', 'feedItems', 'items', 'listings', 'results', 
-                    'data', 'content', 'ads', 'properties', 'realestate'
-                ]
-                
                 for key in listing_keys:
                     if key in obj and isinstance(obj[key], list) and obj[key]:
                         # Validate that this looks like a listings array
                         sample_item = obj[key][0] if obj[key] else {}
                         if isinstance(sample_item, dict) and self._looks_like_listing(sample_item):
-                            logger.info(f"Found listings array at path: {path}.{key}")
-                            return obj[key]
+                            logger.info(f"Found listings array at path: {format_path(path + (key,))}")
+                            return obj[key], path + (key,)
                 
                 # Continue recursive search
                 for key, value in obj.items():
-                    result = search_recursive(value, f"{path}.{key}" if path else key)
+                    result = search_recursive(value, path + (key,))
                     if result:
                         return result
             
@@ -203,19 +300,19 @@ class Yad2Scraper:
                 # Check if this list contains listings
                 sample_item = obj[0] if obj else {}
                 if isinstance(sample_item, dict) and self._looks_like_listing(sample_item):
-                    logger.info(f"Found listings list at path: {path}")
-                    return obj
+                    logger.info(f"Found listings list at path: {format_path(path)}")
+                    return obj, path
                 
                 # Search within list items
                 for i, item in enumerate(obj):
-                    result = search_recursive(item, f"{path}[{i}]" if path else f"[{i}]")
+                    result = search_recursive(item, path + (i,))
                     if result:
                         return result
             
             return None
         
         result = search_recursive(data)
-        return result if result else []
+        return result if result else ([], ())
     
     def _looks_like_listing(self, item: Dict) -> bool:
         """Check if an item looks like a real estate listing."""
@@ -235,185 +332,93 @@ class Yad2Scraper:
     
     def is_private_owner(self, listing: Dict) -> bool:
         """Check if listing is from a private owner."""
-        try:
+        return self.classify_private_owners([listing])[0]
+    
+    def classify_private_owners(self, listings: List[Dict]) -> List[bool]:
+        """Check a page of listings for private owners in one batch."""
+        verdicts: List[Optional[bool]] = []
+        undecided = []
+        
+        for listing in listings:
             # Check adType field (new structure)
             ad_type = listing.get('adType', '')
             if ad_type == 'private':
-                return True
+                verdicts.append(True)
             elif ad_type == 'business':
-                return False
-            
+                verdicts.append(False)
             # Check merchant type (legacy)
-            if listing.get('merchantType') == 'private':
-                return True
-            
-            # Check for agency indicators in various fields
-            agency_indicators = ['תיווך', 'מתווך', 'משרד', 'רימקס', 'אנגלו סכסון', 'קבלן', 'חברה', 'נדל"ן']
-            
-            fields_to_check = [
-                listing.get('title', ''),
-                listing.get('subtitle', ''),
-                listing.get('merchant_name', ''),
-                listing.get('contact_name', ''),
-                listing.get('description', ''),
-                # Check nested fields
-                listing.get('contact', {}).get('name', ''),
-                listing.get('merchant', {}).get('name', ''),
-            ]
-            
-            for field in fields_to_check:
-                if field:
-                    field_lower = str(field).lower()
-                    if any(indicator.lower() in field_lower for indicator in agency_indicators):
-                        return False
-            
-            # If adType is 'private', it's definitely private
-            if ad_type == 'private':
-                return True
-            
-            # Default to True if no clear agency indicators found
-            return True
-            
+            elif listing.get('merchantType') == 'private':
+                verdicts.append(True)
+            else:
+                verdicts.append(None)
+                undecided.append(len(verdicts) - 1)
+        
+        # Check for agency indicators in the text fields of the remaining listings
+        try:
+            matches = self.agency_classifier.classify_batch([listings[i] for i in undecided])
         except Exception as e:
             logger.error(f"Error checking if private owner: {e}")
-            return False
-    
-    def extract_listing_details(self, listing: Dict) -> Optional[Dict]:
-        """Extract detailed information from a listing."""
-        try:
-            # Extract basic information using the actual data structure
-            listing_data = {
-                'id': listing.get('token', ''),
-                'title': '',
-                'price': listing.get('price', ''),
-                'rooms': '',
-                'size': '',
-                'address': '',
-                'phone_number': '',
-                'owner_name': '',
-                'publish_date': '',
-                'listing_url': f"https://www.yad2.co.il/item/{listing.get('token', '')}"
-            }
-            
-            # Extract address from the nested structure
-            address_parts = []
-            address_info = listing.get('address', {})
-            
-            if address_info.get('city', {}).get('text'):
-                address_parts.append(address_info['city']['text'])
-            if address_info.get('neighborhood', {}).get('text'):
-                address_parts.append(address_info['neighborhood']['text'])
-            if address_info.get('street', {}).get('text'):
-                address_parts.append(address_info['street']['text'])
-            if address_info.get('house', {}).get('number'):
-                address_parts.append(str(address_info['house']['number']))
-            
-            listing_data['address'] = ', '.join(address_parts)
-            
-            # Extract property details
-            additional_details = listing.get('additionalDetails', {})
-            property_info = additional_details.get('property', {})
-            
-            # rooms is in additionalDetails.roomsCount
-            if additional_details.get('roomsCount'):
-                listing_data['rooms'] = str(additional_details['roomsCount'])
-            # size is in additionalDetails.squareMeter
-            if additional_details.get('squareMeter'):
-                listing_data['size'] = str(additional_details['squareMeter'])
-            
-            # Extract title from metadata or create one
-            meta_data = listing.get('metaData', {})
-            if meta_data.get('title'):
-                listing_data['title'] = meta_data['title']
+            return [bool(verdict) for verdict in verdicts]
+        
+        for index, match in zip(undecided, matches):
+            if match:
+                logger.debug(f"Agency listing {listings[index].get('token')}: '{match.keyword}' in {match.field}")
+                verdicts[index] = False
             else:
-                # Create title from available info
-                title_parts = []
-                if listing_data['rooms']:
-                    title_parts.append(f"{listing_data['rooms']} חדרים")
-                if address_info.get('neighborhood', {}).get('text'):
-                    title_parts.append(address_info['neighborhood']['text'])
-                listing_data['title'] = ', '.join(title_parts) if title_parts else 'דירה להשכרה'
-            
-            # Extract real phone number from individual listing page
-            listing_data["phone_number"] = "0501234567"  # Stage 1 placeholder
-            
-            return listing_data
-            
-        except Exception as e:
-            logger.error(f"Error extracting listing details: {e}")
-            return None
+                # Default to True if no clear agency indicators found
+                verdicts[index] = True
+        
+        return verdicts
     
     def get_phone_number_from_listing(self, listing_url: str) -> str:
         """Get phone number from individual listing page using ZenRows."""
         try:
             logger.info(f"Attempting to get phone number for listing: {listing_url}")
             
-            # First attempt: Try with JavaScript instructions to click "Show Phone" button
-            js_instructions = [
-                {"wait": 3000},
-                {"click": ".viewPhone"},
-                {"wait": 2000},
-                {"click": "[data-testid='contact-info-phone']"},
-                {"wait": 2000}
-            ]
-            
-            params = {
-                'url': listing_url,
-                'apikey': ZENROWS_API_KEY,
-                'js_render': 'true',
-                'js_instructions': json.dumps(js_instructions),
-                'premium_proxy': 'true',
-                'proxy_country': 'IL',
-                'outputs': 'phone_numbers',
-                'wait': '5000'
-            }
-            
-            response = requests.get(ZENROWS_API_URL, params=params, timeout=60)
-            
-            if response.status_code == 200:
-                html_content = response.text
-                
-                # Try to extract phone number using regex
-                phone_patterns = [
-                    r'05\d-?\d{7}',
-                    r'0\d{1,2}-?\d{7}',
-                    r'\+972-?5\d-?\d{7}',
-                    r'tel:(\+?972-?5\d-?\d{7})',
-                    r'href="tel:([^"]+)"'
-                ]
-                
-                for pattern in phone_patterns:
-                    matches = re.findall(pattern, html_content)
-                    if matches:
-                        phone = matches[0]
-                        # Clean the phone number
-                        phone = re.sub(r'[^\d]', '', phone)
-                        if phone.startswith('972'):
-                            phone = '0' + phone[3:]
-                        if len(phone) == 10 and phone.startswith('05'):
-                            logger.info(f"Found phone number: {phone}")
-                            return phone
-                
-                # Try to find phone in specific HTML elements
-                soup = BeautifulSoup(html_content, 'html.parser')
+            # Same strategies (click selectors, parsers) and learned ordering as the phone extractor
+            names = self.strategy_stats.order(configured_strategies(), DEFAULT_EXTRACTION_STRATEGY)
+            for name in names:
+                strategy = PHONE_STRATEGIES[name]
+                params = {
+                    'url': listing_url,
+                    'js_render': 'true',
+                    'js_instructions': json.dumps(strategy.js_instructions()),
+                    'premium_proxy': 'true',
+                    'proxy_country': 'IL',
+                    'outputs': strategy.outputs or 'phone_numbers',
+                    'wait': str(strategy.wait_ms)
+                }
                 
-                # Look for phone in various elements
-                phone_selectors = [
-                    '.contact-info-phone',
-                    '[data-testid="contact-info-phone"]',
-                    '.phone-number',
-                    '.viewPhone',
-                    '[href^="tel:"]'
-                ]
+                phone, source, pattern = '', '', ''
+                request_start = time.time()
+                try:
+                    with self.controller.slot(), self.key_pool.lease() as lease:
+                        request_start = time.time()
+                        params['apikey'] = lease.api_key
+                        response = requests.get(ZENROWS_API_URL, params=params, timeout=60)
+                        lease.report(response)
+                    latency = time.time() - request_start
+                    self.ledger.record('phone', params, response, latency)
+                    self.controller.record_response(response, latency)
+                    
+                    if response.status_code == 200:
+                        if 'application/json' in response.headers.get('Content-Type', ''):
+                            phone, source, pattern = find_phone_in_outputs(response.json())
+                        else:
+                            phone, source, pattern = find_phone_in_html(response.content)
+                except (requests.RequestException, NoKeyAvailable) as e:
+                    # A timeout or connection error is this strategy's failure; the next one still gets its turn
+                    latency = time.time() - request_start
+                    logger.warning(f"{name} strategy request failed for {listing_url}: {e}")
+                    if isinstance(e, requests.RequestException):
+                        # A request was sent (NoKeyAvailable means none was)
+                        self.ledger.record('phone', params, None, latency)
+                        self.controller.record_error(e)
+                self.strategy_stats.record(name, phone, latency, source, pattern)
                 
-                for selector in phone_selectors:
-                    elements = soup.select(selector)
-                    for element in elements:
-                        text = element.get_text() or element.get('href', '')
-                        phone_matches = re.findall(r'05\d{8}', text)
-                        if phone_matches:
-                            logger.info(f"Found phone number in element: {phone_matches[0]}")
-                            return phone_matches[0]
+                if phone:
+                    logger.info(f"Found phone number via {name} in {source}: {phone}")
+                    return phone
             
             logger.warning(f"Could not extract phone number from {listing_url}")
             return ""
@@ -421,6 +426,9 @@ class Yad2Scraper:
         except Exception as e:
             logger.error(f"Error getting phone number from {listing_url}: {e}")
             return ""
+        
+        finally:
+            self.strategy_stats.save()
     
     def get_listing_details_from_page(self, listing_url: str) -> Dict[str, str]:
         """Extract additional details (rooms, floor, owner_name, publish_date) from individual listing page."""
@@ -435,7 +443,7 @@ class Yad2Scraper:
             logger.info(f"Extracting additional details from: {listing_url}")
             
             # Fetch the listing page
-            html_content = self.fetch_with_zenrows(listing_url)
+            html_content = self.fetch_with_zenrows(listing_url, page_type='item')
             if not html_content:
                 logger.warning(f"Failed to fetch listing page: {listing_url}")
                 return details
@@ -508,66 +516,11 @@ class Yad2Scraper:
             logger.error(f"Error extracting listing details from {listing_url}: {e}")
             return details
     
-    def extract_listing_details(self, listing: Dict) -> Optional[Dict]:
+    def extract_listing_details(self, listing: Dict) -> Optional[Listing]:
         """Extract detailed information from a listing."""
         try:
             # Extract basic information using the actual data structure
-            listing_data = {
-                'id': listing.get('token', ''),
-                'title': '',
-                'price': listing.get('price', ''),
-                'rooms': '',
-                'size': '',
-                'address': '',
-                'phone_number': '',
-                'owner_name': '',
-                'publish_date': '',
-                'listing_url': f"https://www.yad2.co.il/item/{listing.get('token', '')}"
-            }
-            
-            # Extract address from the nested structure
-            address_parts = []
-            address_info = listing.get('address', {})
-            
-            if address_info.get('city', {}).get('text'):
-                address_parts.append(address_info['city']['text'])
-            if address_info.get('neighborhood', {}).get('text'):
-                address_parts.append(address_info['neighborhood']['text'])
-            if address_info.get('street', {}).get('text'):
-                address_parts.append(address_info['street']['text'])
-            if address_info.get('house', {}).get('number'):
-                address_parts.append(str(address_info['house']['number']))
-            
-            listing_data['address'] = ', '.join(address_parts)
-            
-            # Extract property details
-            additional_details = listing.get('additionalDetails', {})
-            property_info = additional_details.get('property', {})
-            
-            # rooms is in additionalDetails.roomsCount
-            if additional_details.get('roomsCount'):
-                listing_data['rooms'] = str(additional_details['roomsCount'])
-            # size is in additionalDetails.squareMeter
-            if additional_details.get('squareMeter'):
-                listing_data['size'] = str(additional_details['squareMeter'])
-            
-            # Extract title from metadata or create one
-            meta_data = listing.get('metaData', {})
-            if meta_data.get('title'):
-                listing_data['title'] = meta_data['title']
-            else:
-                # Create title from available info
-                title_parts = []
-                if listing_data['rooms']:
-                    title_parts.append(f"{listing_data['rooms']} חדרים")
-                if address_info.get('neighborhood', {}).get('text'):
-                    title_parts.append(address_info['neighborhood']['text'])
-                listing_data['title'] = ', '.join(title_parts) if title_parts else 'דירה להשכרה'
-            
-            # Extract real phone number from individual listing page
-            listing_data["phone_number"] = "0501234567"  # Stage 1 placeholder
-            
-            return listing_data
+            return Listing.from_feed_item(listing)
             
         except Exception as e:
             logger.error(f"Error extracting listing details: {e}")
@@ -617,7 +570,7 @@ class Yad2Scraper:
             
             # Fetch the listing page to get the actual publication date
             try:
-                html_content = self.fetch_with_zenrows(listing_url)
+                html_content = self.fetch_with_zenrows(listing_url, page_type='item')
                 if not html_content:
                     logger.debug(f"❌ Failed to fetch listing page: {token}")
                     return False
@@ -700,29 +653,74 @@ class Yad2Scraper:
             logger.error(f"Error checking if recent listing: {e}")
             return False
     
-    def scrape_listings(self, mode: str, filter_type: str = 'all', city_code: str = None, max_pages: int = None) -> List[Dict]:
-        """Scrape listings for the specified mode and filter with multiple pages support."""
+    def feed_url(self, mode: str, city_code: str = None, order_by_date: bool = False,
+                 filters: Optional[ScanFilters] = None) -> Optional[str]:
+        """Feed URL of page 1 for a mode and city (None for an unknown mode), with filters pushed into it."""
+        base_url = BASE_URLS.get(mode)
+        if not base_url:
+            return None
+        
+        # If city_code is provided, enforce it in the URL
+        if city_code:
+            if 'city=' in base_url:
+                base_url = re.sub(r'city=\d+', f'city={city_code}', base_url)
+            else:
+                sep = '' if base_url.endswith('?') else '&'
+                base_url = f'{base_url}{sep}city={city_code}'
+            logger.info(f"Using city code: {city_code}")
+        
+        if order_by_date:
+            sep = '&' if '?' in base_url else '?'
+            base_url = f'{base_url}{sep}orderBy=date'
+            logger.info("Added date sorting")
+        
+        params = filters.query_params() if filters else []
+        if params:
+            sep = '' if base_url.endswith('?') else '&'
+            base_url = f'{base_url}{sep}{urlencode(params, safe=",")}'
+            logger.info(f"Pushed filters into the feed URL: {params}")
+        return base_url
+    
+    def fetch_feed_listings(self, url: str, mode: str) -> Optional[List[Dict]]:
+        """Raw listings of one feed page in a single attempt (None if the page could not be fetched or parsed)."""
+        html_content = self.fetch_with_zenrows(url)
+        if not html_content:
+            return None
+        wanted_paths = self._feed_wanted_paths(mode) if self.partial_decode else None
+        nextjs_data = self.extract_nextjs_data(html_content, wanted_paths)
+        if not nextjs_data:
+            return None
+        raw_listings = self.extract_listings_from_nextjs(nextjs_data, mode=mode, page_type='feed')
+        if not raw_listings and self.partial_decode:
+            # The feed moved somewhere the partial decoder did not keep - decode everything
+            nextjs_data = self.extract_nextjs_data(html_content) or {}
+            raw_listings = self.extract_listings_from_nextjs(nextjs_data, mode=mode, page_type='feed')
+        return raw_listings
+    
+    def scrape_listings(self, mode: str, filter_type: str = 'all', city_code: str = None, max_pages: int = None,
+                        incremental: bool = False, filters: Optional[ScanFilters] = None) -> List[Listing]:
+        """Scrape listings for the specified mode and filter with multiple pages support.
+        
+        With incremental, listings an earlier scan of this city/mode by the same user,
+        filter type and filters already handled (same token and version) are skipped, and paging stops at the first page with
+        nothing new. The handled tokens are kept in pending_watermark until
+        advance_watermark() is called once the results are saved.
+        
+        filters are pushed into the feed URL, so Yad2 pages through the matching
+        listings only; each listing is still checked against them here. The pages
+        this saved are put in pushdown_report.
+        """
         try:
-            base_url = BASE_URLS.get(mode)
+            # Date sorting gets newest listings first (especially important for 'today' filter,
+            # and incremental runs need already-seen listings to come after the new ones)
+            if filters is not None and filters.is_empty:
+                filters = None
+            base_url = self.feed_url(mode, city_code, order_by_date=(filter_type == 'today' or incremental),
+                                     filters=filters)
             if not base_url:
                 logger.error(f"Invalid mode: {mode}")
                 return []
             
-            # If city_code is provided, enforce it in the URL
-            if city_code:
-                if 'city=' in base_url:
-                    base_url = re.sub(r'city=\d+', f'city={city_code}', base_url)
-                else:
-                    sep = '' if base_url.endswith('?') else '&'
-                    base_url = f'{base_url}{sep}city={city_code}'
-                logger.info(f"Using city code: {city_code}")
-            
-            # Add date sorting to get newest listings first (especially important for 'today' filter)
-            if filter_type == 'today':
-                sep = '&' if '?' in base_url else '?'
-                base_url = f'{base_url}{sep}orderBy=date'
-                logger.info("Added date sorting for last 24 hours filter")
-            
             logger.info(f"Scraping {mode} listings with filter {filter_type}")
             
             # Define variables for progress tracking
@@ -749,6 +747,22 @@ class Yad2Scraper:
             all_listings = []
             duplicates_skipped = 0  # Counter for duplicate listings skipped
             page = 1
+            pages_fetched = 0
+            feed_total_pages = None  # of the (filtered) feed, from page 1's pagination
+            filtered_out = 0  # listings the feed returned although a pushed (URL) filter excludes them
+            self.pushdown_report = None
+            
+            # Incremental state: where this user's last scan of this city/mode stopped
+            watermark_city = city_code or 'all'
+            scope = watermark_scope(os.environ.get('YAD2BOT_USER_ID'), filter_type,
+                                    filters.to_json() if filters else None)
+            has_watermark = incremental and self.watermark.has_watermark(scope, watermark_city, mode)
+            handled_versions = {}  # token -> version of every listing this run dealt with
+            already_seen = 0
+            if has_watermark:
+                logger.info(f"Incremental scan of {watermark_city}/{mode} (scope {scope})")
+            elif incremental:
+                logger.info(f"Incremental scan of {watermark_city}/{mode} (scope {scope}): no watermark yet, scanning in full")
             # Set max pages based on filter type or explicit limit
             # Write debug info to file
             with open('/tmp/scraper_debug.log', 'a') as f:
@@ -766,7 +780,7 @@ class Yad2Scraper:
                 f.write(f"AFTER IF: filter_type={filter_type}, max_pages={max_pages}\n")
             
             # Create initial progress file immediately so monitor can read correct max_pages
-            initial_progress_file = os.path.join(DATA_DIR, f"{city_name}_{mode}_{filter_type}_{today_str}_checking_progress.json")
+            initial_progress_file = os.path.join(self.output_dir, f"{city_name}_{mode}_{filter_type}_{today_str}_checking_progress.json")
             try:
                 initial_progress_data = {
                     "stage": "starting",
@@ -786,7 +800,7 @@ class Yad2Scraper:
             
             while page <= max_pages:
                 # Check for cancellation flag
-                cancel_file = os.path.join(DATA_DIR, f"{city_name}_{mode}_{filter_type}_{today_str}_cancel.flag")
+                cancel_file = os.path.join(self.output_dir, f"{city_name}_{mode}_{filter_type}_{today_str}_cancel.flag")
                 if os.path.exists(cancel_file):
                     logger.info("Cancellation flag detected, stopping scraper")
                     break
@@ -799,6 +813,7 @@ class Yad2Scraper:
                 max_retries = 3
                 retry_count = 0
                 nextjs_data = None
+                decode_mb = None
                 
                 while retry_count < max_retries and not nextjs_data:
                     # Fetch page content
@@ -807,18 +822,24 @@ class Yad2Scraper:
                         logger.error(f"Failed to fetch page {page}, attempt {retry_count + 1}/{max_retries}")
                         retry_count += 1
                         if retry_count < max_retries:
-                            logger.info(f"Retrying in 2 seconds...")
-                            time.sleep(2)
+                            retry_delay = self.controller.retry_delay()
+                            logger.info(f"Retrying in {retry_delay:.1f} seconds (backoff: {self.controller.backoff.current_level.name})...")
+                            time.sleep(retry_delay)
                         continue
                     
-                    # Extract Next.js data
-                    nextjs_data = self.extract_nextjs_data(html_content)
+                    # Extract Next.js data (only the feed and pagination in partial mode)
+                    wanted_paths = self._feed_wanted_paths(mode) if self.partial_decode else None
+                    if DECODE_MEMORY_STATS:
+                        nextjs_data, decode_mb = measure_peak_mb(self.extract_nextjs_data, html_content, wanted_paths)
+                    else:
+                        nextjs_data = self.extract_nextjs_data(html_content, wanted_paths)
                     if not nextjs_data:
                         logger.warning(f"No Next.js data found on page {page}, attempt {retry_count + 1}/{max_retries}")
                         retry_count += 1
                         if retry_count < max_retries:
-                            logger.info(f"Retrying in 2 seconds...")
-                            time.sleep(2)
+                            retry_delay = self.controller.retry_delay()
+                            logger.info(f"Retrying in {retry_delay:.1f} seconds (backoff: {self.controller.backoff.current_level.name})...")
+                            time.sleep(retry_delay)
                 
                 # If all retries failed, decide what to do
                 if not nextjs_data:
@@ -831,7 +852,23 @@ class Yad2Scraper:
                     continue
                 
                 # Extract raw listings from this page
-                raw_listings = self.extract_listings_from_nextjs(nextjs_data)
+                raw_listings = self.extract_listings_from_nextjs(nextjs_data, mode=mode, page_type='feed')
+                if not raw_listings and self.partial_decode:
+                    # The feed moved somewhere the partial decoder did not keep - decode everything
+                    logger.info(f"Partial decode found no listings on page {page}, falling back to full decode")
+                    nextjs_data = self.extract_nextjs_data(html_content) or {}
+                    raw_listings = self.extract_listings_from_nextjs(nextjs_data, mode=mode, page_type='feed')
+                
+                pagination = self._get_pagination(nextjs_data)
+                pages_fetched += 1
+                if page == 1 and pagination and isinstance(pagination.get('totalPages'), int):
+                    feed_total_pages = pagination['totalPages']
+                # Only the listings are needed from here on - drop the page and the decoded tree
+                html_content = None
+                nextjs_data = None
+                if decode_mb is not None:
+                    logger.info(f"Page {page} decode peak: {decode_mb:.2f} MB (partial decode: {self.partial_decode})")
+                
                 if not raw_listings:
                     logger.info(f"No listings found on page {page}")
                     if page >= max_pages:
@@ -855,9 +892,10 @@ class Yad2Scraper:
                     'total_pages': max_pages,
                     'city_name': city_name,
                     'filter_type': filter_type,
-                    'message': f"📄 סורק דף {page}/{max_pages}..."
+                    'message': f"📄 סורק דף {page}/{max_pages}...",
+                    'concurrency': self.controller.get_metrics()
                 }
-                progress_file = os.path.join(DATA_DIR, f"{city_name}_{mode}_{filter_type}_{today_str}_checking_progress.json")
+                progress_file = os.path.join(self.output_dir, f"{city_name}_{mode}_{filter_type}_{today_str}_checking_progress.json")
                 try:
                     with open(progress_file, 'w', encoding='utf-8') as f:
                         json.dump(progress_data_page, f, ensure_ascii=False, indent=2)
@@ -866,14 +904,40 @@ class Yad2Scraper:
                 
                 # Process listings with filtering
                 processed_listings = []
+                private_owner_flags = self.classify_private_owners(raw_listings)
+                
+                seen_versions = {}
+                fresh_on_page = 0  # unseen or updated listings on this page
+                if incremental:
+                    seen_versions = self.watermark.seen_versions(
+                        scope, watermark_city, mode, [listing.get('token') for listing in raw_listings])
                 
                 for index, listing in enumerate(raw_listings):
                     # Check for cancellation flag before processing each listing
-                    cancel_file = os.path.join(DATA_DIR, f"{city_name}_{mode}_{filter_type}_{today_str}_cancel.flag")
+                    cancel_file = os.path.join(self.output_dir, f"{city_name}_{mode}_{filter_type}_{today_str}_cancel.flag")
                     if os.path.exists(cancel_file):
                         logger.info("Cancellation flag detected during listing processing, stopping")
                         break
                     
+                    if incremental and listing.get('token'):
+                        version = listing_version(listing)
+                        if seen_versions.get(listing['token']) == version:
+                            already_seen += 1
+                            continue
+                        # Counted before any filter: freshness says whether paging on can find anything
+                        # new, and the watermark is scoped to these filters, so a rejected listing stays
+                        # handled until an edit or bump changes its version
+                        handled_versions[listing['token']] = version
+                        fresh_on_page += 1
+                    
+                    if filters and not filters.matches(listing, private_owner_flags[index]):
+                        logger.debug(f"Skipping listing outside the scan filters: {listing.get('token')}")
+                        # Private-only and neighborhood-name rejections are expected (no feed
+                        # parameter); only the pushed parameters say whether Yad2 honored them
+                        if not filters.matches_pushed(listing):
+                            filtered_out += 1
+                        continue
+                    
                     # Update progress for each listing being checked
                     total_checked = len(all_listings) + index + 1
                     
@@ -914,7 +978,7 @@ class Yad2Scraper:
                     }
                     
                     # Save progress to file
-                    progress_file = os.path.join(DATA_DIR, f"{city_name}_{mode}_{filter_type}_{today_str}_checking_progress.json")
+                    progress_file = os.path.join(self.output_dir, f"{city_name}_{mode}_{filter_type}_{today_str}_checking_progress.json")
                     try:
                         with open(progress_file, 'w', encoding='utf-8') as f:
                             json.dump(progress_data, f, ensure_ascii=False, indent=2)
@@ -952,7 +1016,7 @@ class Yad2Scraper:
                             logger.warning(f"Could not check CRM, continuing with processing: {check_error}")
                     
                     # Check if private owner - NOW ENABLED
-                    if not self.is_private_owner(listing):
+                    if not private_owner_flags[index]:
                         logger.debug(f"Skipping non-private listing: {listing.get('token')}")
                         continue
                     
@@ -966,26 +1030,85 @@ class Yad2Scraper:
                     listing_details = self.extract_listing_details(listing)
                     if listing_details:
                         processed_listings.append(listing_details)
-                        logger.debug(f"Added listing: {listing_details.get('id')} with phone: {listing_details.get('phone_number', 'no-phone')}")
+                        logger.debug(f"Added listing: {listing_details.id} with phone: {listing_details.phone_number or 'no-phone'}")
                 
                 logger.info(f"Processed {len(processed_listings)} listings from page {page}")
                 all_listings.extend(processed_listings)
                 
+                if has_watermark and fresh_on_page == 0:
+                    logger.info(f"Page {page} has nothing new since the last scan, stopping")
+                    break
+                
                 # Check if we should continue to next page
                 if len(raw_listings) < 20:  # If less than full page, probably last page
                     logger.info(f"Page {page} has less than 20 listings, assuming last page")
                     break
                 
+                total_pages = pagination.get('totalPages') if pagination else None
+                if isinstance(total_pages, int) and page >= total_pages:
+                    logger.info(f"Page {page} is the last page according to feed pagination ({total_pages})")
+                    break
+                
                 page += 1
             
             logger.info(f"Total processed listings across {page-1} pages: {len(all_listings)}")
+            if filters:
+                self.report_pushdown(city_code or 'all', mode, pages_fetched, feed_total_pages, filtered_out)
+            elif feed_total_pages:
+                self.watermark.record_feed_size(city_code or 'all', mode, feed_total_pages)
+            if incremental:
+                logger.info(f"Incremental scan skipped {already_seen} already-seen listings, "
+                            f"{len(handled_versions)} new or updated")
+                self.pending_watermark = (scope, watermark_city, mode, handled_versions)
+            logger.info(f"Feed path cache: {self.feed_path_cache.get_stats()}, deep searches: {self.deep_search_count}")
+            logger.info(f"ZenRows tier stats: {self.fetcher.tier_stats.get_stats()}")
+            logger.info(f"ZenRows key pool: {self.key_pool.get_stats()}")
+            logger.info(f"Concurrency controller: {self.controller.get_metrics()}")
+            if self.ledger.run_id:
+                logger.info(f"Fetch cost so far for run {self.ledger.run_id}: {self.ledger.run_summary(self.ledger.run_id)}")
             return all_listings
             
         except Exception as e:
             logger.error(f"Error scraping listings: {str(e)}")
             return []
     
-    def save_to_csv(self, listings: List[Dict], mode: str, filter_type: str, city: str = 'haifa') -> str:
+    def report_pushdown(self, city: str, mode: str, pages_fetched: int, filtered_total_pages: Optional[int],
+                        filtered_out: int) -> None:
+        """Estimate and log the pages a filtered scan saved against the unfiltered feed.
+        
+        The filtered feed's listings are spread over the unfiltered one, so reaching as
+        far into them took about pages_fetched * unfiltered / filtered pages without the
+        URL filters (capped at the unfiltered feed's length). The unfiltered page count
+        comes from the last unfiltered scan of the city/mode.
+        """
+        report = {'pages_fetched': pages_fetched, 'filtered_total_pages': filtered_total_pages,
+                  'unfiltered_total_pages': None, 'unfiltered_pages_estimate': None, 'pages_saved': None,
+                  'filtered_out_client_side': filtered_out}
+        feed_size = self.watermark.feed_size(city, mode)
+        if feed_size and filtered_total_pages:
+            unfiltered_total_pages = feed_size[0]
+            estimate = min(unfiltered_total_pages,
+                           -(-pages_fetched * unfiltered_total_pages // filtered_total_pages))
+            report.update(unfiltered_total_pages=unfiltered_total_pages, unfiltered_pages_estimate=estimate,
+                          pages_saved=max(0, estimate - pages_fetched))
+            logger.info(f"Filter push-down: fetched {pages_fetched} pages of a {filtered_total_pages}-page "
+                        f"filtered feed; the unfiltered feed ({unfiltered_total_pages} pages, seen {feed_size[1]}) "
+                        f"would have needed about {estimate}, saving {report['pages_saved']}")
+        else:
+            logger.info(f"Filter push-down: fetched {pages_fetched} pages; pages saved unknown until an "
+                        f"unfiltered scan of {city}/{mode} records the feed size")
+        if filtered_out:
+            logger.warning(f"{filtered_out} listings outside the filters came back from the feed - "
+                           f"a filter parameter may be ignored by Yad2")
+        self.pushdown_report = report
+    
+    def advance_watermark(self) -> None:
+        """Record what the last incremental scrape_listings() handled (call after its CSV is saved)."""
+        if self.pending_watermark:
+            self.watermark.advance(*self.pending_watermark)
+            self.pending_watermark = None
+    
+    def save_to_csv(self, listings: List[Listing], mode: str, filter_type: str, city: str = 'haifa') -> str:
         """Save listings to CSV file."""
         try:
             timestamp = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
@@ -1009,18 +1132,13 @@ class Yad2Scraper:
                 city_name = city.capitalize() if city else 'Unknown'
             
             filename = f"{city_name}_{mode}_{filter_type}_{timestamp}.csv"
-            filepath = os.path.join(DATA_DIR, filename)
+            filepath = os.path.join(self.output_dir, filename)
             
             with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-                if listings:
-                    fieldnames = listings[0].keys()
-                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames, quoting=csv.QUOTE_NONNUMERIC)
-                    writer.writeheader()
-                    writer.writerows(listings)
-                else:
-                    # Create empty file with headers
-                    writer = csv.writer(csvfile)
-                    writer.writerow(['phone_number', 'owner_name', 'address', 'price', 'rooms', 'size', 'title', 'listing_url'])
+                # Empty scans still get a file with headers
+                writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDS, quoting=csv.QUOTE_NONNUMERIC)
+                writer.writeheader()
+                writer.writerows(listing.to_csv_row() for listing in listings)
             
             logger.info(f"Saved {len(listings)} listings to {filepath}")
             return filepath
@@ -1036,15 +1154,26 @@ def main():
     parser.add_argument('--filter', choices=['all', 'today', 'test'], default='all', help='Filter type')
     parser.add_argument('--city', type=str, help='City code for scraping')
     parser.add_argument('--max-pages', type=int, default=None, help='Maximum number of pages to scrape')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only process listings new or updated since the last scan of this city/mode')
+    parser.add_argument('--filters', type=str, default=None,
+                        help='Scan filters as JSON (scan_filters.ScanFilters.to_json), pushed into the feed URL')
+    parser.add_argument('--output-dir', type=str, default=None,
+                        help=f'Directory for this run\'s progress files and CSVs (default: {DATA_DIR})')
     
     args = parser.parse_args()
     
     try:
-        scraper = Yad2Scraper()
-        listings = scraper.scrape_listings(args.mode, args.filter, args.city, max_pages=args.max_pages)
+        scraper = Yad2Scraper(output_dir=args.output_dir)
+        listings = scraper.scrape_listings(args.mode, args.filter, args.city, max_pages=args.max_pages,
+                                           incremental=args.incremental, filters=ScanFilters.from_json(args.filters))
+        if scraper.pushdown_report:
+            print(f"FILTER PUSH-DOWN: {scraper.pushdown_report}")
         
         if listings:
             csv_file = scraper.save_to_csv(listings, args.mode, args.filter, args.city)
+            if csv_file:
+                scraper.advance_watermark()
             print(f"SUCCESS: Scraped {len(listings)} listings")
             print(f"CSV file: {csv_file}")
             
@@ -1082,17 +1211,10 @@ def main():
                                 with open(updated_file, 'r', encoding='utf-8') as f:
                                     reader = csv_module.DictReader(f)
                                     for row in reader:
-                                        phone = row.get('phone', '').strip()
-                                        if phone and phone != '0501234567' and len(phone) >= 9:
+                                        listing = Listing.from_csv_row(row)
+                                        if listing.has_real_phone:
                                             real_phone_count += 1
-                                            # Clean phone number for WhatsApp (remove dashes, spaces)
-                                            clean_phone = phone.replace('-', '').replace(' ', '').replace('+972', '0')
-                                            if clean_phone.startswith('0'):
-                                                clean_phone = '972' + clean_phone[1:]
-                                            
-                                            # Create WhatsApp link
-                                            whatsapp_link = f"https://wa.me/{clean_phone}"
-                                            whatsapp_links.append(f"{phone}: {whatsapp_link}")
+                                            whatsapp_links.append(f"{listing.phone_number}: {listing.whatsapp_link}")
                                 
                                 # Save WhatsApp links to file
                                 if whatsapp_links:
@@ -1125,6 +1247,7 @@ def main():
             print("No listings found")
             # Still create empty CSV file
             scraper.save_to_csv([], args.mode, args.filter)
+            scraper.advance_watermark()
         
         return 0
         
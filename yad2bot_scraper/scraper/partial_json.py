@@ -0,0 +1,194 @@
+"""
+Partial JSON decoding for __NEXT_DATA__
+Walks the raw JSON text and decodes only the values at the requested paths,
+skipping every other subtree (dehydrated queries, SEO blobs, translations)
+without ever building Python objects for it.
+python3 partial_json.py compares peak decode memory of a full and a partial
+decode on a synthetic feed page shaped like Yad2's.
+"""
+
+import json
+import re
+import tracemalloc
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+NEXT_DATA_OPEN = '<script id="__NEXT_DATA__" type="application/json">'
+NEXT_DATA_CLOSE = '</script>'
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+_CONTAINER_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[\[\]{}]', re.DOTALL)
+_SCALAR = re.compile(r'[^,\]}\s]*')
+
+
+def find_next_data_bounds(html: str) -> Optional[Tuple[int, int]]:
+    """Return (start, end) offsets of the __NEXT_DATA__ JSON inside the page, without copying it."""
+    open_index = html.find(NEXT_DATA_OPEN)
+    if open_index == -1:
+        return None
+    start = open_index + len(NEXT_DATA_OPEN)
+    end = html.find(NEXT_DATA_CLOSE, start)
+    if end == -1:
+        return None
+    return start, end
+
+
+def _skip_whitespace(text: str, pos: int) -> int:
+    return _WHITESPACE.match(text, pos).end()
+
+
+def _skip_value(text: str, pos: int) -> int:
+    """Return the offset just past the JSON value starting at pos."""
+    ch = text[pos]
+    if ch == '"':
+        return _STRING.match(text, pos).end()
+    if ch not in '{[':
+        return _SCALAR.match(text, pos).end()
+
+    depth = 0
+    for match in _CONTAINER_TOKEN.finditer(text, pos):
+        token = match.group()
+        if token[0] == '"':
+            continue
+        if token in '{[':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    raise ValueError("Unterminated JSON container")
+
+
+def _read_key(text: str, pos: int) -> Tuple[str, int]:
+    match = _STRING.match(text, pos)
+    if not match:
+        raise ValueError(f"Expected object key at offset {pos}")
+    raw = match.group()
+    key = raw[1:-1] if '\\' not in raw else json.loads(raw)
+    return key, match.end()
+
+
+def _set_sparse(container: Any, element: Any, value: Any) -> None:
+    """Place a value into a sparse dict/list, padding lists with None."""
+    if isinstance(container, list):
+        while len(container) <= element:
+            container.append(None)
+    container[element] = value
+
+
+def _walk(text: str, pos: int, prefix: Tuple, wanted: Set[Tuple], prefixes: Set[Tuple], out: Any) -> int:
+    """Walk the container at pos, decoding wanted paths into out. Returns the offset after it."""
+    opener = text[pos]
+    closer = '}' if opener == '{' else ']'
+    pos = _skip_whitespace(text, pos + 1)
+    index = 0
+
+    if text[pos] == closer:
+        return pos + 1
+
+    while True:
+        if opener == '{':
+            element, pos = _read_key(text, pos)
+            pos = _skip_whitespace(text, pos)
+            if text[pos] != ':':
+                raise ValueError(f"Expected ':' at offset {pos}")
+            pos = _skip_whitespace(text, pos + 1)
+        else:
+            element = index
+            index += 1
+
+        path = prefix + (element,)
+        if path in wanted:
+            value, pos = _decoder.raw_decode(text, pos)
+            _set_sparse(out, element, value)
+        elif path in prefixes and text[pos] in '{[':
+            child = {} if text[pos] == '{' else []
+            pos = _walk(text, pos, path, wanted, prefixes, child)
+            _set_sparse(out, element, child)
+        else:
+            pos = _skip_value(text, pos)
+
+        pos = _skip_whitespace(text, pos)
+        if text[pos] == ',':
+            pos = _skip_whitespace(text, pos + 1)
+            continue
+        if text[pos] == closer:
+            return pos + 1
+        raise ValueError(f"Unexpected character {text[pos]!r} at offset {pos}")
+
+
+def decode_paths(text: str, paths: Iterable[Tuple], start: int = 0) -> Dict:
+    """Decode only the given paths of the JSON object starting at text[start].
+
+    Returns a sparse tree holding just those values (and the containers leading
+    to them), so resolve_path() works on it exactly as on the full tree.
+    """
+    wanted = {tuple(path) for path in paths}
+    prefixes = {path[:i] for path in wanted for i in range(1, len(path))}
+
+    pos = _skip_whitespace(text, start)
+    if text[pos] != '{':
+        raise ValueError("__NEXT_DATA__ is not a JSON object")
+
+    tree: Dict = {}
+    _walk(text, pos, (), wanted, prefixes, tree)
+    return tree
+
+
+def measure_peak_mb(func, *args):
+    """(func(*args), MB allocated above the pre-call level at func's peak); tracemalloc must be tracing."""
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    result = func(*args)
+    return result, (tracemalloc.get_traced_memory()[1] - before) / (1024 * 1024)
+
+
+def _fixture_page(listings: int = 40, queries: int = 60, query_items: int = 40) -> str:
+    """Feed page whose __NEXT_DATA__ mirrors Yad2's shape: a small feed next to a large dehydrated cache."""
+    def listing(i):
+        return {'token': f'tok{i:05d}', 'price': 5000 + i, 'adType': 'private',
+                'address': {'city': {'text': 'חיפה'}, 'neighborhood': {'text': 'כרמל', 'id': 7},
+                            'street': {'text': 'מוריה'}, 'house': {'number': i}},
+                'additionalDetails': {'roomsCount': 3, 'squareMeter': 70, 'property': {'id': 1}},
+                'dates': {'updatedAt': '2026-10-19T08:00:00', 'rebouncedAt': None},
+                'metaData': {'images': [f'https://img.yad2.co.il/{i}/{n}.jpg' for n in range(8)]}}
+
+    data = {
+        'props': {'pageProps': {
+            'feed': {'private': [listing(i) for i in range(listings)],
+                     'pagination': {'page': 1, 'totalPages': 12, 'total': 480}},
+            'dehydratedState': {'queries': [
+                {'queryKey': ['feed', q], 'state': {'data': [listing(q * query_items + i) for i in range(query_items)]}}
+                for q in range(queries)]},
+            'translations': {f'key_{i}': 'טקסט לתרגום ' * 4 for i in range(3000)},
+        }},
+        'page': '/realestate/rent', 'buildId': 'fixture',
+    }
+    return (f'<html><head></head><body>{NEXT_DATA_OPEN}'
+            f'{json.dumps(data, ensure_ascii=False)}{NEXT_DATA_CLOSE}</body></html>')
+
+
+def _run_simulation() -> None:
+    """Partial decode returns the same feed as a full decode while allocating far less at its peak."""
+    html = _fixture_page()
+    start, end = find_next_data_bounds(html)
+    wanted = [('props', 'pageProps', 'feed', 'private'), ('props', 'pageProps', 'feed', 'pagination')]
+
+    tracemalloc.start()
+    try:
+        full, full_mb = measure_peak_mb(json.loads, html[start:end])
+        del full['props']['pageProps']['dehydratedState'], full['props']['pageProps']['translations']
+        partial, partial_mb = measure_peak_mb(decode_paths, html, wanted, start)
+    finally:
+        tracemalloc.stop()
+
+    assert partial['props']['pageProps']['feed'] == full['props']['pageProps']['feed']
+    assert partial_mb < full_mb / 2, (partial_mb, full_mb)
+    print(f"partial_json: page {len(html) / (1024 * 1024):.2f} MB, decode peak full {full_mb:.2f} MB, "
+          f"partial {partial_mb:.2f} MB ({partial_mb / full_mb:.0%} of full)")
+    print("partial_json simulation: all checks passed")
+
+
+if __name__ == '__main__':
+    _run_simulation()
@@ -9,11 +9,25 @@ import logging
 import os
 import re
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
 import requests
-from bs4 import BeautifulSoup
+
+# Shared modules live in the bot's root directory
+sys.path.insert(0, '/root/yad2bot-service-scraper')
+from listing import CSV_FIELDS, PLACEHOLDER_PHONE, Listing
+from zenrows_key_pool import NoKeyAvailable, get_key_pool
+from fetch_ledger import get_fetch_ledger
+from concurrency_controller import get_concurrency_controller
+from config import DEFAULT_EXTRACTION_STRATEGY
+from phone_strategies import (
+    HTML_PARSER, ITEM_CSS_EXTRACTOR, PHONE_STRATEGIES, STRATEGY_STATS_FILE, PhoneStrategy, StrategyStats,
+    configured_strategies, find_phone_in_css_output, find_phone_in_html, find_phone_in_next_data,
+    find_phone_in_outputs, next_data_from_css_output
+)
 
 # Configure logging
 logging.basicConfig(
@@ -26,15 +40,56 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# ZenRows configuration
-ZENROWS_API_KEY = '3f50019a0655a46ab2198f4b29a29de2ba11f133'
+# ZenRows configuration (API keys come from the shared key pool)
 ZENROWS_API_URL = 'https://api.zenrows.com/v1/'
 
+# Most strategies (ZenRows requests) tried for one listing before giving up
+MAX_STRATEGIES_PER_LISTING = int(os.environ.get('YAD2_PHONE_MAX_STRATEGIES', '2'))
+
+# 'css' asks ZenRows to extract the phone candidates and __NEXT_DATA__ server-side and
+# return compact JSON; the full page is fetched only if that misses the phone (or item data the listing still lacks).
+# 'html' always fetches the full rendered page.
+ZENROWS_ITEM_MODE = os.environ.get('ZENROWS_ITEM_MODE', 'css').lower()
+
 class FixedPhoneExtractor:
     """Fixed phone number extraction with improved reliability and progress tracking."""
     
     def __init__(self):
         self.progress_file = None
+        self.pages_parsed = 0
+        self.parse_cpu_seconds = 0.0
+        self.strategy_stats = StrategyStats(STRATEGY_STATS_FILE)
+        self.key_pool = get_key_pool()
+        self.ledger = get_fetch_ledger()
+        # Listings are fetched in parallel; the AIMD controller decides how many at once
+        self.controller = get_concurrency_controller()
+        self._stats_lock = threading.Lock()
+        # Responses, bytes and parse CPU per request mode (css / html / api)
+        self.mode_stats = {}
+    
+    def _record_cpu(self, cpu_start: float, page_bytes: int, mode: str):
+        """Log CPU time and bytes for one parsed response."""
+        # process_time is process-wide, so with parallel workers this is an upper bound
+        cpu_seconds = time.process_time() - cpu_start
+        with self._stats_lock:
+            self.pages_parsed += 1
+            self.parse_cpu_seconds += cpu_seconds
+            stats = self.mode_stats.setdefault(mode, {'responses': 0, 'bytes': 0, 'parse_seconds': 0.0})
+            stats['responses'] += 1
+            stats['bytes'] += page_bytes
+            stats['parse_seconds'] += cpu_seconds
+        logger.info(f"Page parsed in {cpu_seconds * 1000:.1f} ms CPU ({page_bytes} bytes, mode: {mode}, parser: {HTML_PARSER})")
+    
+    def get_mode_stats(self) -> dict:
+        """Average bytes transferred and parse time per request mode."""
+        return {
+            mode: {
+                'responses': stats['responses'],
+                'avg_kb': round(stats['bytes'] / stats['responses'] / 1024, 1),
+                'avg_parse_ms': round(stats['parse_seconds'] / stats['responses'] * 1000, 2)
+            }
+            for mode, stats in self.mode_stats.items()
+        }
         
     def create_progress_file(self, csv_file_path: str):
         """Create progress tracking file."""
@@ -77,7 +132,8 @@ class FixedPhoneExtractor:
                 'percent': percent,
                 'phones_found': phones_found,
                 'status': status,
-                'last_updated': datetime.now().isoformat()
+                'last_updated': datetime.now().isoformat(),
+                'concurrency': self.controller.get_metrics()
             }
             
             # Read existing data to preserve start_time
@@ -99,8 +155,197 @@ class FixedPhoneExtractor:
         except Exception as e:
             logger.error(f"Error updating progress: {e}")
     
-    def get_listing_details_from_page(self, listing_url: str) -> dict:
-        """Extract phone number and additional details from listing page."""
+    def _extract_page_details(self, html: str, listing_url: str, details: dict):
+        """Fill rooms, floor, owner_name and publish_date from the item's __NEXT_DATA__."""
+        try:
+            # Debug: check if __NEXT_DATA__ exists
+            if '__NEXT_DATA__' in html:
+                logger.info("✅ __NEXT_DATA__ found in response")
+            else:
+                logger.warning("❌ __NEXT_DATA__ not in response text")
+
+            pattern = r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>'
+            match = re.search(pattern, html, re.DOTALL)
+
+            if match:
+                json_str = match.group(1)
+                next_data = json.loads(json_str)
+                self._details_from_next_data(next_data, details)
+            else:
+                logger.warning(f"No __NEXT_DATA__ found in {listing_url}")
+        except Exception as e:
+            logger.error(f"Error extracting additional details: {e}")
+    
+    def _details_from_next_data(self, next_data: dict, details: dict):
+        """Fill the detail fields from a decoded __NEXT_DATA__ tree."""
+        logger.info(f"✅ Parsed __NEXT_DATA__ JSON, top keys: {list(next_data.keys())}")
+
+        # Navigate to item data
+        props = next_data.get('props', {})
+        logger.info(f"props keys: {list(props.keys()) if props else 'None'}")
+
+        page_props = props.get('pageProps', {})
+        logger.info(f"pageProps keys: {list(page_props.keys())[:10] if page_props else 'None'}")
+
+        # Try to get item from dehydratedState (React Query structure)
+        item = {}
+        dehydrated_state = page_props.get('dehydratedState', {})
+        if dehydrated_state:
+            logger.info("Found dehydratedState, extracting queries...")
+            queries = dehydrated_state.get('queries', [])
+            logger.info(f"Found {len(queries)} queries in dehydratedState")
+
+            # Look for the item data in queries
+            for query in queries:
+                query_data = query.get('state', {}).get('data', {})
+                if query_data and isinstance(query_data, dict):
+                    # Check if this looks like item data
+                    if 'additionalDetails' in query_data or 'contactInfo' in query_data:
+                        item = query_data
+                        logger.info("✅ Found item data in dehydratedState")
+                        break
+
+        # Fallback: try direct item path
+        if not item:
+            item = page_props.get('item', {})
+
+        logger.info(f"item keys: {list(item.keys())[:10] if item else 'None'}")
+
+        # Extract rooms
+        if item:
+            additional_details = item.get('additionalDetails', {})
+            logger.info(f"additionalDetails keys: {list(additional_details.keys())[:10] if additional_details else 'None'}")
+
+            property_info = additional_details.get('property', {})
+            logger.info(f"property keys: {list(property_info.keys())[:10] if property_info else 'None'}")
+        else:
+            logger.warning("No item data found")
+            additional_details = {}
+            property_info = {}
+
+        # Extract rooms - check both 'rooms' and 'roomsCount' in additionalDetails
+        rooms_count = additional_details.get('roomsCount') or property_info.get('rooms')
+        if rooms_count:
+            details['rooms'] = str(rooms_count)
+            logger.info(f"✅ Found rooms: {details['rooms']}")
+        else:
+            logger.warning("rooms not found")
+
+        # Extract floor - check in address.house.floor
+        address = item.get('address', {})
+        house = address.get('house', {})
+        floor = house.get('floor')
+        if floor is not None:  # floor can be 0
+            details['floor'] = str(floor)
+            logger.info(f"✅ Found floor: {details['floor']}")
+        else:
+            logger.warning("floor not found")
+
+        # Extract owner name - try contactInfo first, then searchText
+        contact_info = item.get('contactInfo', {})
+        if contact_info.get('name'):
+            details['owner_name'] = contact_info['name']
+            logger.info(f"✅ Found owner name from contactInfo: {details['owner_name']}")
+        else:
+            # Try to extract from searchText
+            search_text = item.get('searchText', '')
+            if 'שם מוכר' in search_text:  # "שם מוכר" in Hebrew
+                import re as re_module
+                match = re_module.search(r'שם מוכר\s+(\S+)', search_text)
+                if match:
+                    details['owner_name'] = match.group(1)
+                    logger.info(f"✅ Found owner name from searchText: {details['owner_name']}")
+            if not details['owner_name']:
+                logger.warning("owner_name not found")
+
+        # Extract publish date - use createdAt
+        dates = item.get('dates', {})
+        publish_date_str = dates.get('createdAt') or dates.get('publishDate')
+        if publish_date_str:
+            try:
+                if 'T' in publish_date_str:
+                    dt = datetime.fromisoformat(publish_date_str.replace('Z', '+00:00'))
+                    details['publish_date'] = dt.strftime('%d/%m/%y')
+                else:
+                    details['publish_date'] = publish_date_str
+                logger.info(f"✅ Found publish date: {details['publish_date']}")
+            except Exception as e:
+                logger.warning(f"Error parsing publish date: {e}")
+                details['publish_date'] = publish_date_str
+        else:
+            logger.warning("publish_date not found")
+    
+    def _strategy_params(self, listing_url: str, strategy: PhoneStrategy, mode: str) -> dict:
+        """ZenRows parameters for one phone strategy in the given mode."""
+        params = {
+            'url': listing_url,
+            'js_render': 'true',
+            'premium_proxy': 'true',
+            'proxy_country': 'il',
+            'js_instructions': json.dumps(strategy.js_instructions()),
+            'wait': str(strategy.wait_ms)
+        }
+        if mode == 'api':
+            params['outputs'] = strategy.outputs
+        elif mode == 'css':
+            params['css_extractor'] = json.dumps(ITEM_CSS_EXTRACTOR)
+        return params
+    
+    def _fetch_item(self, listing_url: str, strategy: PhoneStrategy, mode: str, details: dict):
+        """Fetch one item page in the given mode and parse it.
+
+        Returns (ok, phone, source, pattern, has_item_data); fills details when item data is present.
+        """
+        params = self._strategy_params(listing_url, strategy, mode)
+        with self.controller.slot(), self.key_pool.lease() as lease:
+            request_start = time.time()
+            params['apikey'] = lease.api_key
+            response = requests.get(ZENROWS_API_URL, params=params, timeout=60)
+            lease.report(response)
+        latency = time.time() - request_start
+        self.ledger.record('phone', params, response, latency)
+        self.controller.record_response(response, latency)
+        if response.status_code != 200:
+            logger.error(f"❌ HTTP {response.status_code} ({strategy.name}/{mode}): {response.text[:200]}")
+            return False, '', '', '', False
+        
+        cpu_start = time.process_time()
+        phone, source, pattern = '', '', ''
+        has_item_data = False
+        is_json = 'application/json' in response.headers.get('Content-Type', '')
+        
+        if mode == 'api' and is_json:
+            # ZenRows already extracted the phones - no HTML to parse
+            try:
+                phone, source, pattern = find_phone_in_outputs(response.json())
+            except ValueError:
+                pass
+        elif mode == 'css' and is_json:
+            try:
+                data = response.json()
+                phone, source, pattern = find_phone_in_css_output(data)
+                next_data = next_data_from_css_output(data)
+                if next_data:
+                    self._details_from_next_data(next_data, details)
+                    has_item_data = True
+            except Exception as e:
+                logger.warning(f"Could not parse css_extractor response: {e}")
+        else:
+            phone, source, pattern = find_phone_in_html(response.content)
+            if not phone:
+                phone, source, pattern = find_phone_in_next_data(response.text)
+            self._extract_page_details(response.text, listing_url, details)
+            has_item_data = '__NEXT_DATA__' in response.text
+        
+        self._record_cpu(cpu_start, len(response.content), mode)
+        return True, phone, source, pattern, has_item_data
+    
+    def get_listing_details_from_page(self, listing_url: str, needs_details: bool = False) -> dict:
+        """Extract phone number and additional details from listing page.
+        
+        needs_details: the listing still lacks fields of the item page (Listing.needs_page_details);
+        only then is a full page fetched for them when the compact response had the phone but no item data.
+        """
         details = {
             'phone_number': '',
             'rooms': '',
@@ -112,255 +357,38 @@ class FixedPhoneExtractor:
         try:
             logger.info(f"Extracting details from: {listing_url}")
             
-            # Optimized JavaScript waits for better performance while maintaining reliability
-            js_instructions = [
-                {"wait": 1500},   # 1.5 seconds to load page (reduced from 2)
-                {"click": "button:contains('הצגת מספר טלפון')"},
-                {"wait": 2000},   # 2 seconds for phone to appear (reduced from 3)
-                {"click": "[data-testid*='phone'], .phone-button, button[aria-label*='טלפון']"},
-                {"wait": 1000}    # 1 second additional wait (reduced from 2)
-            ]
-            
-            params = {
-                'url': listing_url,
-                'apikey': ZENROWS_API_KEY,
-                'js_render': 'true',
-                'premium_proxy': 'true',
-                'proxy_country': 'il',
-                'js_instructions': json.dumps(js_instructions),
-                'wait': '5000'  # Total 5 seconds wait (reduced from 7)
-            }
-            
-            response = requests.get(ZENROWS_API_URL, params=params, timeout=60)
-            
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
-                # Enhanced selectors for phone numbers
-                phone_selectors = [
-                    'a[href^="tel:"]',  # Phone links
-                    'a[href*="05"]',    # Links with 05 in href
-                    'a:contains("05")',  # Links containing 05
-                    'span:contains("05")',  # Spans containing 05
-                    'div:contains("05")',  # Divs containing 05
-                    '[data-testid*="phone"]',  # Phone test IDs
-                    '[data-testid*="contact"]',  # Contact test IDs
-                    '.phone-number',  # Phone number classes
-                    '.contact-phone',  # Contact phone classes
-                    '.phone-display',  # Phone display classes
-                    '[class*="phone"]',  # Any class containing "phone"
-                    '[id*="phone"]',  # Any ID containing "phone"
-                    'button[aria-label*="טלפון"]',  # Phone buttons
-                    '.contact-info a',  # Contact info links
-                    '.seller-phone',  # Seller phone classes
-                    '.advertiser-phone'  # Advertiser phone classes
-                ]
-                
-                phone_found = False
-                for selector in phone_selectors:
-                    if phone_found:
-                        break
-                    try:
-                        elements = soup.select(selector)
-                        for element in elements:
-                            if phone_found:
-                                break
-                            # Check both text content and href attribute
-                            text_sources = [
-                                element.get_text(strip=True),
-                                element.get('href', ''),
-                                element.get('title', ''),
-                                element.get('aria-label', '')
-                            ]
-                            
-                            for text in text_sources:
-                                if phone_found:
-                                    break
-                                if not text:
-                                    continue
-                                    
-                                # Look for Israeli mobile numbers with various formats
-                                phone_patterns = [
-                                    r'05[0-9]-?[0-9]{7}',  # Standard format
-                                    r'\\+972-?5[0-9]-?[0-9]{7}',  # International format
-                                    r'972-?5[0-9]-?[0-9]{7}',  # International without +
-                                    r'05[0-9]\\s?[0-9]{3}\\s?[0-9]{4}',  # Spaced format
-                                ]
-                                
-                                for pattern in phone_patterns:
-                                    phone_matches = re.findall(pattern, text)
-                                    if phone_matches:
-                                        # Clean the phone number
-                                        phone = re.sub(r'[^0-9]', '', phone_matches[0])
-                                        
-                                        # Handle international format
-                                        if phone.startswith('972'):
-                                            phone = '0' + phone[3:]
-                                        
-                                        # Validate Israeli mobile number
-                                        if len(phone) == 10 and phone.startswith('05'):
-                                            logger.info(f"✅ Found phone with selector '{selector}': {phone}")
-                                            details['phone_number'] = phone
-                                            phone_found = True
-                                            break
-                                            
-                    except Exception as e:
-                        logger.debug(f"Selector {selector} failed: {e}")
-                        continue
-                
-                # Enhanced fallback: search entire page with multiple patterns (only if not found yet)
-                if not phone_found:
-                    page_text = soup.get_text()
-                    
-                    # Try multiple phone patterns on full page text
-                    phone_patterns = [
-                        r'05[0-9]-?[0-9]{7}',
-                        r'\\+972-?5[0-9]-?[0-9]{7}',
-                        r'972-?5[0-9]-?[0-9]{7}',
-                        r'05[0-9]\\s[0-9]{3}\\s[0-9]{4}',
-                        r'05[0-9]\\s[0-9]{7}'
-                    ]
-                    
-                    for pattern in phone_patterns:
-                        if phone_found:
-                            break
-                        phone_matches = re.findall(pattern, page_text)
-                        if phone_matches:
-                            for match in phone_matches:
-                                phone = re.sub(r'[^0-9]', '', match)
-                                
-                                # Handle international format
-                                if phone.startswith('972'):
-                                    phone = '0' + phone[3:]
-                                
-                                # Validate
-                                if len(phone) == 10 and phone.startswith('05'):
-                                    logger.info(f"✅ Found phone in page text: {phone}")
-                                    details['phone_number'] = phone
-                                    phone_found = True
-                                    break
+            # Best strategies first, according to past success rate and latency
+            with self._stats_lock:
+                names = self.strategy_stats.order(configured_strategies(), DEFAULT_EXTRACTION_STRATEGY)
+            for name in names[:MAX_STRATEGIES_PER_LISTING]:
+                strategy = PHONE_STRATEGIES[name]
+                mode = 'api' if strategy.outputs else ZENROWS_ITEM_MODE
                 
-                if not phone_found:
-                    logger.warning(f"❌ No phone found for {listing_url}")
-                    details['phone_number'] = ""
-                
-                # Extract __NEXT_DATA__ JSON for additional fields
+                request_start = time.time()
+                phone, source, pattern = '', '', ''
                 try:
-                    # Debug: check if __NEXT_DATA__ exists
-                    if '__NEXT_DATA__' in response.text:
-                        logger.info("✅ __NEXT_DATA__ found in response")
-                    else:
-                        logger.warning("❌ __NEXT_DATA__ not in response text")
-                    
-                    pattern = r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>'
-                    match = re.search(pattern, response.text, re.DOTALL)
+                    ok, phone, source, pattern, has_item_data = self._fetch_item(listing_url, strategy, mode, details)
+                    if ok and mode == 'css' and (not phone or (needs_details and not has_item_data)):
+                        # Compact response missed the phone, or the item fields this listing still needs
+                        logger.info(f"css_extractor response incomplete (phone: {bool(phone)}, item data: {has_item_data}), fetching full HTML")
+                        ok, html_phone, html_source, html_pattern, _ = self._fetch_item(listing_url, strategy, 'html', details)
+                        if html_phone and not phone:
+                            phone, source, pattern = html_phone, html_source, html_pattern
+                except (requests.RequestException, NoKeyAvailable) as e:
+                    # A timeout or connection error is this strategy's failure; the next one still gets its turn
+                    logger.warning(f"⚠️ {name} strategy request failed for {listing_url}: {e}")
+                latency = time.time() - request_start
+                with self._stats_lock:
+                    self.strategy_stats.record(name, phone, latency, source, pattern)
                 
-                    if match:
-                        json_str = match.group(1)
-                        next_data = json.loads(json_str)
-                        logger.info(f"✅ Parsed __NEXT_DATA__ JSON, top keys: {list(next_data.keys())}")
-                        
-                        # Navigate to item data
-                        props = next_data.get('props', {})
-                        logger.info(f"props keys: {list(props.keys()) if props else 'None'}")
-                        
-                        page_props = props.get('pageProps', {})
-                        logger.info(f"pageProps keys: {list(page_props.keys())[:10] if page_props else 'None'}")
-                        
-                        # Try to get item from dehydratedState (React Query structure)
-                        item = {}
-                        dehydrated_state = page_props.get('dehydratedState', {})
-                        if dehydrated_state:
-                            logger.info("Found dehydratedState, extracting queries...")
-                            queries = dehydrated_state.get('queries', [])
-                            logger.info(f"Found {len(queries)} queries in dehydratedState")
-                            
-                            # Look for the item data in queries
-                            for query in queries:
-                                query_data = query.get('state', {}).get('data', {})
-                                if query_data and isinstance(query_data, dict):
-                                    # Check if this looks like item data
-                                    if 'additionalDetails' in query_data or 'contactInfo' in query_data:
-                                        item = query_data
-                                        logger.info("✅ Found item data in dehydratedState")
-                                        break
-                        
-                        # Fallback: try direct item path
-                        if not item:
-                            item = page_props.get('item', {})
-                        
-                        logger.info(f"item keys: {list(item.keys())[:10] if item else 'None'}")
-                        
-                        # Extract rooms
-                        if item:
-                            additional_details = item.get('additionalDetails', {})
-                            logger.info(f"additionalDetails keys: {list(additional_details.keys())[:10] if additional_details else 'None'}")
-                            
-                            property_info = additional_details.get('property', {})
-                            logger.info(f"property keys: {list(property_info.keys())[:10] if property_info else 'None'}")
-                        else:
-                            logger.warning("No item data found")
-                            additional_details = {}
-                            property_info = {}
-                        
-                        # Extract rooms - check both 'rooms' and 'roomsCount' in additionalDetails
-                        rooms_count = additional_details.get('roomsCount') or property_info.get('rooms')
-                        if rooms_count:
-                            details['rooms'] = str(rooms_count)
-                            logger.info(f"✅ Found rooms: {details['rooms']}")
-                        else:
-                            logger.warning("rooms not found")
-                        
-                        # Extract floor - check in address.house.floor
-                        address = item.get('address', {})
-                        house = address.get('house', {})
-                        floor = house.get('floor')
-                        if floor is not None:  # floor can be 0
-                            details['floor'] = str(floor)
-                            logger.info(f"✅ Found floor: {details['floor']}")
-                        else:
-                            logger.warning("floor not found")
-                        
-                        # Extract owner name - try contactInfo first, then searchText
-                        contact_info = item.get('contactInfo', {})
-                        if contact_info.get('name'):
-                            details['owner_name'] = contact_info['name']
-                            logger.info(f"✅ Found owner name from contactInfo: {details['owner_name']}")
-                        else:
-                            # Try to extract from searchText
-                            search_text = item.get('searchText', '')
-                            if 'שם מוכר' in search_text:  # "שם מוכר" in Hebrew
-                                import re as re_module
-                                match = re_module.search(r'שם מוכר\s+(\S+)', search_text)
-                                if match:
-                                    details['owner_name'] = match.group(1)
-                                    logger.info(f"✅ Found owner name from searchText: {details['owner_name']}")
-                            if not details['owner_name']:
-                                logger.warning("owner_name not found")
-                        
-                        # Extract publish date - use createdAt
-                        dates = item.get('dates', {})
-                        publish_date_str = dates.get('createdAt') or dates.get('publishDate')
-                        if publish_date_str:
-                            try:
-                                if 'T' in publish_date_str:
-                                    dt = datetime.fromisoformat(publish_date_str.replace('Z', '+00:00'))
-                                    details['publish_date'] = dt.strftime('%d/%m/%y')
-                                else:
-                                    details['publish_date'] = publish_date_str
-                                logger.info(f"✅ Found publish date: {details['publish_date']}")
-                            except Exception as e:
-                                logger.warning(f"Error parsing publish date: {e}")
-                                details['publish_date'] = publish_date_str
-                        else:
-                            logger.warning("publish_date not found")
-                    else:
-                        logger.warning(f"No __NEXT_DATA__ found in {listing_url}")
-                except Exception as e:
-                    logger.error(f"Error extracting additional details: {e}")
-            else:
-                logger.error(f"❌ HTTP {response.status_code}: {response.text[:200]}")
-                details['phone_number'] = ""
+                if phone:
+                    logger.info(f"✅ Found phone via {name} in {source} ({pattern}): {phone}")
+                    details['phone_number'] = phone
+                    break
+                logger.info(f"No phone via {name} strategy")
+            
+            if not details['phone_number']:
+                logger.warning(f"❌ No phone found for {listing_url}")
             
             return details
             
@@ -382,10 +410,9 @@ class FixedPhoneExtractor:
             self.create_progress_file(csv_file_path)
             
             # Read CSV
-            listings = []
             with open(csv_file_path, 'r', encoding='utf-8') as f:
                 reader = csv.DictReader(f)
-                listings = list(reader)
+                listings = [Listing.from_csv_row(row) for row in reader]
             
             total_listings = len(listings)
             logger.info(f"Processing {total_listings} listings")
@@ -393,73 +420,66 @@ class FixedPhoneExtractor:
             # Update initial progress
             self.update_progress(0, total_listings, 0, 'starting')
             
-            # Extract phones with progress tracking
+            # Listings that already have a phone (or no URL) need no request
+            pending = [listing for listing in listings
+                       if listing.listing_url and listing.phone_number == PLACEHOLDER_PHONE]
             updated_count = 0
-            phones_found = 0
+            phones_found = sum(1 for listing in listings if listing.has_real_phone)
+            completed = total_listings - len(pending)
+            self.update_progress(completed, total_listings, phones_found, 'processing')
             
-            for i, listing in enumerate(listings):
-                current_index = i + 1
-                listing_url = listing.get('listing_url', '')
-                
-                # Update progress
-                self.update_progress(current_index, total_listings, phones_found, 'processing')
-                
-                # Duplicates are now filtered during scraping phase, not here
-                if listing_url and listing.get('phone_number') == '0501234567':
-                    logger.info(f"Processing {current_index}/{total_listings}: {listing_url}")
-                    
-                    # Extract all details from listing page
-                    details = self.get_listing_details_from_page(listing_url)
+            # Duplicates are now filtered during scraping phase, not here.
+            # Workers block on the controller's slots, so only its current limit fetch at once.
+            with ThreadPoolExecutor(max_workers=self.controller.max_limit) as executor:
+                futures = {
+                    executor.submit(self.get_listing_details_from_page, listing.listing_url,
+                                    listing.needs_page_details): listing
+                    for listing in pending
+                }
+                for future in as_completed(futures):
+                    listing = futures[future]
+                    completed += 1
+                    details = future.result()
                     
                     # Update listing with all extracted details
-                    if details.get('phone_number') and details['phone_number'] != '0501234567':
-                        listing['phone_number'] = details['phone_number']
+                    if details.get('phone_number') and details['phone_number'] != PLACEHOLDER_PHONE:
+                        listing.phone_number = details['phone_number']
                         updated_count += 1
                         phones_found += 1
-                        logger.info(f"✅ Updated {current_index}: {details['phone_number']}")
+                        logger.info(f"✅ Updated {completed}/{total_listings}: {details['phone_number']}")
                     else:
-                        logger.warning(f"❌ Failed to get phone for {current_index}")
+                        logger.warning(f"❌ Failed to get phone for {listing.listing_url}")
                     
                     # Update additional fields if they exist and are not already populated
-                    if details.get('rooms') and not listing.get('rooms'):
-                        listing['rooms'] = details['rooms']
-                    if details.get('floor') is not None and not listing.get('floor'):
-                        listing['floor'] = details['floor']
-                    if details.get('owner_name') and not listing.get('owner_name'):
-                        listing['owner_name'] = details['owner_name']
-                    if details.get('publish_date') and not listing.get('publish_date'):
-                        listing['publish_date'] = details['publish_date']
+                    listing.apply_page_details(details)
                     
                     # Update progress after each extraction
-                    self.update_progress(current_index, total_listings, phones_found, 'processing')
+                    self.update_progress(completed, total_listings, phones_found, 'processing')
                     
-                    # Reasonable delay to prevent overwhelming the API (reduced for better performance)
-                    time.sleep(0.5)
-                else:
-                    # Skip listings that already have phones or no URL
-                    if listing.get('phone_number') and listing.get('phone_number') != '0501234567':
-                        phones_found += 1
+                    # Persist strategy stats now and then so a killed run still teaches the next one
+                    if completed % 10 == 0:
+                        with self._stats_lock:
+                            self.strategy_stats.save()
             
             # Final progress update
             self.update_progress(total_listings, total_listings, phones_found, 'completed')
+            self.strategy_stats.save()
+            logger.info(f"Phone strategy stats: {self.strategy_stats.get_stats()}")
+            logger.info(f"Item fetch modes: {self.get_mode_stats()}")
+            logger.info(f"Concurrency controller: {self.controller.get_metrics()}")
             
             # Save updated CSV
             output_path = csv_file_path.replace('.csv', '_with_phones.csv')
             with open(output_path, 'w', encoding='utf-8', newline='') as f:
                 if listings:
-                    # Collect all unique fieldnames from all listings to avoid missing fields
-                    all_fieldnames = set()
-                    for listing in listings:
-                        all_fieldnames.update(listing.keys())
-                    
-                    # Convert to sorted list for consistent column order
-                    fieldnames = sorted(list(all_fieldnames))
-                    
-                    writer = csv.DictWriter(f, fieldnames=fieldnames, quoting=csv.QUOTE_NONNUMERIC)
+                    writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, quoting=csv.QUOTE_NONNUMERIC)
                     writer.writeheader()
-                    writer.writerows(listings)
+                    writer.writerows(listing.to_csv_row() for listing in listings)
             
             logger.info(f"✅ COMPLETED: {phones_found} total phones, {updated_count} newly extracted")
+            if self.pages_parsed:
+                avg_ms = self.parse_cpu_seconds / self.pages_parsed * 1000
+                logger.info(f"Parse CPU: {avg_ms:.1f} ms/page over {self.pages_parsed} pages")
             return output_path
             
         except Exception as e:
@@ -468,8 +488,28 @@ class FixedPhoneExtractor:
                 self.update_progress(0, 0, 0, f'error: {str(e)}')
             return ""
 
+def benchmark_pages(html_files, rounds: int = 3):
+    """Measure phone-extraction CPU per page on saved listing pages."""
+    pages = []
+    for path in html_files:
+        with open(path, 'rb') as f:
+            pages.append(f.read())
+    
+    start = time.process_time()
+    for _ in range(rounds):
+        results = [find_phone_in_html(page) for page in pages]
+    cpu_ms = (time.process_time() - start) / (rounds * len(pages)) * 1000
+    
+    for path, (phone, source, pattern) in zip(html_files, results):
+        print(f"{os.path.basename(path)}: {phone or '-'} ({source or 'not found'})")
+    print(f"Parser: {HTML_PARSER}, CPU per page: {cpu_ms:.2f} ms over {len(pages)} pages")
+
 def main():
     """Main function."""
+    if len(sys.argv) > 2 and sys.argv[1] == '--benchmark':
+        benchmark_pages(sys.argv[2:])
+        return
+    
     if len(sys.argv) != 2:
         print("Usage: python3 phone_extractor_fixed.py <csv_file>")
         sys.exit(1)
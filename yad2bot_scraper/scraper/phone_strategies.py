@@ -0,0 +1,414 @@
+"""
+Phone Strategies - the ways a listing phone can be revealed and found
+Each strategy is one ZenRows request shape (which "show phone" button to click,
+HTML or ZenRows' phone_numbers output) plus the parser for its response.
+StrategyStats records which strategy, element and pattern produced each phone,
+persists success rate and latency across runs, and orders/prunes strategies.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import re
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bs4 import BeautifulSoup, NavigableString, Tag
+
+from config import DEFAULT_EXTRACTION_STRATEGY, EXTRACTION_STRATEGIES
+
+logger = logging.getLogger(__name__)
+
+# lxml is several times faster than the pure-Python html.parser when installed
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+# Israeli mobile numbers; the group name is recorded as the pattern that matched.
+# The first alternative that matches wins, so the narrower ones come first: split
+# (one space after the prefix) before spaced, which would also match it.
+PHONE_PATTERN = (
+    r'(?P<international>\+?972-?5[0-9]-?[0-9]{7})'
+    r'|(?P<local>05[0-9]-?[0-9]{7})'
+    r'|(?P<split>05[0-9]\s[0-9]{7})'
+    r'|(?P<spaced>05[0-9]\s?[0-9]{3}\s?[0-9]{4})'
+)
+# One example per label; _run_simulation() checks each is reported under its own label
+PHONE_PATTERN_EXAMPLES = {
+    'international': '+972-50-1234567',
+    'local': '050-1234567',
+    'split': '050 1234567',
+    'spaced': '050 123 4567',
+}
+PHONE_RE = re.compile(PHONE_PATTERN)
+TEL_HREF_RE_BYTES = re.compile(rb'href=["\']tel:([^"\']+)["\']')
+NEXT_DATA_RE = re.compile(r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>', re.DOTALL)
+
+# Attributes that mark an element as phone/contact related (the old selector list, as substrings)
+PHONE_HINT_ATTRS = (
+    ('data-testid', ('phone', 'contact')),
+    ('class', ('phone', 'contact-info')),
+    ('id', ('phone',)),
+    ('aria-label', ('טלפון',)),
+)
+PHONE_TEXT_ATTRS = ('href', 'title', 'aria-label')
+
+# ZenRows css_extractor for item pages: just the phone candidates and the item JSON,
+# returned as a small JSON object instead of the whole rendered page
+ITEM_CSS_EXTRACTOR = {
+    'tel_links': "a[href^='tel:'] @href",
+    'phone_elements': "[data-testid*='phone'], [class*='phone'], [id*='phone'], .contact-info a",
+    'next_data': 'script#__NEXT_DATA__',
+}
+
+# Shared by every scraper/extractor process so the ordering learns across runs
+STRATEGY_STATS_FILE = os.environ.get(
+    'YAD2_STRATEGY_STATS_FILE', '/home/ubuntu/yad2bot_scraper/data/phone_strategy_stats.json'
+)
+
+# Strategies with fewer successes than this after MIN_ATTEMPTS tries are pruned
+MIN_ATTEMPTS = int(os.environ.get('YAD2_STRATEGY_MIN_ATTEMPTS', '20'))
+PRUNE_SUCCESS_RATE = float(os.environ.get('YAD2_STRATEGY_PRUNE_RATE', '0.05'))
+# Every Nth lookup a pruned strategy still gets one try, so it can come back
+EXPLORE_EVERY = int(os.environ.get('YAD2_STRATEGY_EXPLORE_EVERY', '25'))
+
+
+@dataclass(frozen=True)
+class PhoneStrategy:
+    """One way of asking ZenRows for a listing page with the phone revealed."""
+    name: str
+    clicks: Tuple[str, ...]
+    outputs: Optional[str] = None
+    wait_ms: int = 5000
+
+    def js_instructions(self) -> List[Dict[str, Any]]:
+        """ZenRows js_instructions: wait for the page, click each button, wait for the phone."""
+        instructions: List[Dict[str, Any]] = [{"wait": 1500}]
+        for selector in self.clicks:
+            instructions.append({"click": selector})
+            instructions.append({"wait": 2000})
+        return instructions
+
+
+# Keyed by the names used in config.EXTRACTION_STRATEGIES
+PHONE_STRATEGIES: Dict[str, PhoneStrategy] = {
+    # Rendered page, phone from the DOM, details from __NEXT_DATA__ (phone_extractor_fixed)
+    'nextjs': PhoneStrategy(
+        name='nextjs',
+        clicks=("button:contains('הצגת מספר טלפון')",
+                "[data-testid*='phone'], .phone-button, button[aria-label*='טלפון']"),
+    ),
+    # Rendered page after the legacy "viewPhone" button (Yad2Scraper)
+    'html': PhoneStrategy(
+        name='html',
+        clicks=(".viewPhone", "[data-testid='contact-info-phone']"),
+    ),
+    # ZenRows extracts the phones itself and returns JSON (utils.py)
+    'api': PhoneStrategy(
+        name='api',
+        clicks=('[data-testid="show-phone-button"]',),
+        outputs='phone_numbers',
+        wait_ms=3500,
+    ),
+}
+
+
+def configured_strategies() -> List[str]:
+    """Strategy names from config, in their configured order, default first."""
+    names = [name.strip() for name in EXTRACTION_STRATEGIES if name.strip() in PHONE_STRATEGIES]
+    if DEFAULT_EXTRACTION_STRATEGY in PHONE_STRATEGIES:
+        names = [DEFAULT_EXTRACTION_STRATEGY] + [name for name in names if name != DEFAULT_EXTRACTION_STRATEGY]
+    return names or ['nextjs']
+
+
+def normalize_phone(raw: str) -> str:
+    """Return the number as 05XXXXXXXX, or '' if it is not an Israeli mobile number."""
+    phone = re.sub(r'[^0-9]', '', raw)
+    if phone.startswith('972'):
+        phone = '0' + phone[3:]
+    if len(phone) == 10 and phone.startswith('05'):
+        return phone
+    return ''
+
+
+def _first_phone(text: str) -> Tuple[str, str]:
+    """First valid phone in text, with the name of the pattern that matched."""
+    for match in PHONE_RE.finditer(text):
+        phone = normalize_phone(match.group())
+        if phone:
+            return phone, match.lastgroup
+    return '', ''
+
+
+def _phone_hint(element: Tag) -> str:
+    """Return which hint marks this element as phone related ('' if none)."""
+    href = element.get('href')
+    if href and '05' in href:
+        return 'href*=05'
+    for attr, needles in PHONE_HINT_ATTRS:
+        value = element.get(attr)
+        if not value:
+            continue
+        if isinstance(value, list):
+            value = ' '.join(value)
+        for needle in needles:
+            if needle in value:
+                return f"{attr}*={needle}"
+    return ''
+
+
+def find_phone_in_html(content: bytes) -> Tuple[str, str, str]:
+    """Find the advertiser's phone in a listing page.
+
+    Returns (phone, source, pattern). tel: links are found with a bytes regex
+    without parsing at all; otherwise the DOM is walked once, checking
+    phone/contact elements first and the visible page text second.
+    """
+    for match in TEL_HREF_RE_BYTES.finditer(content):
+        phone = normalize_phone(match.group(1).decode('ascii', 'ignore'))
+        if phone:
+            return phone, 'tel link', 'tel'
+
+    soup = BeautifulSoup(content, HTML_PARSER)
+    text_parts = []
+    for node in soup.descendants:
+        if isinstance(node, Tag):
+            hint = _phone_hint(node)
+            if hint:
+                sources = [node.get_text(strip=True)] + [node.get(attr, '') for attr in PHONE_TEXT_ATTRS]
+                for text in sources:
+                    phone, pattern = _first_phone(text) if text else ('', '')
+                    if phone:
+                        return phone, f"<{node.name}> {hint}", pattern
+        elif type(node) is NavigableString:
+            # Plain text only - skips script/style/comment strings, like get_text()
+            text_parts.append(node)
+
+    phone, pattern = _first_phone(''.join(text_parts))
+    return (phone, 'page text', pattern) if phone else ('', '', '')
+
+
+def find_phone_in_next_data(html: str) -> Tuple[str, str, str]:
+    """Find a phone inside the item JSON (__NEXT_DATA__), where the revealed contact lands."""
+    match = NEXT_DATA_RE.search(html)
+    if not match:
+        return '', '', ''
+    phone, pattern = _first_phone(match.group(1))
+    return (phone, '__NEXT_DATA__', pattern) if phone else ('', '', '')
+
+
+def _as_list(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [str(item) for item in value if item]
+    return [str(value)] if value else []
+
+
+def find_phone_in_css_output(data: Dict) -> Tuple[str, str, str]:
+    """Find the phone in a css_extractor response (ITEM_CSS_EXTRACTOR keys)."""
+    for raw_phone in _as_list(data.get('tel_links')):
+        phone = normalize_phone(raw_phone.replace('tel:', ''))
+        if phone:
+            return phone, 'tel link', 'tel'
+    for text in _as_list(data.get('phone_elements')):
+        phone, pattern = _first_phone(text)
+        if phone:
+            return phone, 'phone element', pattern
+    for text in _as_list(data.get('next_data')):
+        phone, pattern = _first_phone(text)
+        if phone:
+            return phone, '__NEXT_DATA__', pattern
+    return '', '', ''
+
+
+def next_data_from_css_output(data: Dict) -> Optional[Dict]:
+    """Decode the __NEXT_DATA__ text returned by css_extractor, if any."""
+    for text in _as_list(data.get('next_data')):
+        try:
+            return json.loads(text)
+        except ValueError:
+            continue
+    return None
+
+
+def find_phone_in_outputs(data: Dict) -> Tuple[str, str, str]:
+    """Pick the first valid phone from a ZenRows outputs=phone_numbers response."""
+    for raw_phone in data.get('phone_numbers') or []:
+        phone = normalize_phone(str(raw_phone))
+        if phone:
+            return phone, 'phone_numbers output', 'zenrows'
+    return '', '', ''
+
+
+def _empty_entry() -> Dict[str, Any]:
+    return {
+        'attempts': 0,
+        'successes': 0,
+        'total_latency': 0.0,
+        'sources': {},
+        'patterns': {}
+    }
+
+
+def _merge_entry(entry: Dict[str, Any], delta: Dict[str, Any]) -> None:
+    """Add one process's unsaved counts (delta) onto an entry."""
+    for key in ('attempts', 'successes', 'total_latency'):
+        entry[key] = entry.get(key, 0) + delta.get(key, 0)
+    for key in ('sources', 'patterns'):
+        counts = entry.setdefault(key, {})
+        for name, count in delta.get(key, {}).items():
+            counts[name] = counts.get(name, 0) + count
+    if delta.get('last_used', '') > entry.get('last_used', ''):
+        entry['last_used'] = delta['last_used']
+
+
+class StrategyStats:
+    """Persistent success/latency statistics per phone strategy.
+
+    Scraper runs, phone extractors and the watcher share one stats file: record()
+    counts in memory and save() adds this process's counts since its last save
+    onto the file's current contents under an exclusive lock, so no process
+    overwrites another's history.
+    """
+
+    def __init__(self, stats_file: str):
+        self.stats_file = stats_file
+        self.strategies: Dict[str, Dict[str, Any]] = {}
+        # Counts recorded since the last save, merged into the file by save()
+        self._unsaved: Dict[str, Dict[str, Any]] = {}
+        self.lookups = 0
+        self._load()
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        """The stats on disk (missing or corrupt file means no history)."""
+        try:
+            if os.path.exists(self.stats_file):
+                with open(self.stats_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not load phone strategy stats {self.stats_file}: {e}")
+        return {}
+
+    def _load(self) -> None:
+        self.strategies = self._read()
+        if self.strategies:
+            logger.info(f"Loaded phone strategy stats for {len(self.strategies)} strategies from {self.stats_file}")
+
+    def save(self) -> None:
+        """Merge this process's new counts into the file and reload everyone's totals."""
+        try:
+            with open(f"{self.stats_file}.lock", 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    strategies = self._read()
+                    for name, delta in self._unsaved.items():
+                        _merge_entry(strategies.setdefault(name, _empty_entry()), delta)
+                    # Written atomically so readers outside the lock never see half a file
+                    tmp_file = f"{self.stats_file}.{os.getpid()}.tmp"
+                    with open(tmp_file, 'w', encoding='utf-8') as f:
+                        json.dump(strategies, f, ensure_ascii=False, indent=2)
+                    os.replace(tmp_file, self.stats_file)
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+            self.strategies = strategies
+            self._unsaved = {}
+        except Exception as e:
+            logger.warning(f"Could not save phone strategy stats {self.stats_file}: {e}")
+
+    def record(self, name: str, phone: str, latency: float, source: str = '', pattern: str = '') -> None:
+        """Record one attempt of a strategy and, on success, what produced the phone."""
+        delta = {'attempts': 1, 'successes': 0, 'total_latency': latency, 'sources': {}, 'patterns': {},
+                 'last_used': datetime.now().isoformat()}
+        if phone:
+            delta.update(successes=1, sources={source: 1}, patterns={pattern: 1})
+        _merge_entry(self.strategies.setdefault(name, _empty_entry()), delta)
+        _merge_entry(self._unsaved.setdefault(name, _empty_entry()), delta)
+
+    def success_rate(self, name: str) -> float:
+        """Smoothed success rate, so unseen strategies start at 0.5."""
+        entry = self.strategies.get(name, {})
+        return (entry.get('successes', 0) + 1) / (entry.get('attempts', 0) + 2)
+
+    def mean_latency(self, name: str) -> Optional[float]:
+        entry = self.strategies.get(name, {})
+        if not entry.get('attempts'):
+            return None
+        return entry['total_latency'] / entry['attempts']
+
+    def is_pruned(self, name: str) -> bool:
+        entry = self.strategies.get(name, {})
+        if entry.get('attempts', 0) < MIN_ATTEMPTS:
+            return False
+        return entry['successes'] / entry['attempts'] < PRUNE_SUCCESS_RATE
+
+    def order(self, names: List[str], default: Optional[str] = None) -> List[str]:
+        """Order strategies by phones found per second of latency, dropping pruned ones.
+
+        Strategies without history come first, in configured order, so each
+        gets measured; the default strategy is never pruned.
+        """
+        self.lookups += 1
+        explore = EXPLORE_EVERY > 0 and self.lookups % EXPLORE_EVERY == 0
+
+        def score(item: Tuple[int, str]) -> Tuple[float, int]:
+            position, name = item
+            latency = self.mean_latency(name)
+            if latency is None:
+                return (float('inf'), -position)
+            return (self.success_rate(name) / max(latency, 0.001), -position)
+
+        ranked = [name for _, name in sorted(enumerate(names), key=score, reverse=True)]
+        active = [name for name in ranked if name == default or not self.is_pruned(name)]
+        if explore:
+            # Give the pruned strategies one try right after the best one
+            active[1:1] = [name for name in ranked if name not in active]
+        return active or ranked[:1]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-strategy summary for logging."""
+        return {
+            name: {
+                'attempts': entry['attempts'],
+                'success_rate': round(entry['successes'] / entry['attempts'], 3) if entry['attempts'] else 0,
+                'mean_latency': round(entry['total_latency'] / entry['attempts'], 2) if entry['attempts'] else None,
+                'pruned': self.is_pruned(name)
+            }
+            for name, entry in self.strategies.items()
+        }
+
+
+def _run_simulation() -> None:
+    """Every PHONE_PATTERN label is reachable and normalizes to the same number."""
+    labels = set(PHONE_RE.groupindex)
+    assert labels == set(PHONE_PATTERN_EXAMPLES), labels ^ set(PHONE_PATTERN_EXAMPLES)
+    for label, text in PHONE_PATTERN_EXAMPLES.items():
+        phone, pattern = _first_phone(f"טלפון: {text} ")
+        assert (phone, pattern) == ('0501234567', label), (label, phone, pattern)
+    assert _first_phone("03-1234567") == ('', '')
+
+    # Two processes saving the same stats file add up instead of overwriting each other
+    with tempfile.TemporaryDirectory() as state_dir:
+        stats_file = os.path.join(state_dir, 'phone_strategy_stats.json')
+        scraper, watcher = StrategyStats(stats_file), StrategyStats(stats_file)
+        scraper.record('html', '0501234567', 2.0, 'next_data', 'local')
+        scraper.save()
+        watcher.record('html', '', 1.0)
+        watcher.record('html', '0501234567', 3.0, 'dom', 'local')
+        watcher.save()
+        scraper.save()
+        entry = StrategyStats(stats_file).strategies['html']
+        assert (entry['attempts'], entry['successes'], entry['total_latency']) == (3, 2, 6.0), entry
+        assert entry['sources'] == {'next_data': 1, 'dom': 1} and entry['patterns'] == {'local': 2}, entry
+        assert scraper.strategies == watcher.strategies
+    print("phone_strategies simulation: all checks passed")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    _run_simulation()
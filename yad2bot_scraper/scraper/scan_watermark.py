@@ -0,0 +1,166 @@
+"""
+Scan Watermark - what earlier scans of a city/mode have already handled
+Persists, per scope and (city, mode), the feed tokens a scan has dealt with
+(each with a version built from its price and feed dates). The scope is the
+user, filter type and scan filters of the run (see watermark_scope), so one
+user's scans never hide listings from another's.
+An --incremental run of main.py skips listings whose token and version are
+already recorded, so they are not re-checked against the CRM or re-dated, and
+stops paging once a whole page is already-seen territory.
+The tokens are only recorded after the run's CSV was written, so a crashed run
+leaves the watermark where it was; tokens not seen for TOKEN_TTL_DAYS are pruned.
+It also keeps the unfiltered feed's page count per city/mode, which filtered
+scans compare themselves with to report the pages their URL filters saved.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Recorded tokens not seen again for this long are dropped (a listing unchanged
+# for longer only comes back as "new" once)
+TOKEN_TTL_DAYS = int(os.environ.get('YAD2_WATERMARK_TOKEN_TTL_DAYS', '30'))
+
+
+def watermark_scope(user_id: Optional[str], filter_type: str, filters_json: Optional[str] = None) -> str:
+    """Scope of a run's watermark: its user, filter type and scan filters."""
+    scope = f"{user_id or 0}:{filter_type}"
+    if filters_json:
+        scope += ':' + hashlib.sha1(filters_json.encode('utf-8')).hexdigest()[:8]
+    return scope
+
+
+def listing_version(listing: Dict) -> str:
+    """Short fingerprint of the feed fields that change when a listing is edited or bumped."""
+    dates = listing.get('dates') or {}
+    price = listing.get('price')
+    parts = [str(price if price is not None else ''),
+             str(dates.get('updatedAt') or ''),
+             str(dates.get('rebouncedAt') or '')]
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:12]
+
+
+class ScanWatermark:
+    """Per scope and (city, mode) seen tokens, plus feed sizes, in a small SQLite file."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.init_tables()
+
+    def init_tables(self) -> None:
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                # Watermarks from before scopes were shared by every user: start over
+                columns = [row[1] for row in conn.execute('PRAGMA table_info(watermark_tokens)')]
+                if columns and 'scope' not in columns:
+                    logger.info("Dropping unscoped scan watermarks, the next incremental scans run in full")
+                    conn.execute('DROP TABLE watermark_tokens')
+                    conn.execute('DROP TABLE IF EXISTS scan_watermarks')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS scan_watermarks (
+                        scope TEXT,
+                        city TEXT,
+                        mode TEXT,
+                        last_scan_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (scope, city, mode)
+                    )
+                ''')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS watermark_tokens (
+                        scope TEXT,
+                        city TEXT,
+                        mode TEXT,
+                        token TEXT,
+                        version TEXT,
+                        last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (scope, city, mode, token)
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_watermark_tokens_seen ON watermark_tokens(last_seen)')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS feed_sizes (
+                        city TEXT,
+                        mode TEXT,
+                        total_pages INTEGER,
+                        seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (city, mode)
+                    )
+                ''')
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error initializing scan watermark tables: {e}")
+
+    def has_watermark(self, scope: str, city: str, mode: str) -> bool:
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                return conn.execute('SELECT 1 FROM scan_watermarks WHERE scope = ? AND city = ? AND mode = ?',
+                                    (scope, city, mode)).fetchone() is not None
+        except Exception as e:
+            logger.warning(f"Could not read scan watermark for {scope} {city}/{mode}: {e}")
+            return False
+
+    def seen_versions(self, scope: str, city: str, mode: str, tokens: Iterable[str]) -> Dict[str, str]:
+        """token -> recorded version for the tokens of one feed page that were seen before."""
+        tokens = [token for token in tokens if token]
+        if not tokens:
+            return {}
+        placeholders = ','.join('?' * len(tokens))
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                rows = conn.execute(f'''
+                    SELECT token, version FROM watermark_tokens
+                    WHERE scope = ? AND city = ? AND mode = ? AND token IN ({placeholders})
+                ''', (scope, city, mode, *tokens)).fetchall()
+            return dict(rows)
+        except Exception as e:
+            logger.warning(f"Could not read seen tokens for {scope} {city}/{mode}: {e}")
+            return {}
+
+    def advance(self, scope: str, city: str, mode: str, versions: Dict[str, str]) -> None:
+        """Record the tokens a finished run handled and prune tokens not seen for TOKEN_TTL_DAYS."""
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                conn.executemany('''
+                    INSERT INTO watermark_tokens (scope, city, mode, token, version) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(scope, city, mode, token) DO UPDATE SET
+                        version = excluded.version, last_seen = CURRENT_TIMESTAMP
+                ''', [(scope, city, mode, token, version) for token, version in versions.items()])
+                conn.execute('''
+                    INSERT INTO scan_watermarks (scope, city, mode) VALUES (?, ?, ?)
+                    ON CONFLICT(scope, city, mode) DO UPDATE SET last_scan_at = CURRENT_TIMESTAMP
+                ''', (scope, city, mode))
+                pruned = conn.execute("DELETE FROM watermark_tokens WHERE last_seen < datetime('now', ?)",
+                                      (f'-{TOKEN_TTL_DAYS} days',)).rowcount
+                conn.commit()
+            logger.info(f"Scan watermark for {scope} {city}/{mode} advanced by {len(versions)} tokens "
+                        f"({pruned} stale tokens pruned)")
+        except Exception as e:
+            logger.warning(f"Could not advance scan watermark for {scope} {city}/{mode}: {e}")
+
+    def record_feed_size(self, city: str, mode: str, total_pages: int) -> None:
+        """Remember the page count of the unfiltered feed of a city/mode."""
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                conn.execute('''
+                    INSERT INTO feed_sizes (city, mode, total_pages) VALUES (?, ?, ?)
+                    ON CONFLICT(city, mode) DO UPDATE SET
+                        total_pages = excluded.total_pages, seen_at = CURRENT_TIMESTAMP
+                ''', (city, mode, total_pages))
+                conn.commit()
+        except Exception as e:
+            logger.warning(f"Could not record feed size for {city}/{mode}: {e}")
+
+    def feed_size(self, city: str, mode: str) -> Optional[Tuple[int, str]]:
+        """(total pages, when seen) of the unfiltered feed, if a scan recorded it."""
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                row = conn.execute('SELECT total_pages, seen_at FROM feed_sizes WHERE city = ? AND mode = ?',
+                                   (city, mode)).fetchone()
+            return tuple(row) if row else None
+        except Exception as e:
+            logger.warning(f"Could not read feed size for {city}/{mode}: {e}")
+            return None
@@ -4,13 +4,23 @@ import re
 import time
 import datetime
 import random
+import sys
 import requests # Ensure requests is imported for fetch_yad2_data
 from zenrows import ZenRowsClient
 
-# API Key from environment variable
-ZENROWS_API_KEY = os.environ.get('ZENROWS_API_KEY')
-if not ZENROWS_API_KEY:
-    raise ValueError("ZENROWS_API_KEY environment variable is required")
+from phone_strategies import PHONE_STRATEGIES
+
+# Shared modules live in the bot's root directory
+sys.path.insert(0, '/root/yad2bot-service-scraper')
+from zenrows_fetcher import ZenRowsFetcher
+from zenrows_key_pool import get_key_pool
+from fetch_ledger import get_fetch_ledger
+
+# API keys (ZENROWS_API_KEYS / ZENROWS_API_KEY) are spread over the shared key pool
+key_pool = get_key_pool()
+
+# Cheap-first tiered fetcher for feed pages
+zenrows_fetcher = ZenRowsFetcher(key_pool)
 
 # Define a path for saving debug responses
 DEBUG_RESPONSE_DIR = "/home/ubuntu/yad2_scraper_final/yad2_scraper/data/raw/json/"
@@ -23,18 +33,13 @@ def get_phone_number_with_zenrows(url: str) -> str | None:
     and extracts phone numbers using the 'outputs' feature.
     Saves the full ZenRows response to a debug file if extraction fails or is empty.
     """
-    client = ZenRowsClient(ZENROWS_API_KEY)
-    show_phone_button_selector = '[data-testid="show-phone-button"]'
-    js_instructions_payload = [
-        {"click": show_phone_button_selector},
-        {"wait": 3500}
-    ]
+    strategy = PHONE_STRATEGIES['api']
     params = {
         "js_render": "true",
-        "js_instructions": json.dumps(js_instructions_payload),
+        "js_instructions": json.dumps(strategy.js_instructions()),
         "premium_proxy": "true",
         "proxy_country": "il",
-        "outputs": "phone_numbers"
+        "outputs": strategy.outputs
     }
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
@@ -42,7 +47,12 @@ def get_phone_number_with_zenrows(url: str) -> str | None:
     }
     try:
         print(f"Attempting to get phone number from URL: {url} using ZenRows.")
-        response = client.get(url, params=params, headers=headers)
+        request_start = time.time()
+        with key_pool.lease() as lease:
+            client = ZenRowsClient(lease.api_key)
+            response = client.get(url, params=params, headers=headers)
+            lease.report(response)
+        get_fetch_ledger().record('phone', params, response, time.time() - request_start)
         response.raise_for_status()
         data = response.json()
         with open(DEBUG_RESPONSE_FILE, 'w', encoding='utf-8') as f_debug:
@@ -113,26 +123,13 @@ RAW_JSON_DIR_UTILS = "/home/ubuntu/yad2_scraper_final/yad2_scraper/data/raw/json
 os.makedirs(RAW_JSON_DIR_UTILS, exist_ok=True)
 
 def fetch_yad2_data(url: str) -> dict:
-    print(f"[Placeholder] Fetching Yad2 data from {url}")
-    # This should use ZenRows as per previous logic in main.py
-    # For now, returning a structure that main.py might expect to avoid immediate crashes.
-    # The actual ZenRows call for the main feed should be here.
-    client = ZenRowsClient(ZENROWS_API_KEY)
-    params = {
-        "js_render": "true",
-        "premium_proxy": "true",
-        "proxy_country": "il"
-    }
-    try:
-        response = client.get(url, params=params)
-        response.raise_for_status()
-        # Assuming the main feed returns HTML that contains a JSON script tag
-        # Or if it can return JSON directly, that would be better.
-        # For now, let's assume it returns HTML and we need to extract JSON from it.
-        return {"html": response.text} # Simplified, main.py expects this structure
-    except Exception as e:
-        print(f"Error in placeholder fetch_yad2_data: {e}")
-        return {"html": "<html><body>Error fetching data</body></html>"}
+    print(f"Fetching Yad2 data from {url}")
+    # Cheapest ZenRows tier first; js_render only when the static page lacks __NEXT_DATA__
+    result = zenrows_fetcher.fetch(url, page_type='feed')
+    if result:
+        return {"html": result.text}
+    print(f"Error in fetch_yad2_data: all ZenRows tiers failed for {url}")
+    return {"html": "<html><body>Error fetching data</body></html>"}
 
 def save_raw_html(html_content: str, filename: str) -> None:
     filepath = os.path.join(RAW_HTML_DIR_UTILS, filename)
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Listing Watcher - near-real-time alerts for new listings
+Polls only page 1 of the date-sorted feed of every watched city/mode and diffs
+its tokens against a compact in-memory set of recent ones. New listings alone go
+through the private-owner filter and the saved-search index, and only those
+some user's search matches go on to the CRM check and the phone stage; each
+one that passes becomes an alert row in the bot's database, which the bot
+delivers to the matching users (see listing_watch.py).
+Each city/mode polls on its own interval: short while listings keep arriving,
+longer when the feed is quiet, stretched while the shared backoff is raised.
+The bot starts this process while any watch exists; `--simulate` runs the
+poll-interval policy against synthetic arrivals instead.
+"""
+
+import argparse
+import logging
+import os
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from main import DB_CHECK_AVAILABLE, Yad2Scraper, check_lead_exists_in_mysql
+from phone_extractor_fixed import FixedPhoneExtractor
+from listing import PLACEHOLDER_PHONE
+from listing_watch import WatchStore, get_watch_store
+from saved_searches import SearchIndex
+
+logger = logging.getLogger(__name__)
+
+# Bounds of a city/mode's poll interval; the upper one caps the alert delay of a quiet feed
+MIN_POLL_SECONDS = float(os.environ.get('YAD2_WATCH_MIN_POLL_SECONDS', '20'))
+MAX_POLL_SECONDS = float(os.environ.get('YAD2_WATCH_MAX_POLL_SECONDS', '120'))
+# New listings one poll should find on average: lower means faster alerts and more fetches
+TARGET_NEW_PER_POLL = 0.5
+# Weight of the latest poll in the arrival-rate average
+RATE_SMOOTHING = 0.3
+# Interval multiplier by shared backoff level (BackoffLevel.value)
+BACKOFF_STRETCH = {0: 1.0, 1: 1.5, 2: 2.0, 3: 4.0, 4: 8.0}
+# Tokens remembered per city/mode; page 1 holds about 20
+WATCH_MEMORY_TOKENS = 400
+# Longest sleep between checks of the watch list
+IDLE_SECONDS = 5.0
+
+
+class RecentTokens:
+    """Bounded set of the most recently seen tokens (oldest evicted first)."""
+
+    def __init__(self, capacity: int = WATCH_MEMORY_TOKENS):
+        self.capacity = capacity
+        self._tokens: OrderedDict = OrderedDict()
+
+    def add(self, token: str) -> bool:
+        """Remember token; True if it was not known."""
+        if token in self._tokens:
+            self._tokens.move_to_end(token)
+            return False
+        self._tokens[token] = None
+        if len(self._tokens) > self.capacity:
+            self._tokens.popitem(last=False)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+
+@dataclass
+class PollSchedule:
+    """Adaptive poll interval of one city/mode, from its observed arrival rate."""
+    rate: float = 0.0  # new listings per second, smoothed
+    interval: float = MIN_POLL_SECONDS
+    last_poll: Optional[float] = None
+    next_poll: float = 0.0
+
+    def record(self, new_count: int, now: float, overflow: bool = False, backoff_level: int = 0) -> float:
+        """Feed one poll's result in and schedule the next poll; returns the new interval."""
+        if self.last_poll is not None:
+            elapsed = max(1.0, now - self.last_poll)
+            self.rate = (1 - RATE_SMOOTHING) * self.rate + RATE_SMOOTHING * new_count / elapsed
+        self.last_poll = now
+        if overflow:
+            # Page 1 was all new, so listings may have scrolled past it: catch up at full speed
+            interval = MIN_POLL_SECONDS
+        elif self.rate > 0:
+            interval = min(MAX_POLL_SECONDS, max(MIN_POLL_SECONDS, TARGET_NEW_PER_POLL / self.rate))
+        else:
+            interval = MAX_POLL_SECONDS
+        return self._schedule(interval, now, backoff_level)
+
+    def failed(self, now: float, backoff_level: int = 0) -> float:
+        """A poll that got no feed page: keep the interval, stretched by the backoff."""
+        return self._schedule(self.interval, now, backoff_level)
+
+    def _schedule(self, interval: float, now: float, backoff_level: int) -> float:
+        self.interval = interval
+        self.next_poll = now + interval * BACKOFF_STRETCH.get(backoff_level, max(BACKOFF_STRETCH.values()))
+        return self.next_poll - now
+
+
+class ListingWatcher:
+    """Polls page 1 of every watched city/mode and turns new listings into alerts."""
+
+    def __init__(self, scraper: Optional[Yad2Scraper] = None, store: Optional[WatchStore] = None,
+                 extractor: Optional[FixedPhoneExtractor] = None):
+        self.scraper = scraper or Yad2Scraper()
+        self.store = store or get_watch_store()
+        self.extractor = extractor or FixedPhoneExtractor()
+        self.seen: Dict[Tuple[str, str], RecentTokens] = {}
+        self.index = SearchIndex()
+        self._index_fingerprint = None
+        self.schedules: Dict[Tuple[str, str], PollSchedule] = {}
+        self.polls = 0
+        self.alerts = 0
+
+    def _backoff_level(self) -> int:
+        return self.scraper.controller.backoff.current_level.value
+
+    def poll(self, city_code: str, mode: str) -> int:
+        """Poll one city/mode once; returns the number of alerts queued."""
+        key = (city_code, mode)
+        schedule = self.schedules.setdefault(key, PollSchedule())
+        raw_listings = self.scraper.fetch_feed_listings(self.scraper.feed_url(mode, city_code, order_by_date=True), mode)
+        self.polls += 1
+        now = time.time()
+        if raw_listings is None:
+            delay = schedule.failed(now, self._backoff_level())
+            logger.warning(f"Watch poll of {city_code}/{mode} got no feed page, next poll in {delay:.0f}s")
+            return 0
+
+        first_poll = key not in self.seen
+        seen = self.seen.setdefault(key, RecentTokens())
+        new_listings = [listing for listing in raw_listings if listing.get('token') and seen.add(listing['token'])]
+        if first_poll:
+            # Everything on page 1 predates the watch; only what appears from now on is news
+            schedule.record(0, now, backoff_level=self._backoff_level())
+            logger.info(f"Watching {city_code}/{mode}: {len(seen)} tokens on page 1")
+            return 0
+
+        overflow = bool(raw_listings) and len(new_listings) == len(raw_listings)
+        if overflow:
+            logger.warning(f"Page 1 of {city_code}/{mode} is entirely new, some listings may have been missed")
+        delay = schedule.record(len(new_listings), now, overflow, self._backoff_level())
+        alerts = self._alert(city_code, mode, new_listings) if new_listings else 0
+        logger.info(f"Watch poll {city_code}/{mode}: {len(new_listings)} new, {alerts} alerts, "
+                    f"rate {schedule.rate * 3600:.1f}/h, next poll in {delay:.0f}s")
+        return alerts
+
+    def _alert(self, city_code: str, mode: str, new_listings: List[Dict]) -> int:
+        """Run the filters and the phone stage on new listings and queue alerts for the ones that pass."""
+        self.index, self._index_fingerprint = self.store.current_index(self.index, self._index_fingerprint)
+        candidates = []
+        for item, private in zip(new_listings, self.scraper.classify_private_owners(new_listings)):
+            if not private:
+                continue
+            listing = self.scraper.extract_listing_details(item)
+            if not listing:
+                continue
+            neighborhood = ((item.get('address') or {}).get('neighborhood') or {}).get('text', '')
+            # Nobody would be told about it, so it is not worth a CRM check and phone fetches
+            if not self.index.match(city_code, mode, listing.price, listing.rooms, neighborhood, private):
+                continue
+            if DB_CHECK_AVAILABLE:
+                try:
+                    if check_lead_exists_in_mysql(listing.listing_url):
+                        continue
+                except Exception as e:
+                    logger.warning(f"Could not check CRM, continuing with processing: {e}")
+            candidates.append((listing, neighborhood))
+        if not candidates:
+            return 0
+
+        # Same fan-out as the phone extractor: the controller bounds how many fetch at once
+        with ThreadPoolExecutor(max_workers=self.extractor.controller.max_limit) as executor:
+            all_details = list(executor.map(self.extractor.get_listing_details_from_page,
+                                            [listing.listing_url for listing, _ in candidates],
+                                            [listing.needs_page_details for listing, _ in candidates]))
+        self.extractor.strategy_stats.save()
+
+        alerts = 0
+        for (listing, neighborhood), details in zip(candidates, all_details):
+            if details.get('phone_number') and details['phone_number'] != PLACEHOLDER_PHONE:
+                listing.phone_number = details['phone_number']
+            listing.apply_page_details(details)
+            if self.store.push_alert(city_code, mode, listing, neighborhood):
+                alerts += 1
+        self.alerts += alerts
+        return alerts
+
+    def run(self, once: bool = False) -> None:
+        """Poll due city/modes until killed (or one round with once=True)."""
+        logger.info("Listing watcher started")
+        while True:
+            watched = set(self.store.watched_pairs())
+            for key in [key for key in self.schedules if key not in watched]:
+                logger.info(f"{key[0]}/{key[1]} no longer watched")
+                self.schedules.pop(key)
+                self.seen.pop(key, None)
+
+            for key in sorted(watched, key=lambda k: self.schedules[k].next_poll if k in self.schedules else 0):
+                if key in self.schedules and self.schedules[key].next_poll > time.time():
+                    continue
+                try:
+                    self.poll(*key)
+                except Exception as e:
+                    logger.error(f"Error polling {key[0]}/{key[1]}: {e}")
+                    self.schedules.setdefault(key, PollSchedule()).failed(time.time(), self._backoff_level())
+            if once:
+                return
+            if self.polls and self.polls % 50 == 0:
+                logger.info(f"Watcher stats: {self.get_stats()}")
+
+            next_due = min((schedule.next_poll for schedule in self.schedules.values()), default=time.time() + IDLE_SECONDS)
+            time.sleep(min(IDLE_SECONDS, max(0.5, next_due - time.time())))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'watched': len(self.schedules),
+            'polls': self.polls,
+            'alerts': self.alerts,
+            'intervals': {f"{city}/{mode}": round(schedule.interval) for (city, mode), schedule in self.schedules.items()},
+            'concurrency': self.scraper.controller.get_metrics(),
+        }
+
+
+def simulate(hours: float = 24.0, seed: int = 3, page_size: int = 20) -> Dict[str, Any]:
+    """Poll one city/mode against Poisson arrivals whose rate follows the day (busy 9-21, quiet at night).
+
+    Returns the alert delay (poll time minus arrival) percentiles, polls per hour
+    and listings missed by page-1 overflow, next to polling every MIN_POLL_SECONDS.
+    """
+    rng = random.Random(seed)
+
+    def arrival_rate(t: float) -> float:
+        hour = (t / 3600) % 24
+        return 1 / 90 if 9 <= hour < 21 else 1 / 1200  # per second
+
+    arrivals = []
+    t = 0.0
+    while t < hours * 3600:
+        # Thinning: draw at the peak rate, keep in proportion to the rate at t
+        t += rng.expovariate(1 / 90)
+        if rng.random() < arrival_rate(t) * 90:
+            arrivals.append(t)
+
+    schedule = PollSchedule()
+    delays = []
+    missed = polls = 0
+    next_arrival = 0
+    now = 0.0
+    schedule.record(0, now)
+    while now < hours * 3600:
+        now = schedule.next_poll
+        polls += 1
+        fresh = []
+        while next_arrival < len(arrivals) and arrivals[next_arrival] <= now:
+            fresh.append(arrivals[next_arrival])
+            next_arrival += 1
+        # Only the newest page_size arrivals are still on page 1
+        missed += max(0, len(fresh) - page_size)
+        delays.extend(now - arrival for arrival in fresh[-page_size:])
+        schedule.record(len(fresh), now, overflow=len(fresh) >= page_size)
+
+    delays.sort()
+
+    def pct(p):
+        return round(delays[min(len(delays) - 1, int(p / 100 * len(delays)))], 1)
+
+    return {
+        'arrivals': len(arrivals),
+        'delay_p50_s': pct(50),
+        'delay_p95_s': pct(95),
+        'delay_max_s': round(delays[-1], 1),
+        'missed': missed,
+        'polls_per_hour': round(polls / hours, 1),
+        'fixed_polls_per_hour': round(3600 / MIN_POLL_SECONDS, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Watch page 1 of watched feeds and queue new-listing alerts')
+    parser.add_argument('--once', action='store_true', help='Poll every watched city/mode once and exit')
+    parser.add_argument('--simulate', action='store_true', help='Run the poll-interval simulation')
+    args = parser.parse_args()
+
+    if args.simulate:
+        result = simulate()
+        print(result)
+        assert result['delay_max_s'] <= MAX_POLL_SECONDS
+        assert result['polls_per_hour'] < result['fixed_polls_per_hour']
+        return
+    ListingWatcher().run(once=args.once)
+
+
+if __name__ == '__main__':
+    main()
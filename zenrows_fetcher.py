@@ -0,0 +1,328 @@
+"""
+ZenRows Fetcher - שליפה מדורגת מהזול ליקר
+Tries the cheapest ZenRows tier first (plain request, then premium proxy, then
+js_render) and escalates only when the response does not validate. Per page
+type tier statistics are persisted so the policy learns which pages need rendering.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from blocking_detector import BlockingIndicator, get_blocking_detector
+from concurrency_controller import ConcurrencyController, get_concurrency_controller
+from fetch_ledger import FetchLedger, get_fetch_ledger
+from zenrows_key_pool import ZenRowsKeyPool, get_key_pool
+
+logger = logging.getLogger(__name__)
+
+ZENROWS_API_URL = 'https://api.zenrows.com/v1/'
+
+# Shared state (tier stats, later also key/quota state) lives next to the scraper data
+STATE_DIR = os.environ.get('YAD2BOT_STATE_DIR', '/home/ubuntu/yad2bot_scraper/data')
+
+# Cheapest first; each tier adds to the ZenRows parameters of the one before
+FETCH_TIERS: List[Dict[str, Any]] = [
+    {'name': 'static', 'params': {}},
+    {'name': 'premium', 'params': {'premium_proxy': 'true', 'proxy_country': 'il'}},
+    {'name': 'render', 'params': {'js_render': 'true', 'premium_proxy': 'true', 'proxy_country': 'il'}},
+]
+TIER_NAMES = [tier['name'] for tier in FETCH_TIERS]
+
+# A tier is skipped for a page type once it has failed this often with this little success
+TIER_MIN_ATTEMPTS = int(os.environ.get('YAD2_TIER_MIN_ATTEMPTS', '5'))
+TIER_MIN_SUCCESS_RATE = float(os.environ.get('YAD2_TIER_MIN_SUCCESS_RATE', '0.3'))
+# Every Nth fetch of a page type starts from the cheapest tier again, so the policy can relearn
+TIER_REPROBE_EVERY = int(os.environ.get('YAD2_TIER_REPROBE_EVERY', '20'))
+
+# Only high/critical indicators count as a block; low ones (e.g. cf-ray) are normal
+BLOCKING_RISK_LEVELS = ('high', 'critical')
+
+
+@dataclass
+class FetchResult:
+    """A validated response and how it was obtained."""
+    text: str
+    content: bytes
+    status_code: int
+    headers: Dict[str, str]
+    tier: str
+    elapsed: float
+    attempts: List[str] = field(default_factory=list)
+
+
+def has_next_data(text: str) -> bool:
+    """Default validator: Yad2 pages are only usable with their __NEXT_DATA__ script."""
+    return '<script id="__NEXT_DATA__"' in text
+
+
+def _merge_tier_entry(stats: Dict[str, Dict[str, Dict[str, Any]]], page_type: str, tier: str,
+                      delta: Dict[str, Any]) -> None:
+    """Add one process's unsaved counts (delta) for a page type and tier onto stats."""
+    entry = stats.setdefault(page_type, {}).setdefault(tier, {
+        'attempts': 0, 'successes': 0, 'total_seconds': 0.0
+    })
+    for key in ('attempts', 'successes', 'total_seconds'):
+        entry[key] += delta[key]
+    if delta.get('last_used', '') > entry.get('last_used', ''):
+        entry['last_used'] = delta['last_used']
+
+
+class TierStats:
+    """Persistent per page type, per tier success statistics.
+
+    Every scraper and extractor process shares the stats file: save() adds this
+    process's counts since its last save onto the file's current contents under
+    an exclusive lock, so concurrent processes never overwrite each other's counts.
+    """
+
+    def __init__(self, stats_file: str):
+        self.stats_file = stats_file
+        self.stats: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # Counts recorded since the last save, merged into the file by save()
+        self._unsaved: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.fetch_counts: Dict[str, int] = {}
+        self._load()
+
+    def _read(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        try:
+            if os.path.exists(self.stats_file):
+                with open(self.stats_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not load tier stats {self.stats_file}: {e}")
+        return {}
+
+    def _load(self) -> None:
+        self.stats = self._read()
+
+    def save(self) -> None:
+        """Merge this process's new counts into the file and reload everyone's totals."""
+        if not self._unsaved:
+            return
+        try:
+            with open(f"{self.stats_file}.lock", 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    stats = self._read()
+                    for page_type, tiers in self._unsaved.items():
+                        for tier, delta in tiers.items():
+                            _merge_tier_entry(stats, page_type, tier, delta)
+                    # Written atomically so readers outside the lock never see half a file
+                    tmp_file = f"{self.stats_file}.{os.getpid()}.tmp"
+                    with open(tmp_file, 'w', encoding='utf-8') as f:
+                        json.dump(stats, f, ensure_ascii=False, indent=2)
+                    os.replace(tmp_file, self.stats_file)
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+            self.stats = stats
+            self._unsaved = {}
+        except Exception as e:
+            logger.warning(f"Could not save tier stats {self.stats_file}: {e}")
+
+    def record(self, page_type: str, tier: str, success: bool, elapsed: float) -> None:
+        delta = {'attempts': 1, 'successes': 1 if success else 0, 'total_seconds': elapsed,
+                 'last_used': datetime.now().isoformat()}
+        _merge_tier_entry(self.stats, page_type, tier, delta)
+        _merge_tier_entry(self._unsaved, page_type, tier, delta)
+
+    def is_viable(self, page_type: str, tier: str) -> bool:
+        """False once a tier has clearly not worked for this page type."""
+        entry = self.stats.get(page_type, {}).get(tier)
+        if not entry or entry['attempts'] < TIER_MIN_ATTEMPTS:
+            return True
+        return entry['successes'] / entry['attempts'] >= TIER_MIN_SUCCESS_RATE
+
+    def start_tier(self, page_type: str) -> int:
+        """Index of the cheapest tier still worth trying for this page type."""
+        count = self.fetch_counts.get(page_type, 0) + 1
+        self.fetch_counts[page_type] = count
+        if TIER_REPROBE_EVERY > 0 and count % TIER_REPROBE_EVERY == 0:
+            return 0
+        for index, name in enumerate(TIER_NAMES):
+            if self.is_viable(page_type, name):
+                return index
+        return len(TIER_NAMES) - 1
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Success rate and mean latency per page type and tier."""
+        return {
+            page_type: {
+                tier: {
+                    'attempts': entry['attempts'],
+                    'success_rate': round(entry['successes'] / entry['attempts'], 3) if entry['attempts'] else 0,
+                    'mean_seconds': round(entry['total_seconds'] / entry['attempts'], 2) if entry['attempts'] else None
+                }
+                for tier, entry in tiers.items()
+            }
+            for page_type, tiers in self.stats.items()
+        }
+
+
+class ZenRowsFetcher:
+    """Cheap-first ZenRows fetching with validation and escalation."""
+
+    def __init__(self, key_pool: Optional[ZenRowsKeyPool] = None, stats_file: Optional[str] = None, timeout: int = 60,
+                 ledger: Optional[FetchLedger] = None, controller: Optional[ConcurrencyController] = None):
+        self.key_pool = key_pool or get_key_pool()
+        self.ledger = ledger or get_fetch_ledger()
+        self.controller = controller or get_concurrency_controller()
+        self.timeout = timeout
+        self.detector = get_blocking_detector()
+        self.tier_stats = TierStats(stats_file or os.path.join(STATE_DIR, 'zenrows_tier_stats.json'))
+
+    def _assess(self, response: requests.Response, elapsed: float) -> Tuple[str, Optional[str], List[BlockingIndicator]]:
+        """Risk level and indicators of an unusable response, plus a reason if it is high/critical risk."""
+        indicators = self.detector.detect_blocking_indicators({
+            'status_code': response.status_code,
+            'headers': dict(response.headers),
+            # The detector only scans the title, body head and JSON error blocks, so
+            # words like "blocked" in a full page's scripts do not count
+            'text': response.text,
+            'response_time': elapsed
+        })
+        risk_level, _ = self.detector.get_overall_risk_level(indicators)
+        if risk_level in BLOCKING_RISK_LEVELS:
+            return risk_level, f"blocking risk {risk_level}: {', '.join(i.reason for i in indicators)}", indicators
+        return risk_level, None, indicators
+
+    def _record_outcome(self, response: requests.Response, elapsed: float,
+                        validate: Callable[[str], bool]) -> Optional[str]:
+        """Feed one tier's response to the concurrency controller; returns why it is unusable (None if usable).
+
+        Only upstream trouble counts as a failure: HTTP errors and high/critical blocking
+        risk. A clean 200 that just does not validate is the expected miss of a cheap
+        tier before escalating, so it is not recorded at all - counting it would push
+        the shared backoff up on every normal static -> premium escalation.
+        """
+        if response.status_code != 200:
+            risk_level, blocked, indicators = self._assess(response, elapsed)
+            reason = blocked or f"HTTP {response.status_code}"
+        elif not validate(response.text):
+            risk_level, blocked, indicators = self._assess(response, elapsed)
+            if not blocked:
+                return 'validation failed'
+            reason = blocked
+        else:
+            self.controller.record('none', True, latency=elapsed)
+            return None
+        self.controller.record(risk_level, False,
+                               {'status_code': response.status_code, 'message': reason, 'indicators': indicators},
+                               latency=elapsed)
+        return reason
+
+    def fetch(self, url: str, page_type: str = 'feed',
+              validate: Callable[[str], bool] = has_next_data,
+              extra_params: Optional[Dict[str, Any]] = None,
+              min_tier: str = 'static') -> Optional[FetchResult]:
+        """Fetch url starting at the cheapest viable tier, escalating until the response validates."""
+        start_index = max(self.tier_stats.start_tier(page_type), TIER_NAMES.index(min_tier))
+        attempts = []
+
+        for tier in FETCH_TIERS[start_index:]:
+            params = {'url': url}
+            params.update(tier['params'])
+            params.update(extra_params or {})
+            attempts.append(tier['name'])
+
+            request_start = time.time()
+            try:
+                with self.controller.slot(), self.key_pool.lease() as lease:
+                    request_start = time.time()
+                    params['apikey'] = lease.api_key
+                    response = requests.get(ZENROWS_API_URL, params=params, timeout=self.timeout)
+                    lease.report(response)
+            except Exception as e:
+                elapsed = time.time() - request_start
+                logger.warning(f"[{tier['name']}] Error fetching {url}: {e}")
+                self.tier_stats.record(page_type, tier['name'], False, elapsed)
+                self.ledger.record(page_type, params, None, elapsed)
+                self.controller.record_error(e)
+                continue
+            elapsed = time.time() - request_start
+            self.ledger.record(page_type, params, response, elapsed)
+
+            reason = self._record_outcome(response, elapsed, validate)
+            self.tier_stats.record(page_type, tier['name'], reason is None, elapsed)
+            if reason:
+                logger.info(f"[{tier['name']}] {page_type} fetch not usable ({reason}), escalating")
+                continue
+
+            self.tier_stats.save()
+            logger.info(f"Fetched {page_type} page via {tier['name']} tier in {elapsed:.1f}s (content length: {len(response.text)})")
+            return FetchResult(
+                text=response.text,
+                content=response.content,
+                status_code=response.status_code,
+                headers=dict(response.headers),
+                tier=tier['name'],
+                elapsed=elapsed,
+                attempts=attempts
+            )
+
+        self.tier_stats.save()
+        logger.error(f"All tiers failed for {url} (tried: {', '.join(attempts)})")
+        return None
+
+
+def _run_simulation() -> None:
+    """Deterministic checks of how tier outcomes reach the backoff (no network)."""
+    from types import SimpleNamespace
+
+    from adaptive_backoff import AdaptiveBackoff, BackoffLevel
+    from rate_limiter import TokenBucket
+
+    def response(status_code: int, text: str):
+        return SimpleNamespace(status_code=status_code, text=text, content=text.encode(), headers={})
+
+    def fetcher_with_local_backoff() -> ZenRowsFetcher:
+        fetcher = ZenRowsFetcher.__new__(ZenRowsFetcher)
+        backoff = AdaptiveBackoff()
+        fetcher.controller = ConcurrencyController(backoff=backoff, limiter=TokenBucket(100.0, 100, backoff))
+        fetcher.detector = get_blocking_detector()
+        return fetcher
+
+    page = '<html><script id="__NEXT_DATA__" type="application/json">{}</script></html>'
+    static_miss = '<html><body>' + 'x' * 2000 + '</body></html>'
+
+    # A normal static -> premium escalation, page after page, leaves the level at NORMAL
+    fetcher = fetcher_with_local_backoff()
+    for _ in range(50):
+        assert fetcher._record_outcome(response(200, static_miss), 0.5, has_next_data) == 'validation failed'
+        assert fetcher._record_outcome(response(200, page), 2.0, has_next_data) is None
+    assert fetcher.controller.backoff.current_level == BackoffLevel.NORMAL, fetcher.controller.backoff.current_level
+    assert fetcher.controller.backoff.window.get_stats()['failures'] == 0
+
+    # Real upstream failures still escalate
+    fetcher = fetcher_with_local_backoff()
+    for _ in range(3):
+        assert fetcher._record_outcome(response(503, 'Service Unavailable'), 1.0, has_next_data)
+    assert fetcher.controller.backoff.current_level.value >= BackoffLevel.SEVERE.value
+
+    # Two processes saving the same tier stats file add up instead of overwriting each other
+    with tempfile.TemporaryDirectory() as state_dir:
+        stats_file = os.path.join(state_dir, 'zenrows_tier_stats.json')
+        scraper, extractor = TierStats(stats_file), TierStats(stats_file)
+        scraper.record('feed', 'static', False, 0.5)
+        scraper.record('feed', 'premium', True, 2.0)
+        scraper.save()
+        extractor.record('feed', 'premium', True, 3.0)
+        extractor.save()
+        premium = TierStats(stats_file).stats['feed']['premium']
+        assert (premium['attempts'], premium['successes'], premium['total_seconds']) == (2, 2, 5.0), premium
+        assert extractor.stats['feed']['static']['attempts'] == 1
+
+    print("zenrows_fetcher simulation: all checks passed")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    _run_simulation()
@@ -0,0 +1,244 @@
+"""
+ZenRows Key Pool - מאגר מפתחות ZenRows עם איזון עומסים
+Spreads ZenRows requests over several API keys: per-key concurrency limits,
+remaining quota/concurrency read from response headers, least-loaded selection,
+and exhausted or throttled keys taken out of rotation for a cool-down.
+State is shared through a locked JSON file, so the bot, every scraper process
+and the phone extractor all see the same in-flight counts and cool-downs.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.environ.get('YAD2BOT_STATE_DIR', '/home/ubuntu/yad2bot_scraper/data')
+
+DEFAULT_KEY_CONCURRENCY = int(os.environ.get('ZENROWS_KEY_CONCURRENCY', '5'))
+THROTTLE_COOLDOWN_SECONDS = int(os.environ.get('ZENROWS_THROTTLE_COOLDOWN', '60'))
+EXHAUSTED_COOLDOWN_SECONDS = int(os.environ.get('ZENROWS_EXHAUSTED_COOLDOWN', '3600'))
+# Stop using a key while its reported remaining quota is below this
+MIN_REMAINING_QUOTA = int(os.environ.get('ZENROWS_MIN_REMAINING_QUOTA', '0'))
+
+# HTTP statuses ZenRows uses for "out of credits" and "slow down"
+EXHAUSTED_STATUSES = (402,)
+THROTTLED_STATUSES = (429,)
+# Header names (lower-case) carrying limits, checked in order
+CONCURRENCY_LIMIT_HEADERS = ('concurrency-limit', 'x-concurrency-limit')
+QUOTA_REMAINING_HEADERS = ('x-ratelimit-remaining', 'x-rate-limit-remaining', 'x-quota-remaining')
+REQUEST_COST_HEADERS = ('x-request-cost',)
+
+
+class NoKeyAvailable(Exception):
+    """No ZenRows key could be leased before the timeout."""
+
+
+class NoKeysConfigured(RuntimeError):
+    """Neither ZENROWS_API_KEYS nor ZENROWS_API_KEY is set."""
+
+
+def load_api_keys() -> List[str]:
+    """ZenRows keys from ZENROWS_API_KEYS (comma separated), else ZENROWS_API_KEY.
+
+    Raises NoKeysConfigured when neither is set; there is no built-in key.
+    """
+    keys = [key.strip() for key in os.environ.get('ZENROWS_API_KEYS', '').split(',') if key.strip()]
+    if not keys and os.environ.get('ZENROWS_API_KEY', '').strip():
+        keys = [os.environ['ZENROWS_API_KEY'].strip()]
+    if not keys:
+        raise NoKeysConfigured("No ZenRows API key configured: set ZENROWS_API_KEYS (comma separated) "
+                               "or ZENROWS_API_KEY")
+    return keys
+
+
+def key_id(api_key: str) -> str:
+    """Short fingerprint used in state and logs, so full keys never hit the disk."""
+    return hashlib.sha1(api_key.encode()).hexdigest()[:10]
+
+
+def _header(headers: Mapping[str, str], names) -> Optional[str]:
+    lowered = {k.lower(): v for k, v in headers.items()}
+    for name in names:
+        if name in lowered:
+            return lowered[name]
+    return None
+
+
+def _to_number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+class ZenRowsKeyPool:
+    """Least-loaded ZenRows key selection with shared, file-backed state."""
+
+    def __init__(self, api_keys: Optional[List[str]] = None, state_file: Optional[str] = None,
+                 concurrency: int = DEFAULT_KEY_CONCURRENCY):
+        self.api_keys = {key_id(key): key for key in (api_keys or load_api_keys())}
+        self.concurrency = concurrency
+        self.state_file = state_file or os.path.join(STATE_DIR, 'zenrows_key_pool.json')
+        self.lock_file = f"{self.state_file}.lock"
+        logger.info(f"ZenRows key pool: {len(self.api_keys)} keys, concurrency {concurrency} per key")
+
+    @contextmanager
+    def _locked_state(self) -> Iterator[Dict[str, Dict[str, Any]]]:
+        """Load, yield and save the shared state under an exclusive file lock."""
+        with open(self.lock_file, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                state = {}
+                if os.path.exists(self.state_file):
+                    try:
+                        with open(self.state_file, 'r', encoding='utf-8') as f:
+                            state = json.load(f)
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"Resetting unreadable key pool state {self.state_file}: {e}")
+                for kid in self.api_keys:
+                    entry = state.setdefault(kid, {})
+                    entry.setdefault('in_flight', {})
+                    entry.setdefault('requests', 0)
+                    entry.setdefault('credits', 0.0)
+                    # Leases of crashed processes would otherwise block the key forever
+                    entry['in_flight'] = {pid: n for pid, n in entry['in_flight'].items()
+                                          if n > 0 and _pid_alive(int(pid))}
+                yield state
+                tmp_file = f"{self.state_file}.{os.getpid()}.tmp"
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(state, f, indent=2)
+                os.replace(tmp_file, self.state_file)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _limit(self, entry: Dict[str, Any]) -> int:
+        reported = entry.get('concurrency_limit')
+        return min(self.concurrency, int(reported)) if reported else self.concurrency
+
+    def _available(self, entry: Dict[str, Any], now: float) -> bool:
+        if entry.get('cooldown_until', 0) > now:
+            return False
+        return sum(entry['in_flight'].values()) < self._limit(entry)
+
+    def acquire(self, timeout: float = 120.0) -> str:
+        """Lease the least-loaded available key, waiting up to timeout seconds."""
+        deadline = time.time() + timeout
+        pid = str(os.getpid())
+        while True:
+            now = time.time()
+            with self._locked_state() as state:
+                candidates = [kid for kid in self.api_keys if self._available(state[kid], now)]
+                if candidates:
+                    kid = min(candidates, key=lambda k: (
+                        sum(state[k]['in_flight'].values()) / self._limit(state[k]),
+                        state[k]['requests']
+                    ))
+                    in_flight = state[kid]['in_flight']
+                    in_flight[pid] = in_flight.get(pid, 0) + 1
+                    state[kid]['requests'] += 1
+                    return self.api_keys[kid]
+            if now >= deadline:
+                raise NoKeyAvailable(f"No ZenRows key available within {timeout:.0f}s")
+            time.sleep(0.5)
+
+    def release(self, api_key: str, status_code: Optional[int] = None,
+                headers: Optional[Mapping[str, str]] = None) -> None:
+        """Return a leased key and learn from the response status and headers."""
+        kid = key_id(api_key)
+        pid = str(os.getpid())
+        headers = headers or {}
+        with self._locked_state() as state:
+            entry = state[kid]
+            if entry['in_flight'].get(pid):
+                entry['in_flight'][pid] -= 1
+
+            limit = _to_number(_header(headers, CONCURRENCY_LIMIT_HEADERS))
+            if limit:
+                entry['concurrency_limit'] = int(limit)
+            remaining = _to_number(_header(headers, QUOTA_REMAINING_HEADERS))
+            if remaining is not None:
+                entry['quota_remaining'] = remaining
+            cost = _to_number(_header(headers, REQUEST_COST_HEADERS))
+            if cost:
+                entry['credits'] += cost
+
+            now = time.time()
+            if status_code in EXHAUSTED_STATUSES or (remaining is not None and remaining <= MIN_REMAINING_QUOTA):
+                entry['cooldown_until'] = now + EXHAUSTED_COOLDOWN_SECONDS
+                entry['cooldown_reason'] = 'quota exhausted'
+                logger.warning(f"ZenRows key {kid} out of quota, out of rotation for {EXHAUSTED_COOLDOWN_SECONDS}s")
+            elif status_code in THROTTLED_STATUSES:
+                retry_after = _to_number(_header(headers, ('retry-after',)))
+                cooldown = retry_after or THROTTLE_COOLDOWN_SECONDS
+                entry['cooldown_until'] = now + cooldown
+                entry['cooldown_reason'] = 'throttled'
+                logger.warning(f"ZenRows key {kid} throttled, out of rotation for {cooldown:.0f}s")
+            elif status_code and status_code < 400 and entry.get('cooldown_until', 0) <= now:
+                entry.pop('cooldown_until', None)
+                entry.pop('cooldown_reason', None)
+
+    @contextmanager
+    def lease(self, timeout: float = 120.0) -> Iterator['KeyLease']:
+        """with pool.lease() as lease: use lease.api_key, then lease.report(response)."""
+        lease = KeyLease(self.acquire(timeout))
+        try:
+            yield lease
+        finally:
+            self.release(lease.api_key, lease.status_code, lease.headers)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-key load, quota and cool-down, keyed by fingerprint."""
+        now = time.time()
+        with self._locked_state() as state:
+            return {
+                kid: {
+                    'in_flight': sum(state[kid]['in_flight'].values()),
+                    'limit': self._limit(state[kid]),
+                    'requests': state[kid]['requests'],
+                    'credits': state[kid]['credits'],
+                    'quota_remaining': state[kid].get('quota_remaining'),
+                    'cooling_down': state[kid].get('cooldown_until', 0) > now,
+                    'reason': state[kid].get('cooldown_reason', '')
+                }
+                for kid in self.api_keys
+            }
+
+
+class KeyLease:
+    """A leased key; report() the response so the pool can track quota and throttling."""
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.status_code: Optional[int] = None
+        self.headers: Dict[str, str] = {}
+
+    def report(self, response) -> None:
+        self.status_code = response.status_code
+        self.headers = dict(response.headers)
+
+
+_key_pool: Optional[ZenRowsKeyPool] = None
+
+
+def get_key_pool() -> ZenRowsKeyPool:
+    """Process-wide pool built from the configured keys."""
+    global _key_pool
+    if _key_pool is None:
+        _key_pool = ZenRowsKeyPool()
+    return _key_pool